@@ -0,0 +1,157 @@
+# artefactos.py
+#
+# Directorio acotado para los archivos que genera cada cotización (mapas PNG,
+# PDFs). Antes quedaban en /tmp para siempre; aquí se borran los menos usados
+# (LRU por mtime) cuando el total pasa ARTEFACTOS_MAX_MB.
+#
+# Los mapas se guardan por hash de su contenido lógico (origen, destino,
+# polyline, estilo, tamaño): un corredor repetido reutiliza la imagen.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+ARTEFACTOS_DIR = os.getenv("ARTEFACTOS_DIR", "/tmp/ecobus_artefactos")
+ARTEFACTOS_MAX_MB = float(os.getenv("ARTEFACTOS_MAX_MB", "500"))
+
+# Archivos más nuevos que esto no se borran (ej: PDF que se está enviando)
+ARTEFACTOS_MIN_EDAD_S = float(os.getenv("ARTEFACTOS_MIN_EDAD_S", "300"))
+
+
+def clave_contenido(*partes) -> str:
+    """
+    Hash estable de las partes (cualquier cosa serializable a JSON).
+    """
+    data = json.dumps(partes, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+class DirectorioArtefactos:
+    """
+    Archivos planos en un directorio. El total se lleva en memoria por proceso
+    y se recalcula escaneando el directorio al podar (varios workers escriben
+    en el mismo lugar).
+    """
+
+    def __init__(self, directorio: str = ARTEFACTOS_DIR, max_bytes: int = int(ARTEFACTOS_MAX_MB * 1024 * 1024),
+                 min_edad_s: float = ARTEFACTOS_MIN_EDAD_S):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.min_edad_s = min_edad_s
+        self._lock = threading.Lock()
+
+        self.reusados = {}    # tipo -> hits
+        self.generados = {}   # tipo -> misses
+        self.evictions = 0
+
+        os.makedirs(directorio, exist_ok=True)
+        self._bytes = self._escanear()[1]
+
+    def ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def _escanear(self):
+        archivos = []
+        total = 0
+        with os.scandir(self.directorio) as it:
+            for e in it:
+                if not e.is_file() or e.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                archivos.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        return archivos, total
+
+    def _contar(self, tabla: dict, tipo: str):
+        with self._lock:
+            tabla[tipo] = tabla.get(tipo, 0) + 1
+
+    def buscar(self, nombre: str, tipo: str = "otro") -> str | None:
+        """
+        Path del artefacto si ya existe (y lo marca como recién usado).
+        """
+        p = self.ruta(nombre)
+        try:
+            os.utime(p)
+        except FileNotFoundError:
+            return None
+        self._contar(self.reusados, tipo)
+        return p
+
+    def guardar(self, nombre: str, data: bytes, tipo: str = "otro") -> str:
+        """
+        Escribe el artefacto (atómico) y poda si hace falta. Retorna el path.
+        """
+        p = self.ruta(nombre)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, p)
+        self._contar(self.generados, tipo)
+        self._sumar(len(data), p)
+        return p
+
+    def registrar(self, path: str, tipo: str = "otro"):
+        """
+        Para archivos que escribió otro (ej: reportlab directo al path).
+        """
+        self._contar(self.generados, tipo)
+        self._sumar(os.path.getsize(path), path)
+
+    def _sumar(self, n: int, recien: str):
+        with self._lock:
+            self._bytes += n
+            if self._bytes > self.max_bytes:
+                self._podar(recien)
+
+    def _podar(self, recien: str):
+        """
+        Borra los más antiguos hasta bajar del 90% (nunca `recien`, que el
+        llamador todavía va a usar).
+        """
+        archivos, total = self._escanear()
+        objetivo = self.max_bytes * 0.9  # margen para no podar en cada escritura
+        limite_edad = time.time() - self.min_edad_s
+        archivos.sort()
+        for mtime, tam, p in archivos:
+            if total <= objetivo or mtime > limite_edad:
+                break
+            if p == recien:
+                continue
+            try:
+                os.remove(p)
+                total -= tam
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+        self._bytes = total
+
+    def stats(self) -> dict:
+        archivos, total = self._escanear()
+        with self._lock:
+            self._bytes = total
+            tipos = {}
+            for tipo in set(self.reusados) | set(self.generados):
+                r, g = self.reusados.get(tipo, 0), self.generados.get(tipo, 0)
+                tipos[tipo] = {
+                    "reusados": r,
+                    "generados": g,
+                    "tasa_reuso": round(r / (r + g), 4) if (r + g) else 0.0,
+                }
+            return {
+                "directorio": self.directorio,
+                "archivos": len(archivos),
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "tipos": tipos,
+            }
+
+
+ARTEFACTOS = DirectorioArtefactos()
@@ -0,0 +1,87 @@
+# benchmarks/bench_bytes_cotizacion.py
+#
+# Bytes por cotización (PDF, adjuntos y body JSON de Brevo con su base64):
+#
+#   antes:         ASCII85 + logo y mapa a resolución completa + PNG adjunto aparte
+#   ahora:         binario + logo/mapa reducidos a lo impreso y cuantizados
+#   ahora sin PNG: lo mismo con CORREO_ADJUNTAR_MAPA=0 (el mapa va solo en el PDF)
+#
+# Dos mapas: uno dibujado con map_image sobre tiles sintéticos (colores planos,
+# parecido a un mapa real) y uno con ruido (peor caso para el deflate).
+#
+#   python benchmarks/bench_bytes_cotizacion.py
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # logo_ecobus.png
+
+import map_image  # noqa: E402
+import pdf_generator  # noqa: E402
+from bench_mapa import RUTAS, ruta_sintetica, sembrar_sinteticos  # noqa: E402
+from bench_pdf_memoria import PAYLOAD, mapa_sintetico, usuario_de_prueba  # noqa: E402
+from correo import cuerpo_con_adjuntos  # noqa: E402
+from tiles import CacheTiles  # noqa: E402
+
+CAMINOS = (
+    # nombre, ascii85, optimizar imágenes, adjuntar PNG
+    ("antes", True, False, True),
+    ("ahora", False, True, True),
+    ("ahora sin PNG", False, True, False),
+)
+
+
+def mapa_tiles(tmp: str) -> bytes:
+    seed = os.path.join(tmp, "seed")
+    sembrar_sinteticos(seed, RUTAS)
+    map_image._tiles = CacheTiles(os.path.join(tmp, "cache"), seed_dir=seed)
+    origen, destino = RUTAS["Santiago -> Valparaíso"]
+    return map_image._render_local(origen, destino, ruta_sintetica(origen, destino))
+
+
+def configurar(ascii85: bool, optimizar: bool):
+    pdf_generator.PDF_ASCII85 = ascii85
+    pdf_generator.PDF_OPTIMIZAR_IMAGENES = optimizar
+    # El logo se vuelve a armar con esta configuración
+    pdf_generator._logo_cargado = False
+    pdf_generator._plantillas.clear()
+
+
+def medir(usuario: dict, png: bytes, adjuntar_png: bool, repeticiones: int = 5) -> tuple:
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.process_time()
+        pdf = pdf_generator.generar_pdf_bytes(usuario, png)
+        tiempos.append((time.process_time() - t0) * 1000)
+
+    adjuntos = [("cotizacion.pdf", pdf)]
+    if adjuntar_png:
+        adjuntos.append(("ruta.png", png))
+    body = len(cuerpo_con_adjuntos(PAYLOAD, adjuntos))
+    return len(pdf), sum(len(d) for _, d in adjuntos), body, statistics.median(tiempos)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        mapas = {"tiles": mapa_tiles(tmp), "ruido": mapa_sintetico()}
+        usuario = usuario_de_prueba("")
+
+        print(f"{'mapa':<6} {'camino':<14} {'PDF KB':>7} {'adjuntos KB':>12} {'body KB':>8} {'CPU ms':>7}")
+        for nombre_mapa, png in mapas.items():
+            base = None
+            for nombre, ascii85, optimizar, adjuntar_png in CAMINOS:
+                configurar(ascii85, optimizar)
+                pdf_generator.generar_pdf_bytes(usuario, png)  # calentar (plantilla)
+                pdf, adj, body, ms = medir(usuario, png, adjuntar_png)
+                base = base or body
+                print(f"{nombre_mapa:<6} {nombre:<14} {pdf / 1024:7.1f} {adj / 1024:12.1f} "
+                      f"{body / 1024:8.1f} {ms:7.1f}  ({body / base:.0%})")
+
+
+if __name__ == "__main__":
+    main()
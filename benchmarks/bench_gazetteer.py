@@ -0,0 +1,110 @@
+# benchmarks/bench_gazetteer.py
+#
+# Compara cargar N nombres como dict literal (módulo .py importado, como
+# lugares_conocidos.py) contra abrir el gazetteer con mmap. Cada caso corre en
+# un subproceso aparte para medir su RSS limpio.
+#
+#   python benchmarks/bench_gazetteer.py
+#
+# RssAnon es memoria privada del proceso (se repite en cada worker); RssFile
+# son páginas del archivo, que el page cache comparte entre todos los workers.
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+from gazetteer import construir  # noqa: E402
+
+
+CALLES = ["avenida", "calle", "pasaje", "camino", "villa", "poblacion", "condominio", "parque"]
+SILABAS = ["ma", "ri", "san", "to", "pe", "dro", "lu", "cia", "al", "me", "da", "fer", "nan",
+           "do", "que", "bra", "la", "gos", "vi", "lla", "ros", "te", "re", "sa", "jo", "se"]
+
+
+def nombres_sinteticos(n: int, seed: int = 3) -> list[tuple]:
+    rnd = random.Random(seed)
+    out = {}
+    while len(out) < n:
+        palabras = ["".join(rnd.choice(SILABAS) for _ in range(rnd.randint(2, 4))) for _ in range(rnd.randint(1, 3))]
+        nombre = " ".join([rnd.choice(CALLES)] + palabras)
+        out[nombre] = (-33.45 + rnd.uniform(-0.4, 0.4), -70.65 + rnd.uniform(-0.4, 0.4))
+    return [(k, lat, lon) for k, (lat, lon) in out.items()]
+
+
+SCRIPT_DICT = """
+import sys, time
+sys.path.insert(0, {dir!r})
+t0 = time.perf_counter()
+from lugares_sinteticos import LUGARES
+carga = time.perf_counter() - t0
+t0 = time.perf_counter()
+for q in {consultas!r}:
+    LUGARES.get(q)
+busqueda = (time.perf_counter() - t0) / {nq} * 1e6
+"""
+
+SCRIPT_GAZ = """
+import sys, time
+sys.path.insert(0, {raiz!r})
+import indice_lugares  # importado aparte: no es parte de la carga
+from gazetteer import Gazetteer
+t0 = time.perf_counter()
+gaz = Gazetteer({path!r})
+carga = time.perf_counter() - t0
+t0 = time.perf_counter()
+for q in {consultas!r}:
+    gaz.buscar(q)
+busqueda = (time.perf_counter() - t0) / {nq} * 1e6
+"""
+
+SCRIPT_FIN = """
+rss = {}
+for linea in open("/proc/self/status"):
+    k = linea.split(":")[0]
+    if k in ("VmRSS", "RssAnon", "RssFile"):
+        rss[k] = int(linea.split()[1]) // 1024
+print(carga * 1000, busqueda, rss.get("VmRSS", 0), rss.get("RssAnon", 0), rss.get("RssFile", 0))
+"""
+
+
+def correr(script: str) -> list[float]:
+    out = subprocess.run([sys.executable, "-c", script + SCRIPT_FIN], capture_output=True, text=True, check=True)
+    return [float(x) for x in out.stdout.split()]
+
+
+def main():
+    print(f"{'nombres':>8} {'modo':>6} {'carga ms':>9} {'busq us':>8} {'RSS MB':>7} {'anon MB':>8} {'file MB':>8}")
+    for n in (1000, 50000, 300000):
+        nombres = nombres_sinteticos(n)
+        consultas = [k for k, _, _ in random.Random(5).sample(nombres, 200)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "lugares_sinteticos.py"), "w", encoding="utf-8") as f:
+                f.write("LUGARES = {\n")
+                for k, lat, lon in nombres:
+                    f.write(f"    {k!r}: ({lat:.6f}, {lon:.6f}),\n")
+                f.write("}\n")
+
+            path = os.path.join(tmp, "gazetteer.bin")
+            construir(nombres, path)
+
+            # Primera importación compila a .pyc; se mide la segunda (caso normal)
+            script_dict = SCRIPT_DICT.format(dir=tmp, consultas=consultas, nq=len(consultas))
+            correr(script_dict)
+            filas = {
+                "dict": correr(script_dict),
+                "mmap": correr(SCRIPT_GAZ.format(raiz=RAIZ, path=path, consultas=consultas, nq=len(consultas))),
+            }
+
+            for modo, (carga, busq, rss, anon, archivo) in filas.items():
+                print(f"{n:>8} {modo:>6} {carga:9.1f} {busq:8.1f} {rss:7.0f} {anon:8.0f} {archivo:8.0f}")
+            print(f"{'':>8} archivo gazetteer: {os.path.getsize(path) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
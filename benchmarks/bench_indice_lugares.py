@@ -0,0 +1,146 @@
+# benchmarks/bench_indice_lugares.py
+#
+# Compara el match lineal original (maps._buscar_lugar_conocido tal como está
+# en el commit base del repo, leído con git show) contra IndiceLugares, con 10
+# a 50.000 lugares sintéticos. Los resultados tienen que ser idénticos
+# (lat, lon, clave y score); si no, termina con código 1.
+#
+#   python benchmarks/bench_indice_lugares.py
+#   MAPS_ORIGINAL_REV=<commit> python benchmarks/bench_indice_lugares.py
+
+import os
+import random
+import subprocess
+import sys
+import time
+import types
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+from indice_lugares import IndiceLugares  # noqa: E402
+
+
+TIPOS = ["colegio", "liceo", "escuela", "mall", "parque", "estadio", "centro de eventos",
+         "empresa", "hospital", "universidad", "club", "gimnasio", "terminal"]
+SILABAS = ["ma", "ri", "san", "to", "pe", "dro", "lu", "cia", "al", "me", "da", "fer",
+           "nan", "do", "que", "bra", "la", "gos", "vi", "lla", "ros", "te", "re", "sa",
+           "jo", "se", "an", "des", "pa", "ci", "fi", "co", "or", "ien", "ba", "que", "dano"]
+
+
+def vocabulario(n: int, rnd: random.Random) -> list[str]:
+    palabras = set()
+    while len(palabras) < n:
+        palabras.add("".join(rnd.choice(SILABAS) for _ in range(rnd.randint(2, 4))))
+    return sorted(palabras)
+
+
+def lugares_sinteticos(n: int, seed: int = 7) -> dict:
+    """
+    Nombres tipo "colegio san <palabra> <palabra>": pocos tipos muy comunes y
+    un vocabulario amplio con distribución Zipf, como los nombres reales.
+    """
+    rnd = random.Random(seed)
+    vocab = vocabulario(5000, rnd)
+    pesos = [1 / (i + 1) for i in range(len(vocab))]
+    out = {}
+    while len(out) < n:
+        palabras = rnd.choices(vocab, weights=pesos, k=rnd.randint(1, 3))
+        nombre = " ".join([rnd.choice(TIPOS)] + palabras)
+        nombre += f" {rnd.randint(1, 999)}" if rnd.random() < 0.3 else ""
+        out[nombre] = (-33.4 + rnd.uniform(-0.3, 0.3), -70.6 + rnd.uniform(-0.3, 0.3))
+    return out
+
+
+def cargar_original():
+    """
+    Módulo maps del commit base (MAPS_ORIGINAL_REV, por defecto el primero del
+    repo). Su _buscar_lugar_conocido recorre el LUGARES_CONOCIDOS del módulo.
+    """
+    rev = os.getenv("MAPS_ORIGINAL_REV") or subprocess.run(
+        ["git", "-C", RAIZ, "rev-list", "--max-parents=0", "HEAD"],
+        capture_output=True, text=True, check=True
+    ).stdout.split()[0]
+    fuente = subprocess.run(
+        ["git", "-C", RAIZ, "show", f"{rev}:maps.py"],
+        capture_output=True, text=True, check=True
+    ).stdout
+
+    mod = types.ModuleType("maps_original")
+    mod.__file__ = f"maps.py@{rev[:7]}"
+    exec(compile(fuente, mod.__file__, "exec"), mod.__dict__)
+    return mod
+
+
+def consultas(lugares: dict, n: int, seed: int = 11) -> list[str]:
+    """
+    Mezcla de consultas con typos, prefijos tipo "metro"/"el" y texto libre.
+    """
+    rnd = random.Random(seed)
+    claves = list(lugares)
+    out = []
+    for _ in range(n):
+        k = rnd.choice(claves)
+        r = rnd.random()
+        if r < 0.3:
+            i = rnd.randrange(len(k))
+            out.append(k[:i] + k[i + 1:])          # falta una letra
+        elif r < 0.6:
+            out.append(f"el {k} por favor")        # texto extra
+        elif r < 0.8:
+            out.append(" ".join(k.split()[:2]))     # parcial
+        elif r < 0.9:
+            out.append(rnd.choice(TIPOS) + " " + rnd.choice(SILABAS) + rnd.choice(SILABAS))
+        else:
+            # Signos, tildes y mayúsculas (el original deja espacios en los bordes)
+            out.append(rnd.choice(["¡", "", "("]) + k.title().replace("a", "á") + rnd.choice(["!", ".", ")", ""]))
+    out += ["", "!", "la", "a", "colegio", "lalalala lalala"]
+    return out
+
+
+def medir(fn, qs) -> float:
+    t0 = time.perf_counter()
+    for q in qs:
+        fn(q)
+    return (time.perf_counter() - t0) / len(qs) * 1e6
+
+
+def main():
+    original = cargar_original()
+    print(f"Original: {original.__file__}")
+    print(f"{'lugares':>8} {'indice us':>10} {'lineal us':>10} {'coincide':>9}")
+
+    errores = 0
+    for n in (10, 100, 1000, 10000, 50000):
+        lugares = lugares_sinteticos(n)
+        idx = IndiceLugares(lugares)
+        qs = consultas(lugares, 200)
+
+        t_idx = medir(idx.buscar, qs)
+
+        if n <= 10000:
+            original.LUGARES_CONOCIDOS = lugares
+            qs_lin = qs[:40] + qs[-6:] if n >= 10000 else qs
+            t_lin = medir(original._buscar_lugar_conocido, qs_lin)
+            distintos = [
+                (q, a, b) for q, a, b in
+                ((q, idx.buscar(q), original._buscar_lugar_conocido(q)) for q in qs_lin)
+                if a != b
+            ]
+            for q, a, b in distintos[:5]:
+                print(f"❌ {q!r}: índice {a} | original {b}")
+            errores += len(distintos)
+            coincide = f"{1 - len(distintos) / len(qs_lin):.0%}"
+            lineal = f"{t_lin:10.0f}"
+        else:
+            coincide = "-"
+            lineal = f"{'-':>10}"
+
+        print(f"{n:>8} {t_idx:10.0f} {lineal} {coincide:>9}")
+
+    print(f"{'✅' if not errores else '❌'} {errores} resultados distintos al original")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
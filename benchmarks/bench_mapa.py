@@ -0,0 +1,110 @@
+# benchmarks/bench_mapa.py
+#
+# Tiempo de render y tamaño del PNG: mapa local (Pillow + tiles en cache)
+# contra Mapbox Static Images. Los tiles locales se siembran sintéticos en un
+# directorio temporal, así el caso local corre sin red. El remoto solo se mide
+# si hay MAPBOX_TOKEN.
+#
+#   python benchmarks/bench_mapa.py
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import map_image  # noqa: E402
+from polyline import encode  # noqa: E402
+from tiles import CacheTiles, TILE_PX, lonlat_a_pixel  # noqa: E402
+
+
+RUTAS = {
+    "Peñaflor -> Maipú": ((-33.6169, -70.8764), (-33.5095, -70.7576)),
+    "Santiago -> Valparaíso": ((-33.4489, -70.6693), (-33.0360, -71.6270)),
+    "Talagante -> Aeropuerto": ((-33.6669, -70.9304), (-33.3929, -70.7858)),
+}
+
+
+def ruta_sintetica(origen, destino, n: int = 2000, seed: int = 1) -> str:
+    rnd = random.Random(seed)
+    puntos = []
+    for i in range(n):
+        t = i / (n - 1)
+        puntos.append((
+            origen[0] + (destino[0] - origen[0]) * t + rnd.uniform(-3e-4, 3e-4),
+            origen[1] + (destino[1] - origen[1]) * t + rnd.uniform(-3e-4, 3e-4),
+        ))
+    return encode(puntos)
+
+
+def sembrar_sinteticos(directorio: str, rutas: dict, zooms=range(6, 17)):
+    """
+    Tiles PNG con calles falsas, solo en las cajas de las rutas.
+    """
+    rnd = random.Random(3)
+    n = 0
+    for origen, destino in rutas.values():
+        lat_min, lat_max = sorted((origen[0], destino[0]))
+        lon_min, lon_max = sorted((origen[1], destino[1]))
+        for z in zooms:
+            x0, y0 = (int(v // TILE_PX) - 2 for v in lonlat_a_pixel(lat_max, lon_min, z))
+            x1, y1 = (int(v // TILE_PX) + 2 for v in lonlat_a_pixel(lat_min, lon_max, z))
+            if (x1 - x0) * (y1 - y0) > 400:
+                continue
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    p = os.path.join(directorio, str(z), str(x), f"{y}.png")
+                    if os.path.exists(p):
+                        continue
+                    os.makedirs(os.path.dirname(p), exist_ok=True)
+                    img = Image.new("RGB", (TILE_PX, TILE_PX), (242, 239, 233))
+                    d = ImageDraw.Draw(img)
+                    for _ in range(12):
+                        d.line([(rnd.randrange(256), rnd.randrange(256)) for _ in range(2)],
+                               fill=(255, 255, 255), width=rnd.choice((2, 3, 5)))
+                    img.save(p, "PNG")
+                    n += 1
+    return n
+
+
+def medir(fn, repeticiones: int) -> tuple:
+    tiempos, tam = [], 0
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        png = fn()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        tam = len(png)
+    return statistics.median(tiempos), tam
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        seed = os.path.join(tmp, "seed")
+        n = sembrar_sinteticos(seed, RUTAS)
+        print(f"Tiles sintéticos sembrados: {n}\n")
+
+        map_image._tiles = CacheTiles(os.path.join(tmp, "cache"), seed_dir=seed)
+
+        print(f"{'ruta':<26} {'modo':>7} {'ms (p50)':>9} {'KB':>7}")
+        for nombre, (origen, destino) in RUTAS.items():
+            poly = ruta_sintetica(origen, destino)
+
+            ms, tam = medir(lambda: map_image._render_local(origen, destino, poly), 10)
+            print(f"{nombre:<26} {'local':>7} {ms:9.1f} {tam / 1024:7.1f}")
+
+            if map_image.MAPBOX_TOKEN:
+                ms, tam = medir(lambda: map_image._render_remoto(origen, destino, poly), 3)
+                print(f"{nombre:<26} {'remoto':>7} {ms:9.1f} {tam / 1024:7.1f}")
+
+        if not map_image.MAPBOX_TOKEN:
+            print("\n(sin MAPBOX_TOKEN: no se mide el modo remoto)")
+        print("tiles:", map_image.tiles_stats())
+
+
+if __name__ == "__main__":
+    main()
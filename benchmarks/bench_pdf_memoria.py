@@ -0,0 +1,122 @@
+# benchmarks/bench_pdf_memoria.py
+#
+# Pico de memoria (tracemalloc) y tiempo por cotización, desde el mapa ya
+# generado hasta el body del correo listo para enviar:
+#
+#   antes: PDF a /tmp -> releer -> base64 str; PNG releído -> base64 str;
+#          requests serializa json=payload (otra copia completa)
+#   ahora: PDF en memoria (bytes) + mapa en memoria; base64 por trozos
+#          mientras se recorre el body (aquí se recorre sin enviar)
+#
+#   python benchmarks/bench_pdf_memoria.py
+
+import base64
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # logo_ecobus.png
+
+from PIL import Image  # noqa: E402
+
+from correo import cuerpo_con_adjuntos  # noqa: E402
+from pdf_generator import generar_pdf_bytes  # noqa: E402
+
+
+def mapa_sintetico() -> bytes:
+    rnd = random.Random(1)
+    img = Image.new("RGB", (900, 500), (242, 239, 233))
+    px = img.load()
+    for _ in range(60000):
+        px[rnd.randrange(900), rnd.randrange(500)] = (rnd.randrange(256), 200, 180)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def usuario_de_prueba(mapa_path: str) -> dict:
+    return {
+        "cotizacion_id": "BENCH01", "Nombre": "Colegio San José", "Correo": "a@b.cl",
+        "Telefono": "+56911111111", "Fecha Viaje": "25-12-2026", "Pasajeros": 120,
+        "Origen": "Peñaflor", "Destino": "Viña del Mar", "Hora Ida": "08:00", "Hora Regreso": "18:00",
+        "Vehiculo": "Bus", "Detalle Vehiculos": ["2 x Bus (45)", "1 x Van (30)"],
+        "Precio": "1.234.567", "Mapa Ruta": mapa_path,
+    }
+
+
+PAYLOAD = {
+    "sender": {"name": "Ecobus", "email": "x@ecobus.cl"},
+    "to": [{"email": "a@b.cl"}],
+    "subject": "Cotización Ecobus - Transporte Privado",
+    "textContent": "Hola",
+}
+
+
+def camino_antes(usuario: dict, tmp: str, pdf: bytes | None = None) -> int:
+    pdf_path = os.path.join(tmp, "cotizacion.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(pdf if pdf is not None else generar_pdf_bytes(usuario))
+
+    with open(pdf_path, "rb") as f:
+        pdf_base64 = base64.b64encode(f.read()).decode("utf-8")
+    payload = dict(PAYLOAD, attachment=[{"content": pdf_base64, "name": "cotizacion.pdf"}])
+
+    with open(usuario["Mapa Ruta"], "rb") as f:
+        mapa_base64 = base64.b64encode(f.read()).decode("utf-8")
+    payload["attachment"].append({"content": mapa_base64, "name": "ruta.png"})
+
+    # Lo que hace requests con json=payload
+    body = json.dumps(payload).encode("utf-8")
+    return len(body)
+
+
+def camino_ahora(usuario: dict, mapa_png: bytes, pdf: bytes | None = None) -> int:
+    if pdf is None:
+        pdf = generar_pdf_bytes(usuario, mapa_png)
+    cuerpo = cuerpo_con_adjuntos(PAYLOAD, [("cotizacion.pdf", pdf), ("ruta.png", mapa_png)])
+    # urllib3 recorre el body trozo a trozo al enviarlo
+    return sum(len(t) for t in cuerpo)
+
+
+def medir(fn, *args, repeticiones: int = 5) -> tuple:
+    fn(*args)  # calentar (fuentes, imports de reportlab)
+    picos, tiempos = [], []
+    for _ in range(repeticiones):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        n = fn(*args)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        picos.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(picos), sorted(tiempos)[len(tiempos) // 2], n
+
+
+def main():
+    png = mapa_sintetico()
+    with tempfile.TemporaryDirectory() as tmp:
+        mapa_path = os.path.join(tmp, "mapa.png")
+        with open(mapa_path, "wb") as f:
+            f.write(png)
+        usuario = usuario_de_prueba(mapa_path)
+
+        pdf = generar_pdf_bytes(usuario, png)
+        print(f"mapa: {len(png) / 1024:.0f} KB | pdf: {len(pdf) / 1024:.0f} KB\n")
+
+        # Con el PDF ya renderizado se ve solo el costo de disco + copias base64/JSON;
+        # el render de reportlab pesa igual en ambos caminos
+        print(f"{'etapa':<14} {'camino':<8} {'pico KB':>9} {'ms':>7} {'body KB':>8}")
+        for etapa, pdf_fijo in (("pdf+adjuntos", None), ("solo adjuntos", pdf)):
+            for nombre, fn, args in (("antes", camino_antes, (usuario, tmp, pdf_fijo)),
+                                     ("ahora", camino_ahora, (usuario, png, pdf_fijo))):
+                pico, ms, n = medir(fn, *args)
+                print(f"{etapa:<14} {nombre:<8} {pico / 1024:9.0f} {ms:7.1f} {n / 1024:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
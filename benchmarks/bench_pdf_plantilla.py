@@ -0,0 +1,280 @@
+# benchmarks/bench_pdf_plantilla.py
+#
+# CPU por PDF y bytes de salida, con y sin la plantilla fija:
+#
+#   antes (PDF_PLANTILLA=0): cada cotización comprime el logo (decodificado y
+#                            optimizado una vez por proceso) y redibuja título y pie
+#   ahora (PDF_PLANTILLA=1): logo y textos fijos armados una vez por proceso;
+#                            cada PDF solo registra el form y dibuja los datos variables
+#
+# Antes de medir verifica que los dos caminos den la misma página: mismos
+# textos (fuente, tamaño, posición) y mismas imágenes (píxeles, máscara,
+# posición), siguiendo los form XObjects. La plantilla usa internos de
+# reportlab (versión fijada en requirements.txt); si una versión nueva los
+# cambia, esto falla con código 1. También verifica que, si esos internos
+# fallan, el PDF salga igual por el dibujo directo.
+#
+#   python benchmarks/bench_pdf_plantilla.py [n]
+
+import base64
+import hashlib
+import io
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import zlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # logo_ecobus.png
+
+from PIL import Image  # noqa: E402
+
+import pdf_generator  # noqa: E402
+
+
+def mapa_sintetico() -> bytes:
+    rnd = random.Random(1)
+    img = Image.new("RGB", (900, 500), (242, 239, 233))
+    px = img.load()
+    for _ in range(60000):
+        px[rnd.randrange(900), rnd.randrange(500)] = (rnd.randrange(256), 200, 180)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def usuario_de_prueba(i: int) -> dict:
+    return {
+        "cotizacion_id": f"BENCH{i:04d}", "Nombre": "Colegio San José", "Correo": "a@b.cl",
+        "Telefono": "+56911111111", "Fecha Viaje": "25-12-2026", "Pasajeros": 120,
+        "Origen": "Peñaflor", "Destino": "Viña del Mar", "Hora Ida": "08:00", "Hora Regreso": "18:00",
+        "Vehiculo": "Bus", "Detalle Vehiculos": ["2 x Bus (45)", "1 x Van (30)"],
+        "Precio": "1.234.567", "Mapa Ruta": "",
+    }
+
+
+# -------- Lectura mínima del PDF (lo que escribe reportlab) --------
+_OBJ = re.compile(rb"(\d+) 0 obj\r?\n")
+_TOKEN = re.compile(rb"\((?:\\.|[^\\)])*\)|/[^\s/\[\]()<>]+|[-+]?(?:\d+\.?\d*|\.\d+)|[A-Za-z*'\"]+|\[|\]")
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+
+def objetos(pdf: bytes) -> dict:
+    """
+    n -> (diccionario, stream decodificado o None).
+    """
+    out = {}
+    pos = 0
+    while True:
+        m = _OBJ.search(pdf, pos)
+        if not m:
+            return out
+        ini = m.end()
+        fin = pdf.index(b"endobj", ini)
+        k = pdf.find(b"stream", ini, fin)
+        if k < 0:
+            out[int(m.group(1))] = (pdf[ini:fin], None)
+            pos = fin
+            continue
+
+        dic = pdf[ini:k]
+        datos_ini = k + len(b"stream") + (2 if pdf[k + 6:k + 8] == b"\r\n" else 1)
+        largo = int(re.search(rb"/Length (\d+)", dic).group(1))
+        datos = pdf[datos_ini:datos_ini + largo]
+        for filtro in re.findall(rb"/(ASCII85Decode|FlateDecode)", dic):
+            if filtro == b"ASCII85Decode":
+                datos = base64.a85decode(datos.strip().removesuffix(b"~>"))
+            else:
+                datos = zlib.decompress(datos)
+        out[int(m.group(1))] = (dic, datos)
+        pos = pdf.index(b"endstream", datos_ini + largo)
+
+
+def _texto(token: bytes) -> bytes:
+    return re.sub(rb"\\([0-7]{1,3}|.)", lambda m: (
+        bytes([int(m.group(1), 8)]) if m.group(1)[:1].isdigit() else _ESCAPES.get(m.group(1), m.group(1))
+    ), token[1:-1])
+
+
+def _por(a: tuple, b: tuple) -> tuple:
+    """Producto de matrices PDF [a b c d e f]: a aplicada primero."""
+    return (
+        a[0] * b[0] + a[1] * b[2], a[0] * b[1] + a[1] * b[3],
+        a[2] * b[0] + a[3] * b[2], a[2] * b[1] + a[3] * b[3],
+        a[4] * b[0] + a[5] * b[2] + b[4], a[4] * b[1] + a[5] * b[3] + b[5],
+    )
+
+
+def _recursos(objs: dict, dic: bytes) -> tuple:
+    """(fuentes /F1 -> BaseFont, xobjects nombre -> n) de un diccionario con /Resources."""
+    fuentes = {}
+    m = re.search(rb"/Font (\d+) 0 R", dic)
+    if m:
+        for nombre, n in re.findall(rb"/(\S+) (\d+) 0 R", objs[int(m.group(1))][0]):
+            fuentes[nombre] = re.search(rb"/BaseFont /(\S+)", objs[int(n)][0]).group(1)
+    xobjects = {}
+    m = re.search(rb"/XObject <<(.*?)>>", dic, re.S)
+    if m:
+        xobjects = {nombre: int(n) for nombre, n in re.findall(rb"/(\S+) (\d+) 0 R", m.group(1))}
+    return fuentes, xobjects
+
+
+def _imagen(objs: dict, n: int) -> tuple:
+    dic, datos = objs[n]
+    campos = tuple(re.search(rb"/" + k + rb" (/?\w+)", dic).group(1) for k in
+                   (b"Width", b"Height", b"BitsPerComponent", b"ColorSpace"))
+    m = re.search(rb"/SMask (\d+) 0 R", dic)
+    return campos + (hashlib.sha1(datos).hexdigest(), _imagen(objs, int(m.group(1))) if m else None)
+
+
+def _ejecutar(objs: dict, contenido: bytes, dic: bytes, ctm: tuple, salida: list):
+    """
+    Recorre los operadores de un stream (y de los forms que dibuja) y anota
+    ("texto", fuente, tamaño, x, y, texto) e ("imagen", matriz, imagen).
+    """
+    fuentes, xobjects = _recursos(objs, dic)
+    pila, args = [], []
+    fuente, tm = None, None
+    for token in _TOKEN.findall(contenido):
+        if token[:1] in b"(/[]" or token[:1].isdigit() or token[:1] in b"-+.":
+            args.append(token)
+            continue
+        op = token
+        if op == b"q":
+            pila.append(ctm)
+        elif op == b"Q":
+            ctm = pila.pop()
+        elif op == b"cm":
+            ctm = _por(tuple(float(a) for a in args[-6:]), ctm)
+        elif op == b"Tf":
+            fuente = (fuentes[args[-2][1:]], float(args[-1]))
+        elif op == b"Tm":
+            tm = tuple(float(a) for a in args[-6:])
+        elif op == b"Tj":
+            x, y = _por(tm, ctm)[4:]
+            salida.append(("texto", fuente, round(x, 3), round(y, 3), _texto(args[-1])))
+        elif op == b"Do":
+            n = xobjects[args[-1][1:]]
+            dic_x, datos = objs[n]
+            if b"/Subtype /Form" in dic_x:
+                matriz = re.search(rb"/Matrix \[([^\]]*)\]", dic_x)
+                m = tuple(float(a) for a in matriz.group(1).split()) if matriz else (1, 0, 0, 1, 0, 0)
+                _ejecutar(objs, datos, dic_x, _por(m, ctm), salida)
+            else:
+                salida.append(("imagen", tuple(round(v, 3) for v in ctm), _imagen(objs, n)))
+        args = []
+
+
+def pagina(pdf: bytes) -> list:
+    """
+    Lo que se dibuja en la (única) página, en orden.
+    """
+    objs = objetos(pdf)
+    dic = next(d for d, _ in objs.values() if re.search(rb"/Type /Page\b(?!s)", d))
+    contenido = objs[int(re.search(rb"/Contents (\d+) 0 R", dic).group(1))][1]
+    salida = []
+    _ejecutar(objs, contenido, dic, (1, 0, 0, 1, 0, 0), salida)
+    return salida
+
+
+class _AhoraFijo(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(2026, 1, 1, 12, 0)
+
+
+def verificar(mapa: bytes | None) -> int:
+    """
+    Diferencias entre la página con y sin plantilla (0 = iguales).
+    """
+    ahora = pdf_generator.datetime
+    pdf_generator.datetime = _AhoraFijo  # "Fecha emisión" igual en los dos
+    try:
+        paginas = {}
+        for plantilla in (False, True):
+            pdf_generator.PDF_PLANTILLA = plantilla
+            paginas[plantilla] = pagina(pdf_generator.generar_pdf_bytes(usuario_de_prueba(0), mapa))
+    finally:
+        pdf_generator.datetime = ahora
+
+    sin, con = paginas[False], paginas[True]
+    diferencias = sum(a != b for a, b in zip(sin, con)) + abs(len(sin) - len(con))
+    for a, b in [(a, b) for a, b in zip(sin, con) if a != b][:3]:
+        print(f"   sin plantilla: {a}\n   con plantilla: {b}")
+    if not any(d[0] == "imagen" for d in sin):
+        diferencias += 1
+        print("   sin imágenes: no se está comparando el logo")
+    return diferencias
+
+
+def verificar_respaldo(mapa: bytes | None) -> int:
+    """
+    Simula un interno de reportlab que ya no existe: la plantilla debe
+    avisar y la página salir igual que dibujada directo.
+    """
+    original = pdf_generator._Plantilla._registrar_logo
+
+    def roto(self, c):
+        raise AttributeError("'PDFImageXObject' object has no attribute '_smask'")
+
+    ahora = pdf_generator.datetime
+    pdf_generator.datetime = _AhoraFijo
+    try:
+        pdf_generator.PDF_PLANTILLA = False
+        sin = pagina(pdf_generator.generar_pdf_bytes(usuario_de_prueba(0), mapa))
+        pdf_generator.PDF_PLANTILLA = True
+        pdf_generator._Plantilla._registrar_logo = roto
+        con = pagina(pdf_generator.generar_pdf_bytes(usuario_de_prueba(0), mapa))
+        rota = pdf_generator._plantilla_rota
+    finally:
+        pdf_generator._Plantilla._registrar_logo = original
+        pdf_generator._plantilla_rota = False
+        pdf_generator.datetime = ahora
+    return sum(a != b for a, b in zip(sin, con)) + abs(len(sin) - len(con)) + (not rota)
+
+
+def medir(plantilla: bool, mapa: bytes | None, n: int) -> tuple:
+    pdf_generator.PDF_PLANTILLA = plantilla
+    pdf_generator.generar_pdf_bytes(usuario_de_prueba(0), mapa)  # calentar (fuentes, plantilla)
+    tiempos, tam = [], 0
+    for i in range(n):
+        t0 = time.process_time()
+        pdf = pdf_generator.generar_pdf_bytes(usuario_de_prueba(i), mapa)
+        tiempos.append((time.process_time() - t0) * 1000)
+        tam = len(pdf)
+    return statistics.median(tiempos), tam
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    png = mapa_sintetico()
+
+    errores = 0
+    for caso, mapa in (("sin mapa", None), ("con mapa", png)):
+        diferencias = verificar(mapa)
+        errores += diferencias
+        print(f"{'✅' if not diferencias else '❌'} {caso}: misma página con y sin plantilla"
+              f"{'' if not diferencias else f' ({diferencias} diferencias)'}")
+    diferencias = verificar_respaldo(png)
+    errores += diferencias
+    print(f"{'✅' if not diferencias else '❌'} internos rotos: se dibuja directo y sale igual")
+    if errores:
+        return 1
+
+    print(f"{'caso':<10} {'camino':<8} {'CPU ms (p50)':>13} {'KB':>8}")
+    for caso, mapa in (("sin mapa", None), ("con mapa", png)):
+        base = None
+        for nombre, plantilla in (("antes", False), ("ahora", True)):
+            ms, tam = medir(plantilla, mapa, n)
+            extra = f"  x{base / ms:.1f}" if base else ""
+            base = base or ms
+            print(f"{caso:<10} {nombre:<8} {ms:13.1f} {tam / 1024:8.1f}{extra}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
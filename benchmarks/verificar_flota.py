@@ -0,0 +1,141 @@
+# benchmarks/verificar_flota.py
+#
+# Compara pricing_engine.resolver_flota contra fuerza bruta:
+#   - todas las cantidades de pasajeros de la tabla (1..FLOTA_TABLA_MAX)
+#   - una muestra sobre la tabla (regla de agregar buses)
+#   - una muestra con límites de disponibilidad
+#
+# Se compara la clave (costo, n° vehículos, asientos): con empates puede haber
+# más de una flota óptima. También verifica que calcular_precio_usuario cobre
+# la flota más barata para toda cantidad de pasajeros.
+#
+# Cada prueba es una función test_* con assert; sale con código 1 si alguna
+# falla. También corre con pytest:
+#
+#   python benchmarks/verificar_flota.py
+#   python -m pytest benchmarks/verificar_flota.py
+
+import itertools
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pricing_engine  # noqa: E402
+from pricing_engine import CAPACIDADES, FLOTA_TABLA_MAX  # noqa: E402
+
+
+COSTOS = pricing_engine._costos_vehiculo()
+TIPOS = sorted(CAPACIDADES, key=lambda v: -CAPACIDADES[v])
+
+
+def clave(conteo: dict) -> tuple:
+    return (
+        sum(COSTOS[v] * n for v, n in conteo.items()),
+        sum(conteo.values()),
+        sum(CAPACIDADES[v] * n for v, n in conteo.items()),
+    )
+
+
+def fuerza_bruta(pasajeros: int, disponibles: dict | None = None) -> tuple | None:
+    """
+    (clave, conteo) de la mejor flota probando todas las combinaciones de los
+    tipos chicos; el más grande completa lo que falta (con más unidades del
+    grande solo sube el costo).
+    """
+    disponibles = disponibles or {}
+    mayor, chicos = TIPOS[0], TIPOS[1:]
+    rangos = [
+        range(min(disponibles.get(v, math.inf), math.ceil(pasajeros / CAPACIDADES[v])) + 1)
+        for v in chicos
+    ]
+    mejor = None
+    for cantidades in itertools.product(*rangos):
+        conteo = dict(zip(chicos, cantidades))
+        resto = pasajeros - sum(CAPACIDADES[v] * n for v, n in conteo.items())
+        conteo[mayor] = max(0, math.ceil(resto / CAPACIDADES[mayor]))
+        if conteo[mayor] > disponibles.get(mayor, math.inf):
+            continue
+        k = clave(conteo)
+        if mejor is None or k < mejor[0]:
+            mejor = (k, conteo)
+    return mejor
+
+
+def revisar(casos):
+    """
+    Compara el solver con la fuerza bruta; falla con los primeros casos distintos.
+    """
+    errores = []
+    for pasajeros, disponibles in casos:
+        esperado = fuerza_bruta(pasajeros, disponibles)
+        try:
+            obtenido = clave(pricing_engine.resolver_flota(pasajeros, disponibles))
+        except Exception:
+            obtenido = None
+        if obtenido != (esperado and esperado[0]):
+            errores.append(f"{pasajeros} pax {disponibles}: solver {obtenido} | fuerza bruta {esperado}")
+    assert not errores, f"{len(errores)} de {len(casos)} casos distintos:\n" + "\n".join(errores[:5])
+
+
+def test_tabla():
+    revisar([(n, None) for n in range(1, FLOTA_TABLA_MAX + 1)])
+
+
+def test_sobre_la_tabla():
+    rnd = random.Random(7)
+    revisar([(rnd.randint(FLOTA_TABLA_MAX + 1, 3 * FLOTA_TABLA_MAX), None) for _ in range(30)])
+
+
+def test_con_limites():
+    rnd = random.Random(11)
+    revisar([
+        (rnd.randint(1, 400), {v: rnd.randint(0, 6) for v in TIPOS if rnd.random() < 0.7})
+        for _ in range(300)
+    ])
+
+
+def test_precio_usuario():
+    """
+    El precio que ve el cliente es el de la flota más barata para toda
+    cantidad de pasajeros (también las que caben en un solo vehículo).
+    """
+    errores = []
+    for km in (40.0, 250.0):
+        precio_vehiculo = {v: round(pricing_engine._calcular_precio_base_km(km, v, 12.5)) for v in TIPOS}
+        for n in range(1, 4 * CAPACIDADES[TIPOS[0]] + 1):
+            _, conteo = fuerza_bruta(n)
+            esperado = sum(precio_vehiculo[v] * c for v, c in conteo.items())
+            obtenido = pricing_engine.calcular_precio_usuario(n, km, 0.0, 12.5)["Precio"]
+            if obtenido != esperado:
+                errores.append(f"{n} pax {km} km: {obtenido} | flota más barata {esperado} {conteo}")
+    assert not errores, f"{len(errores)} precios distintos:\n" + "\n".join(errores[:5])
+
+
+PRUEBAS = (test_tabla, test_sobre_la_tabla, test_con_limites, test_precio_usuario)
+
+
+def main():
+    fallas = 0
+    for prueba in PRUEBAS:
+        t0 = time.perf_counter()
+        try:
+            prueba()
+            print(f"✅ {prueba.__name__} ({time.perf_counter() - t0:.1f} s)")
+        except AssertionError as e:
+            fallas += 1
+            print(f"❌ {prueba.__name__}: {e}")
+
+    t0 = time.perf_counter()
+    for n in range(1, FLOTA_TABLA_MAX + 1):
+        pricing_engine.resolver_flota(n)
+    print(f"resolver_flota sin límites: {(time.perf_counter() - t0) / FLOTA_TABLA_MAX * 1e6:.1f} µs por consulta")
+
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
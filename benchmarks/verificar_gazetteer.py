@@ -0,0 +1,68 @@
+# benchmarks/verificar_gazetteer.py
+#
+# maps._buscar_gazetteer con nombres repetidos y texto después de una coma:
+# - un nombre con varias filas (la misma calle en Maipú y en Puente Alto) es
+#   un miss: sigue a Mapbox y a los candidatos que el usuario confirma
+# - la comuna después de la coma elige entre esas filas
+# - el reintento con lo anterior a la coma solo vale si es una comuna o un
+#   lugar conocido, o si el hit cae en la comuna nombrada después
+#
+#   python benchmarks/verificar_gazetteer.py
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import gazetteer  # noqa: E402
+
+
+MAIPU = (-33.515, -70.765)
+PUENTE_ALTO = (-33.612, -70.578)
+PROVIDENCIA = (-33.4314, -70.6093)
+
+CASOS = [
+    ("los aromos", None),
+    ("Los Aromos, Maipú", MAIPU),
+    ("Los Aromos, Maipu, Santiago", MAIPU),
+    ("Los Aromos, Puente Alto", PUENTE_ALTO),
+    ("Los Aromos, Providencia", None),
+    ("Los Aromos, depto 4", None),
+    ("los lirios", MAIPU),
+    ("Los Lirios, Puente Alto", None),
+    ("Providencia, Santiago", PROVIDENCIA),
+    ("Plaza de Armas, Puente Alto", None),
+]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "gazetteer.bin")
+        gazetteer.construir([
+            ("los aromos", *MAIPU),
+            ("Los Aromos", *PUENTE_ALTO),
+            ("los lirios", *MAIPU),
+            ("los lirios", MAIPU[0] + 0.002, MAIPU[1]),  # otro tramo, misma calle
+            ("providencia", *PROVIDENCIA),               # comuna
+            ("plaza de armas", -33.4378, -70.6504),
+        ], path)
+
+        import maps
+        maps.GAZETTEER_PATH = path
+
+        errores = 0
+        for texto, esperado in CASOS:
+            hit = maps._buscar_gazetteer(texto)
+            ok = hit == (None if esperado is None else tuple(round(c, gazetteer.DECIMALES) for c in esperado))
+            errores += not ok
+            print(f"{'✅' if ok else '❌'} {texto!r} -> {hit}")
+
+        if maps._gazetteer is not None:
+            maps._gazetteer.cerrar()
+
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
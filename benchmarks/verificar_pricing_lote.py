@@ -0,0 +1,89 @@
+# benchmarks/verificar_pricing_lote.py
+#
+# pricing_lote.calcular_precios_lote contra el camino escalar del bot
+# (pricing_engine.calcular_precio_usuario), viaje por viaje, con la tarifa vigente
+# y con una tarifa alternativa. Después mide la simulación de 1M de viajes.
+#
+#   python benchmarks/verificar_pricing_lote.py [n]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+
+import pricing_engine  # noqa: E402
+from pricing_engine import calcular_precio_usuario  # noqa: E402
+from pricing_lote import TIPOS, calcular_precios_lote, simular, viajes_sinteticos  # noqa: E402
+
+
+def escalar(km, pax, base) -> tuple:
+    """
+    Precio y conteo por tipo del camino escalar.
+    """
+    precio = calcular_precio_usuario(int(pax), float(km), 0.0, float(base))["Precio"]
+    flota = pricing_engine.resolver_flota(int(pax))
+    return precio, tuple(flota.get(v, 0) for v in TIPOS)
+
+
+def comparar(nombre: str, km, pax, base, tarifa=None) -> int:
+    lote = calcular_precios_lote(km, pax, base, tarifa)
+    errores = 0
+    t0 = time.perf_counter()
+    for i in range(len(km)):
+        precio, conteo = escalar(km[i], pax[i], base[i])
+        if precio != lote["precio"][i] or conteo != tuple(lote["conteos"][i]):
+            errores += 1
+            if errores <= 5:
+                print(f"❌ km={km[i]} pax={pax[i]} base={base[i]}: escalar {precio} {conteo} | "
+                      f"lote {lote['precio'][i]} {tuple(lote['conteos'][i])}")
+    print(f"{'✅' if not errores else '❌'} {nombre}: {len(km)} viajes, {errores} diferencias "
+          f"(escalar {(time.perf_counter() - t0) / len(km) * 1e6:.1f} µs por viaje)")
+    return errores
+
+
+def con_tarifa(tarifa: dict):
+    """
+    Deja pricing_engine con `tarifa` (y su tabla de flota) para el camino escalar.
+    """
+    pricing_engine.PRECIO_DIESEL = tarifa["PRECIO_DIESEL"]
+    pricing_engine.FACTOR_COMERCIAL = tarifa["FACTOR_COMERCIAL"]
+    pricing_engine.RENDIMIENTO_KM_LITRO = dict(tarifa["RENDIMIENTO_KM_LITRO"])
+    pricing_engine.KM_UMBRAL_CORTO = tarifa["KM_UMBRAL_CORTO"]
+    pricing_engine._TABLA_FLOTA = pricing_engine.construir_tabla_flota()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    km, pax, base = viajes_sinteticos(n, seed=3)
+    # Bordes: umbral de viaje corto, capacidades y más allá de la tabla
+    bordes_pax = np.array([1, 15, 16, 30, 31, 45, 46, 60, 61, 90, 91, 2100, 2101, 2146, 5000])
+    km = np.concatenate([km, np.full(len(bordes_pax), 99.99), np.full(len(bordes_pax), 100.0)])
+    pax = np.concatenate([pax, bordes_pax, bordes_pax])
+    base = np.concatenate([base, np.full(2 * len(bordes_pax), 12.5)])
+
+    vigente = pricing_engine.tarifa_actual()
+    alternativa = dict(vigente, PRECIO_DIESEL=1390, FACTOR_COMERCIAL=3.9, KM_UMBRAL_CORTO=120,
+                       RENDIMIENTO_KM_LITRO=dict(vigente["RENDIMIENTO_KM_LITRO"], van=5.2, bus=3.1))
+
+    errores = comparar("tarifa vigente", km, pax, base)
+    con_tarifa(alternativa)
+    try:
+        errores += comparar("tarifa alternativa", km, pax, base, alternativa)
+    finally:
+        con_tarifa(vigente)
+
+    km, pax, base = viajes_sinteticos(1_000_000)
+    simular(km, pax, base, vigente, alternativa)  # calentar (tablas de flota)
+    tiempos = []
+    for _ in range(5):
+        tiempos.append(simular(km, pax, base, vigente, alternativa)["ms"])
+    print(f"simular 1M viajes (2 tarifas): {sorted(tiempos)[2]} ms (p50)")
+
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
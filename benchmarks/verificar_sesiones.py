@@ -0,0 +1,67 @@
+# benchmarks/verificar_sesiones.py
+#
+# Un borrado (usuarios.pop al terminar la conversación) que cae mientras
+# flush() está escribiendo un lote no debe dejar la sesión viva en el backend,
+# ni cuando la escritura funciona ni cuando falla y el lote se re-encola.
+#
+#   python benchmarks/verificar_sesiones.py
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from session_store import Sesiones, SQLiteBackend  # noqa: E402
+
+
+class BackendLento(SQLiteBackend):
+    """
+    SQLite que avisa cuando empieza a escribir un lote y tarda en terminar
+    (opcionalmente fallando), para forzar el cruce con un borrado.
+    """
+
+    def __init__(self, path: str, fallar: bool = False):
+        super().__init__(path)
+        self.escribiendo = threading.Event()
+        self.fallar = fallar
+
+    def guardar_lote(self, items: dict):
+        self.escribiendo.set()
+        time.sleep(0.2)
+        if self.fallar:
+            self.fallar = False
+            raise RuntimeError("backend caído")
+        super().guardar_lote(items)
+
+
+def cruce(fallar: bool) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = BackendLento(os.path.join(tmp, "s.db"), fallar=fallar)
+        usuarios = Sesiones(backend, flush_ms=10_000)  # flush solo a mano
+
+        usuarios["56911111111"] = {"estado": "confirmar"}
+        hilo = threading.Thread(target=usuarios.flush)
+        hilo.start()
+        backend.escribiendo.wait()
+
+        usuarios.pop("56911111111", None)  # llega mientras se escribe el lote
+        hilo.join()
+        usuarios.flush()  # reintento del lote (si falló)
+
+        return backend.cargar("56911111111") is None and usuarios.stats()["pendientes"] == 0
+
+
+def main():
+    errores = 0
+    for nombre, fallar in (("escritura ok", False), ("escritura falla y se re-encola", True)):
+        ok = cruce(fallar)
+        errores += not ok
+        print(f"{'✅' if ok else '❌'} borrado durante flush ({nombre})")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,22 @@
+import multiprocessing
 import os
-import requests
+import time
 import uuid
 from flask import Flask, request, jsonify
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, date
-from pricing_engine import calcular_precio
-from maps import geocode, route, geocode_candidates
-from map_image import generar_mapa_static
-from pricing_engine import calcular_precio, calcular_cotizacion_flotilla
-from pricing_engine import resumen_flotilla
+from maps import geocode_candidates, nombre_ubicacion, aprender_lugar, APRENDIDOS, GEOCACHE, rutas_stats
+from geocoding_resolver import stats as resolver_stats
+from map_image import tiles_stats, leer_mapa
+from artefactos import ARTEFACTOS
+from correo import cuerpo_con_adjuntos
+from cotizacion import calcular_cotizacion, iniciar_precalculo, usar_almacen, COTIZACION_DEADLINE_S
+from cotizacion import obtener_precalculo, invalidar_precalculo, precalculo_listo, estimar_cotizacion
+from worker_pool import WorkerPool, PoolLleno
+from session_store import crear_sesiones
+from idempotencia import crear_dedup
+import http_client
 
 
 
@@ -41,9 +48,10 @@ credentials = ServiceAccountCredentials.from_json_keyfile_name("credentials.json
 client = gspread.authorize(credentials)
 sheet = client.open_by_key(GOOGLE_SHEETS_ID).sheet1
 
-usuarios = {}
-
-SEDE_PENAFLOR = (-33.60627, -70.87649)
+# Estado de conversación por wa_id (backend configurable con SESSION_BACKEND)
+usuarios = crear_sesiones()
+# Los precálculos se publican en el mismo store (los ve cualquier worker)
+usar_almacen(usuarios)
 
 def guardar_en_sheet(usuario):
     try:
@@ -60,7 +68,14 @@ def guardar_en_sheet(usuario):
             usuario.get("Hora Regreso", ""),
             usuario.get("Telefono", ""),
             "ENVIADA",                                     # Estado
-            ""                                             # Fecha Respuesta
+            "",                                            # Fecha Respuesta
+            # Al final para no correr columnas existentes; reemitir.py las usa
+            # para recotizar sin volver a rutear
+            usuario.get("KM Total", ""),
+            usuario.get("KM Base", ""),
+            usuario.get("Horas Total", ""),
+            usuario.get("Vehiculo", ""),
+            usuario.get("Precio", ""),
         ]
 
         sheet.append_row(fila, value_input_option="USER_ENTERED")
@@ -98,7 +113,7 @@ def enviar_texto(to, msg):
     data = {"messaging_product": "whatsapp", "to": to, "text": {"body": msg}}
 
     try:
-        r = requests.post(url, headers=headers, json=data, timeout=10)
+        r = http_client.post(url, headers=headers, json=data)
         if r.status_code >= 300:
             print("❌ Error WhatsApp enviar_texto:", r.status_code, r.text)
         return r
@@ -128,7 +143,7 @@ def enviar_botones(to, cuerpo, botones):
     }
 
     try:
-        r = requests.post(url, headers=headers, json=data, timeout=10)
+        r = http_client.post(url, headers=headers, json=data)
         if r.status_code >= 300:
             print("❌ Error WhatsApp enviar_botones:", r.status_code, r.text)
         return r
@@ -138,12 +153,9 @@ def enviar_botones(to, cuerpo, botones):
 
 # -------- Email (Brevo API / HTTPS) --------
 import os
-import base64
 
 def enviar_correo(usuario):
     try:
-        import requests  # por si faltaba, así ves el error en logs dentro de la función
-
         BREVO_API_KEY = (os.getenv("BREVO_API_KEY") or "").strip()
         if not BREVO_API_KEY:
             print("❌ Falta BREVO_API_KEY en variables de entorno")
@@ -163,13 +175,19 @@ def enviar_correo(usuario):
             return False
 
         # ✅ Import “lazy” para no botar el servidor al iniciar
-        from pdf_generator import generar_pdf_cotizacion
+        from pdf_generator import generar_pdf_bytes
 
-        pdf_path = generar_pdf_cotizacion(usuario)
-        print("✅ PDF generado en:", pdf_path)
+        cot_id = usuario.get("cotizacion_id", "")
 
-        with open(pdf_path, "rb") as f:
-            pdf_base64 = base64.b64encode(f.read()).decode("utf-8")
+        # Mapa y PDF quedan en memoria: nada de escribir y releer /tmp
+        mapa_png = None
+        try:
+            mapa_png = leer_mapa((usuario.get("Mapa Ruta") or "").strip())
+        except Exception as e:
+            print("⚠️ No se pudo leer imagen del mapa:", e)
+
+        pdf_bytes = generar_pdf_bytes(usuario, mapa_png)
+        print("✅ PDF generado en memoria:", len(pdf_bytes), "bytes")
 
         cuerpo = (
             "Hola,\n\n"
@@ -188,26 +206,18 @@ def enviar_correo(usuario):
             "to": [{"email": to_email}],
             "subject": "Cotización Ecobus - Transporte Privado",
             "textContent": cuerpo,
-            "attachment": [
-                {"content": pdf_base64, "name": f"cotizacion_{usuario.get('cotizacion_id','')}.pdf"}
-            ],
         }
 
         if NOTIFY_EMAIL:
             payload["cc"] = [{"email": NOTIFY_EMAIL}]
 
-        # Adjuntar imagen mapa si existe
-        try:
-            ruta_img = (usuario.get("Mapa Ruta") or "").strip()
-            if ruta_img and os.path.exists(ruta_img):
-                with open(ruta_img, "rb") as f:
-                    mapa_base64 = base64.b64encode(f.read()).decode("utf-8")
-                payload["attachment"].append(
-                    {"content": mapa_base64, "name": f"ruta_referencial_{usuario.get('cotizacion_id','')}.png"}
-                )
-                print("✅ Imagen de ruta adjunta:", ruta_img)
-        except Exception as e:
-            print("⚠️ No se pudo adjuntar imagen del mapa:", e)
+        # El mapa ya va dentro del PDF; el PNG aparte es opcional (pesa casi lo mismo)
+        adjuntar_mapa = os.getenv("CORREO_ADJUNTAR_MAPA", "1") == "1"
+
+        adjuntos = [(f"cotizacion_{cot_id}.pdf", pdf_bytes)]
+        if mapa_png and adjuntar_mapa:
+            adjuntos.append((f"ruta_referencial_{cot_id}.png", mapa_png))
+            print("✅ Imagen de ruta adjunta:", usuario.get("Mapa Ruta"))
 
         url = "https://api.brevo.com/v3/smtp/email"
         headers = {
@@ -216,7 +226,8 @@ def enviar_correo(usuario):
             "content-type": "application/json",
         }
 
-        r = requests.post(url, headers=headers, json=payload, timeout=12)
+        # El base64 de los adjuntos se genera por trozos al enviar (ver correo.py)
+        r = http_client.post(url, headers=headers, data=cuerpo_con_adjuntos(payload, adjuntos))
 
         if r.status_code in (200, 201):
             print("📧 Correo enviado por Brevo OK")
@@ -284,6 +295,14 @@ def corregir_campos(to, texto_lower):
 
     for key, estado in mapping.items():
         if f"cambiar {key}" in texto_lower:
+            # El precálculo de ruta/precio ya no sirve si cambian estos datos
+            if key in ("origen", "destino", "pasajeros"):
+                invalidar_precalculo(to, m)
+            if key in ("origen", "destino"):
+                campo = key.capitalize()
+                m.pop(f"{campo} Lat", None)
+                m.pop(f"{campo} Lon", None)
+
             usuarios[to]["estado"] = estado
             usuarios[to]["modo_correccion"] = True
             enviar_texto(to, f"Ok 👍 Envíame el nuevo {key}:")
@@ -291,7 +310,19 @@ def corregir_campos(to, texto_lower):
 
     return False
 
-def procesar_flujo(to, texto, texto_lower):
+def fijar_ubicacion(u, campo, ubicacion):
+    """
+    Ubicación compartida por WhatsApp: las coordenadas se usan tal cual,
+    sin pasar por geocoding. Solo se busca un nombre legible.
+    """
+    lat, lon = ubicacion["lat"], ubicacion["lon"]
+    u[campo] = ubicacion.get("nombre") or nombre_ubicacion(lat, lon)
+    u[f"{campo} Lat"] = lat
+    u[f"{campo} Lon"] = lon
+    u.pop(f"candidatos_{campo.lower()}", None)
+
+
+def procesar_flujo(to, texto, texto_lower, ubicacion=None):
     u = usuarios[to]
 
     if corregir_campos(to, texto_lower):
@@ -342,6 +373,11 @@ def procesar_flujo(to, texto, texto_lower):
             return enviar_texto(to, "Formato inválido. Ej: 25-12-2026")
 
     # -------- ORIGEN --------
+    if estado in ("origen", "confirmar_origen") and ubicacion:
+        fijar_ubicacion(u, "Origen", ubicacion)
+        u["estado"] = "destino"
+        return enviar_texto(to, f"📍 Origen: {u['Origen']}\n🎯 ¿Destino?")
+
     if estado == "origen":
         u["Origen"] = texto
 
@@ -378,6 +414,9 @@ def procesar_flujo(to, texto, texto_lower):
                 candidatos = u.get("candidatos_origen", [])
                 elegido = candidatos[idx]
 
+                # Aprender: la próxima vez este texto resuelve sin preguntar
+                aprender_lugar(u.get("Origen"), elegido, to)
+
                 # Guardamos versión “bonita” del origen (texto)
                 u["Origen"] = elegido["name"]
 
@@ -396,6 +435,12 @@ def procesar_flujo(to, texto, texto_lower):
 
 
     # -------- DESTINO --------
+    if estado in ("destino", "confirmar_destino") and ubicacion:
+        fijar_ubicacion(u, "Destino", ubicacion)
+        u["estado"] = "ida"
+        iniciar_precalculo(to, u)
+        return enviar_texto(to, f"🎯 Destino: {u['Destino']}\n🕒 Hora salida HH:MM")
+
     if estado == "destino":
         u["Destino"] = texto
 
@@ -420,6 +465,7 @@ def procesar_flujo(to, texto, texto_lower):
             return enviar_botones(to, cuerpo, botones)
 
         u["estado"] = "ida"
+        iniciar_precalculo(to, u)
         return enviar_texto(to, "🕒 Hora salida HH:MM")
 
     if estado == "confirmar_destino":
@@ -429,6 +475,8 @@ def procesar_flujo(to, texto, texto_lower):
                 candidatos = u.get("candidatos_destino", [])
                 elegido = candidatos[idx]
 
+                aprender_lugar(u.get("Destino"), elegido, to)
+
                 u["Destino"] = elegido["name"]
                 u["Destino Lat"] = elegido["lat"]
                 u["Destino Lon"] = elegido["lon"]
@@ -436,6 +484,7 @@ def procesar_flujo(to, texto, texto_lower):
                 u.pop("candidatos_destino", None)
 
                 u["estado"] = "ida"
+                iniciar_precalculo(to, u)
                 return enviar_texto(to, "🕒 Perfecto. Hora salida HH:MM")
             except Exception as e:
                 print("⚠️ Error confirmando destino:", e)
@@ -466,150 +515,37 @@ def procesar_flujo(to, texto, texto_lower):
     if estado == "confirmar" and texto_lower == "confirmar_si":
         u["cotizacion_id"] = str(uuid.uuid4())[:8].upper()
 
-        try:
-            # 1. Geocoding (si el usuario confirmó con botones, ya tenemos coords)
-            if "Origen Lat" in u and "Origen Lon" in u:
-                lat_o, lon_o = u["Origen Lat"], u["Origen Lon"]
-            else:
-                lat_o, lon_o = geocode(u["Origen"])
-
-            if "Destino Lat" in u and "Destino Lon" in u:
-                lat_d, lon_d = u["Destino Lat"], u["Destino Lon"]
-            else:
-                lat_d, lon_d = geocode(u["Destino"])
-
-
-            # 2. Ruta ida (3 valores)
-            km_ida, horas_ida, poly_ida = route((lat_o, lon_o), (lat_d, lon_d))
-
-            # 3. Ruta vuelta
-            km_vuelta, horas_vuelta, poly_vuelta = route((lat_d, lon_d), (lat_o, lon_o))
-
-            km_total = km_ida + km_vuelta
-            horas_total = horas_ida + horas_vuelta
-            km_base_origen = 0
-
-            if km_total < 100:
-                try:
-                    km_base_origen, _, _ = route(SEDE_PENAFLOR, (lat_o, lon_o))
-                    print("✅ KM base Peñaflor -> Origen:", km_base_origen)
-                except Exception as e:
-                    print("⚠️ No se pudo calcular KM base origen:", e)
-                    km_base_origen = 0
-                    
-            # ✅ Guardar para PDF
-            u["KM Total"] = round(km_total, 2)
-            u["Horas Total"] = round(horas_total, 2)
-            u["Polyline Ida"] = poly_ida
-
-            # ✅ Generar imagen mapa
+        # Precio aproximado al instante mientras se calcula la ruta exacta
+        if not precalculo_listo(to, u):
             try:
-                ruta_img = generar_mapa_static(
-                    (lat_o, lon_o),
-                    (lat_d, lon_d),
-                    u["Polyline Ida"],
-                    u.get("cotizacion_id", "SINID")
-                )
-                u["Mapa Ruta"] = ruta_img
-                print("✅ Imagen mapa generada en:", u["Mapa Ruta"])
+                aprox = estimar_cotizacion(u)
+                if aprox:
+                    enviar_texto(
+                        to,
+                        f"💡 Precio aproximado: ${aprox['Precio Min']} - ${aprox['Precio Max']}\n"
+                        "Estamos calculando la ruta exacta, en unos segundos te llega la cotización."
+                    )
             except Exception as e:
-                print("⚠️ No se pudo generar imagen del mapa:", e)
-                u["Mapa Ruta"] = ""
-
-            # 4. Pricing
-            if u["Pasajeros"] <= 45:
-                resultado = calcular_precio(
-                    km_total=km_total,
-                    horas_total=horas_total,
-                    pasajeros=u["Pasajeros"],
-                    km_base_origen=km_base_origen
-                )
-                u["Vehiculo"] = resultado["vehiculo"]
-                u["Precio"] = resultado["precio_final"]
-                u["Detalle Vehiculos"] = ""  # para no romper tu PDF si no lo usa
-
-            else:
-                resultado = calcular_cotizacion_flotilla(
-                    km_total=km_total,
-                    horas_total=horas_total,
-                    pasajeros=u["Pasajeros"],
-                    km_base_origen=km_base_origen
-                )
-
-
-                # Texto “humano” del detalle (uno por línea) + resumen para no mostrar "MULTI"
-                detalle_txt = []
-
-                for item in resultado["items"]:
-                    veh = item.get("vehiculo", "")
-                    pax = item.get("pasajeros_asignados", 0)
-                    precio_item = item.get("precio_final", 0)
-
-                    # Nombre bonito (Bus/Van/Taxibus)
-                    if veh == "bus":
-                        nombre = "Bus"
-                    elif veh == "van":
-                        nombre = "Van"
-                    elif veh == "taxibus":
-                        nombre = "Taxibus"
-                    else:
-                        nombre = str(veh).capitalize()
-
-                    # Línea limpia por vehículo (incluye precio por vehículo como tú querías)
-                    detalle_txt.append(f"- {nombre} de {pax} pasajeros: ${precio_item}")
-
-                # ✅ Vehiculo: resumen tipo "2 Buses + 1 Van" (NO "MULTI")
-                # Si no tienes resumen_flotilla en pricing_engine, te dejo función abajo.
-                u["Vehiculo"] = resumen_flotilla(resultado["items"])
-
-                # ✅ Precio total final (igual que antes)
-                u["Precio"] = resultado["precio_final_total"]
-
-                # ✅ Detalle limpio para el PDF (NO diccionario feo)
-                u["Detalle Vehiculos"] = "\n".join(detalle_txt)
-
-
-
-            # 5. Guardar en usuario (NO pisar el detalle humano ni poner MULTI)
-            # ✅ Precio total final
-            if "precio_final_total" in resultado:
-                u["Precio"] = round(resultado["precio_final_total"], 0)
-
-            # ✅ Vehículo: si es flotilla usar resumen bonito, si es 1 vehículo usar nombre normal
-            items = resultado.get("items", [])
-
-            if len(items) == 1:
-                u["Vehiculo"] = items[0].get("vehiculo", "")
-            elif len(items) > 1:
-                # Resumen bonito tipo: "1 bus (45 pax c/u) + 1 van (15 pax c/u)"
-                u["Vehiculo"] = resumen_flotilla(items)
-
-            # ✅ IMPORTANTE:
-            # NO guardar lista/dict en "Detalle Vehiculos", porque el PDF lo imprime feo.
-            # Aquí dejamos lo que ya se armó arriba como texto humano.
-            # Si por algún motivo no existe, lo armamos aquí mismo.
-            if not isinstance(u.get("Detalle Vehiculos", ""), str) or not u.get("Detalle Vehiculos", "").strip():
-                detalle_txt = []
-                for item in items:
-                    veh = item.get("vehiculo", "")
-                    pax = item.get("pasajeros_asignados", 0)
-                    precio_item = item.get("precio_final", 0)
-
-                    if veh == "bus":
-                        nombre = "Bus"
-                    elif veh == "van":
-                        nombre = "Van"
-                    elif veh == "taxibus":
-                        nombre = "Taxibus"
-                    else:
-                        nombre = str(veh).capitalize()
-
-                    detalle_txt.append(f"- {nombre} de {pax} pasajeros: ${precio_item}")
-
-                u["Detalle Vehiculos"] = "\n".join(detalle_txt)
+                print("⚠️ No se pudo estimar precio aproximado:", e)
 
+        try:
+            # Geocoding, rutas, mapa y pricing (en paralelo, ver cotizacion.py).
+            # Si el precálculo ya corrió mientras el usuario escribía, solo falta el mapa.
+            # Esperarlo y calcular comparten un solo deadline.
+            limite = time.perf_counter() + COTIZACION_DEADLINE_S
+            precalculo = obtener_precalculo(to, u, limite)
+            if precalculo:
+                print("🔮 Usando precálculo:", to)
+            calcular_cotizacion(u, precalculo, limite)
             u["Error Cotizacion"] = ""
 
+            if u.get("Cotizacion Estimada"):
+                u["Error Cotizacion"] = "Ruta estimada (ORS no disponible)"
+                enviar_texto(
+                    to,
+                    "⚠️ No pudimos calcular la ruta exacta en este momento.\n"
+                    "Te enviamos un precio estimado; un ejecutivo lo confirmará."
+                )
 
         except Exception as e:
             print("❌ Error cotizando:", e)
@@ -633,9 +569,141 @@ def procesar_flujo(to, texto, texto_lower):
         enviar_correo(u)
 
         enviar_texto(to, "✅ Solicitud enviada, RECUERDA REVISAR TUS CORREOS DE SPAM/NO DESEADOS. ¡Gracias!")
+        invalidar_precalculo(to)
         usuarios.pop(to, None)
         return
 
+# -------- Mensajes --------
+def parsear_mensaje(m: dict):
+    """
+    Convierte un mensaje del webhook en (wa_id, texto, ubicacion).
+    ubicacion solo viene en mensajes tipo location: {"lat", "lon", "nombre"}.
+    """
+    wa_id = m.get("from")
+    tipo = m.get("type", "")
+    texto = ""
+    ubicacion = None
+
+    if tipo == "text":
+        texto = m["text"]["body"]
+
+    elif tipo == "interactive":
+        texto = m["interactive"]["button_reply"]["id"]
+
+    elif tipo == "location":
+        loc = m["location"]
+        lat = float(loc["latitude"])
+        lon = float(loc["longitude"])
+        texto = f"{lat},{lon}"
+        # Si compartió un lugar (no solo su posición) WhatsApp trae el nombre
+        ubicacion = {"lat": lat, "lon": lon, "nombre": loc.get("name") or loc.get("address")}
+
+    else:
+        texto = ""
+
+    return wa_id, texto, ubicacion
+
+
+def procesar_mensaje(wa_id, texto, ubicacion=None):
+    # Otro worker pudo haber atendido el mensaje anterior de este usuario
+    usuarios.refrescar(wa_id)
+    try:
+        _procesar_mensaje(wa_id, texto, ubicacion)
+    finally:
+        usuarios.marcar(wa_id)
+
+
+def _procesar_mensaje(wa_id, texto, ubicacion=None):
+    texto_lower = texto.lower()
+
+    if wa_id not in usuarios:
+        usuarios[wa_id] = {
+            "estado": None,
+            "modo_correccion": False
+        }
+
+    if texto_lower in ["hola", "menú", "menu", "inicio"]:
+        usuarios[wa_id]["estado"] = None
+        menu_principal(wa_id)
+        return
+
+    if usuarios[wa_id]["estado"] is None:
+        if texto_lower == "cotizar":
+            usuarios[wa_id]["estado"] = "nombre"
+            enviar_texto(wa_id, "👤 Nombre de la persona/empresa solicitante")
+        elif texto_lower == "ejecutivo":
+            enviar_texto(
+                wa_id,
+                "Perfecto, Fabian será el ejecutivo encargado 📞 +56 9 9871 1060"
+            )
+        else:
+            menu_principal(wa_id)
+    else:
+        procesar_flujo(wa_id, texto, texto_lower, ubicacion)
+
+
+# -------- Pool de workers --------
+# WEBHOOK_ASYNC=1 -> el webhook solo encola y responde 200 al tiro
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+WORKER_POOL_MODE = os.getenv("WORKER_POOL_MODE", "thread")
+
+
+def procesar_mensaje_proceso(wa_id, texto, ubicacion=None):
+    """
+    procesar_mensaje en un hijo del pool (modo process): la sesión se escribe
+    antes de volver, porque el próximo mensaje puede caer en otro proceso.
+    """
+    try:
+        procesar_mensaje(wa_id, texto, ubicacion)
+    finally:
+        usuarios.flush()
+
+
+def _crear_pool():
+    if not WEBHOOK_ASYNC:
+        return None
+
+    # Los hijos del pool (modo process) importan este módulo: no crean su propio pool
+    if multiprocessing.parent_process() is not None:
+        return None
+
+    if WORKER_POOL_MODE == "process" and not usuarios.backend.compartido:
+        # Cada hijo tendría su propia copia de `usuarios` y el padre nunca
+        # vería los cambios: la conversación partiría de cero en cada mensaje
+        raise RuntimeError(
+            "WORKER_POOL_MODE=process necesita sesiones compartidas "
+            "(SESSION_BACKEND=sqlite o redis), no SESSION_BACKEND="
+            f"{type(usuarios.backend).__name__}"
+        )
+
+    return WorkerPool(mode=WORKER_POOL_MODE)
+
+
+pool = _crear_pool()
+_procesar_en_pool = procesar_mensaje_proceso if WORKER_POOL_MODE == "process" else procesar_mensaje
+
+# Meta reenvía el webhook si respondemos lento: se descartan ids ya vistos
+mensajes_vistos = crear_dedup()
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    data = {
+        "sesiones": usuarios.stats(),
+        "dedup": mensajes_vistos.stats(),
+        "http": http_client.stats(),
+        "geocache": GEOCACHE.stats(),
+        "resolver": resolver_stats(),
+        "aprendidos": APRENDIDOS.stats() if APRENDIDOS is not None else None,
+        "rutas": rutas_stats(),
+        "tiles": tiles_stats(),
+        "artefactos": ARTEFACTOS.stats(),
+    }
+    if pool is not None:
+        data["worker_pool"] = pool.stats()
+    return jsonify(data), 200
+
+
 # -------- Webhook --------
 @app.route("/webhook", methods=["GET", "POST"])
 def webhook():
@@ -644,55 +712,43 @@ def webhook():
             return request.args.get("hub.challenge")
         return "Error Token", 403
 
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     entry = data.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {})
     mensajes = entry.get("messages", [])
 
     for m in mensajes:
-        wa_id = m.get("from")
-        tipo = m.get("type", "")
-        texto = ""
-
-        if tipo == "text":
-            texto = m["text"]["body"]
-
-        elif tipo == "interactive":
-            texto = m["interactive"]["button_reply"]["id"]
-
-        elif tipo == "location":
-            lat = m["location"]["latitude"]
-            lon = m["location"]["longitude"]
-            texto = f"{lat},{lon}"
-
-        else:
-            texto = ""
-
-        texto_lower = texto.lower()
+        # Se marca antes de procesar (un reintento que llega mientras tanto se
+        # descarta); si el proceso falla se desmarca, porque el webhook
+        # responde 500 y Meta lo va a reintentar
+        msg_id = m.get("id")
+        if msg_id and not mensajes_vistos.es_nuevo(msg_id):
+            print("🔁 Mensaje duplicado, se ignora:", msg_id)
+            continue
 
-        if wa_id not in usuarios:
-            usuarios[wa_id] = {
-                "estado": None,
-                "modo_correccion": False
-            }
+        try:
+            wa_id, texto, ubicacion = parsear_mensaje(m)
+        except Exception as e:
+            print("⚠️ Mensaje inválido, se ignora:", e)
+            continue
 
-        if texto_lower in ["hola", "menú", "menu", "inicio"]:
-            usuarios[wa_id]["estado"] = None
-            menu_principal(wa_id)
+        if not wa_id:
             continue
 
-        if usuarios[wa_id]["estado"] is None:
-            if texto_lower == "cotizar":
-                usuarios[wa_id]["estado"] = "nombre"
-                enviar_texto(wa_id, "👤 Nombre de la persona/empresa solicitante")
-            elif texto_lower == "ejecutivo":
-                enviar_texto(
-                    wa_id,
-                    "Perfecto, Fabian será el ejecutivo encargado 📞 +56 9 9871 1060"
-                )
-            else:
-                menu_principal(wa_id)
-        else:
-            procesar_flujo(wa_id, texto, texto_lower)
+        try:
+            if pool is None:
+                procesar_mensaje(wa_id, texto, ubicacion)
+                continue
+
+            try:
+                pool.enviar(wa_id, _procesar_en_pool, wa_id, texto, ubicacion)
+            except PoolLleno:
+                # Cola saturada: mejor procesar aquí que perder el mensaje
+                print("⚠️ Worker pool lleno, procesando inline:", wa_id)
+                procesar_mensaje(wa_id, texto, ubicacion)
+        except Exception:
+            if msg_id:
+                mensajes_vistos.olvidar(msg_id)
+            raise
 
     # 🔴 ESTE return DEBE QUEDAR DENTRO DE LA FUNCIÓN
     return jsonify({"status": "ok"}), 200
@@ -0,0 +1,183 @@
+# cache_local.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "/tmp/ecobus_cache.db")
+
+
+class CacheDosNiveles:
+    """
+    Cache de 2 niveles:
+    1) memoria: LRU con TTL (rápida, por proceso)
+    2) disco: SQLite en WAL (sobrevive reinicios y se comparte entre workers)
+
+    Los valores deben ser serializables a JSON.
+    """
+
+    _PURGA_CADA = 1000
+
+    def __init__(self, nombre: str, ttl_s: float, max_memoria: int = 5000,
+                 max_disco: int = 200000, path: str = CACHE_DB_PATH):
+        self.nombre = nombre
+        self.ttl_s = ttl_s
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self.path = path
+
+        self._mem = OrderedDict()  # clave -> (expira, valor)
+        self._lock = threading.Lock()
+        self._escrituras = 0
+
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidaciones = 0
+
+        self._conn = None
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    " ns TEXT NOT NULL,"
+                    " clave TEXT NOT NULL,"
+                    " valor TEXT NOT NULL,"
+                    " expira REAL NOT NULL,"
+                    " PRIMARY KEY (ns, clave))"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expira ON cache (ns, expira)")
+            except Exception as e:
+                print(f"⚠️ Cache {nombre}: sin disco ({e}), solo memoria")
+                self._conn = None
+
+    # --- memoria ---
+    def _mem_set(self, clave, valor, expira):
+        self._mem[clave] = (expira, valor)
+        self._mem.move_to_end(clave)
+        while len(self._mem) > self.max_memoria:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, clave: str, default=None, contar: bool = True):
+        """
+        contar=False: consulta interna que no afecta las estadísticas.
+        """
+        ahora = time.time()
+
+        with self._lock:
+            item = self._mem.get(clave)
+            if item is not None:
+                if item[0] > ahora:
+                    self._mem.move_to_end(clave)
+                    self.hits_memoria += contar
+                    return item[1]
+                del self._mem[clave]
+                self.evictions += 1
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT valor, expira FROM cache WHERE ns = ? AND clave = ?",
+                    (self.nombre, clave)
+                ).fetchone()
+                if row and row[1] > ahora:
+                    valor = json.loads(row[0])
+                    self._mem_set(clave, valor, row[1])
+                    self.hits_disco += contar
+                    return valor
+
+            self.misses += contar
+            return default
+
+    def set(self, clave: str, valor, ttl_s: float | None = None):
+        expira = time.time() + (ttl_s if ttl_s is not None else self.ttl_s)
+
+        with self._lock:
+            self._mem_set(clave, valor, expira)
+
+            if self._conn is None:
+                return
+
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (ns, clave, valor, expira) VALUES (?, ?, ?, ?)",
+                    (self.nombre, clave, json.dumps(valor, ensure_ascii=False), expira)
+                )
+                self._escrituras += 1
+                if self._escrituras % self._PURGA_CADA == 0:
+                    self._purgar_disco()
+            except Exception as e:
+                print(f"⚠️ Cache {self.nombre}: error escribiendo en disco:", e)
+
+    def invalidar(self, clave: str) -> bool:
+        with self._lock:
+            estaba = self._mem.pop(clave, None) is not None
+            if self._conn is not None:
+                cur = self._conn.execute("DELETE FROM cache WHERE ns = ? AND clave = ?", (self.nombre, clave))
+                estaba = estaba or cur.rowcount > 0
+            if estaba:
+                self.invalidaciones += 1
+            return estaba
+
+    def _purgar_disco(self):
+        cur = self._conn.execute("DELETE FROM cache WHERE ns = ? AND expira < ?", (self.nombre, time.time()))
+        self.evictions += max(0, cur.rowcount)
+        cur = self._conn.execute(
+            "DELETE FROM cache WHERE ns = ? AND clave IN ("
+            " SELECT clave FROM cache WHERE ns = ? ORDER BY expira DESC LIMIT -1 OFFSET ?)",
+            (self.nombre, self.nombre, self.max_disco)
+        )
+        self.evictions += max(0, cur.rowcount)
+
+    def items(self, campos: tuple | None = None):
+        """
+        Itera (clave, valor) vigentes en disco (o en memoria si no hay disco).
+        campos=("a", "b"): valores dict reducidos a esas llaves; en disco se
+        proyectan en SQLite (json_extract), sin traer ni parsear el resto.
+        """
+        ahora = time.time()
+        if self._conn is None:
+            with self._lock:
+                vivos = [(k, v) for k, (exp, v) in self._mem.items() if exp > ahora]
+            for clave, valor in vivos:
+                if campos is not None:
+                    valor = {c: valor[c] for c in campos if c in valor}
+                yield clave, valor
+            return
+
+        columna = "valor"
+        if campos is not None:
+            columna = "json_object(" + ", ".join(
+                f"'{c}', json_extract(valor, '$.{c}')" for c in campos
+            ) + ")"
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT clave, {columna} FROM cache WHERE ns = ? AND expira > ?", (self.nombre, ahora)
+            ).fetchall()
+        for clave, valor in rows:
+            valor = json.loads(valor)
+            if campos is not None:
+                valor = {c: v for c, v in valor.items() if v is not None}
+            yield clave, valor
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits_memoria + self.hits_disco + self.misses
+            return {
+                "en_memoria": len(self._mem),
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidaciones": self.invalidaciones,
+                "hit_rate": round((self.hits_memoria + self.hits_disco) / total, 4) if total else 0.0,
+            }
@@ -10,8 +10,8 @@ COMUNAS_RM = {
     "quilicura": (-33.3667, -70.7333),
     "pudahuel": (-33.4300, -70.8167),
     "viña del mar": (-33.02457, -71.55183),
-    "peñaflor": (-33.60627, -70.87649)
-    "valparaiso": (33.036, -71.62963),
+    "peñaflor": (-33.60627, -70.87649),
+    "valparaiso": (-33.036, -71.62963),
     "calera de Tango": (-33.6221, -70.783),
     "Paine": (-33.8234, -70.7343),
     "San Bernardo":(-33.5695,-70.7376),
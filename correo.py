@@ -0,0 +1,64 @@
+# correo.py
+#
+# Cuerpo JSON para la API de Brevo con adjuntos grandes (PDF, PNG) sin armar
+# el string base64 completo en memoria: el base64 se genera por trozos
+# mientras requests/urllib3 van enviando el body.
+
+import binascii
+import json
+
+# Múltiplo de 3: los trozos base64 se pueden concatenar tal cual
+TROZO_BYTES = 48 * 1024
+
+
+class _Base64:
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __len__(self):
+        return 4 * ((len(self.data) + 2) // 3)
+
+
+class CuerpoStream:
+    """
+    Body iterable con largo conocido: requests lo manda con Content-Length
+    (no chunked) y urllib3 lo recorre trozo a trozo. Se puede iterar más de
+    una vez (reintentos).
+    """
+
+    def __init__(self, partes: list):
+        self._partes = partes
+
+    def __len__(self):
+        return sum(len(p) for p in self._partes)
+
+    def __iter__(self):
+        for p in self._partes:
+            if isinstance(p, _Base64):
+                mv = memoryview(p.data)
+                for i in range(0, len(mv), TROZO_BYTES):
+                    yield binascii.b2a_base64(mv[i:i + TROZO_BYTES], newline=False)
+            else:
+                yield p
+
+
+def cuerpo_con_adjuntos(payload: dict, adjuntos: list) -> CuerpoStream:
+    """
+    payload: el JSON de Brevo sin "attachment".
+    adjuntos: [(nombre, bytes), ...] -> "attachment": [{"name", "content"}, ...]
+    """
+    base = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if not adjuntos:
+        return CuerpoStream([base])
+
+    partes = [base[:-1], b"," if len(base) > 2 else b"", b'"attachment":[']
+    for i, (nombre, data) in enumerate(adjuntos):
+        partes.append(b"," if i else b"")
+        partes.append(b'{"name":' + json.dumps(nombre, ensure_ascii=False).encode("utf-8") + b',"content":"')
+        partes.append(_Base64(data))
+        partes.append(b'"}')
+    partes.append(b"]}")
+
+    return CuerpoStream([p for p in partes if len(p)])
@@ -0,0 +1,376 @@
+# cotizacion.py
+
+import hashlib
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dag import Etapa, ejecutar_dag
+from maps import geocode, geocode_local, route, matriz, estimar_ruta, SEDE_PENAFLOR
+from map_image import generar_mapa_static
+from pricing_engine import calcular_precio_usuario, KM_UMBRAL_CORTO
+
+# Tiempo máximo para toda la cotización (geocoding + rutas + mapa)
+COTIZACION_DEADLINE_S = float(os.getenv("COTIZACION_DEADLINE_S", "45"))
+
+
+def _coords(u: dict, campo: str):
+    """
+    Si el usuario confirmó con botones ya tenemos coords; si no, geocode.
+    """
+    if f"{campo} Lat" in u and f"{campo} Lon" in u:
+        return u[f"{campo} Lat"], u[f"{campo} Lon"]
+    return geocode(u[campo])
+
+
+def _coords_locales(u: dict, campo: str):
+    """
+    Igual que _coords pero sin red: None si habría que llamar a Mapbox.
+    """
+    if f"{campo} Lat" in u and f"{campo} Lon" in u:
+        return u[f"{campo} Lat"], u[f"{campo} Lon"]
+    return geocode_local(u.get(campo, ""))
+
+
+def _etapas_ruta_precio(u: dict) -> list[Etapa]:
+    """
+    Etapas de geocoding, rutas y pricing (todo lo que depende solo de
+    origen, destino y pasajeros).
+    """
+
+    def tramos(geo_origen, geo_destino):
+        """
+        Ida, vuelta y base Peñaflor -> origen en una sola llamada matrix a ORS.
+        Si ORS falla o está caído, se usa el estimador offline (maps.estimar_ruta)
+        en vez de dejar la cotización PENDIENTE.
+        """
+        legs = [(geo_origen, geo_destino), (geo_destino, geo_origen), (SEDE_PENAFLOR, geo_origen)]
+        try:
+            ida, vuelta, base = matriz(legs)
+            if ida is None or vuelta is None:
+                raise Exception("ORS matrix sin ruta ida/vuelta")
+            return {"ida": ida, "vuelta": vuelta, "base": base, "estimado": False}
+        except Exception as e:
+            print("⚠️ ORS no disponible, usando estimador offline:", e)
+
+        ida, vuelta, base = (estimar_ruta(o, d) for o, d in legs)
+        return {
+            "ida": (ida["km"], ida["horas"]),
+            "vuelta": (vuelta["km"], vuelta["horas"]),
+            "base": (base["km"], base["horas"]),
+            "estimado": True,
+            "banda": ida["banda"],
+        }
+
+    def precio(tramos):
+        km_total = tramos["ida"][0] + tramos["vuelta"][0]
+        horas_total = tramos["ida"][1] + tramos["vuelta"][1]
+
+        # La base solo se cobra en viajes cortos
+        km_base_origen = 0
+        if km_total < KM_UMBRAL_CORTO and tramos["base"] is not None:
+            km_base_origen = tramos["base"][0]
+            print("✅ KM base Peñaflor -> Origen:", km_base_origen)
+
+        campos = calcular_precio_usuario(u["Pasajeros"], km_total, horas_total, km_base_origen)
+        campos["KM Total"] = round(km_total, 2)
+        campos["Horas Total"] = round(horas_total, 2)
+        campos["KM Base"] = round(km_base_origen, 2)
+        campos["Cotizacion Estimada"] = tramos["estimado"]
+        return campos
+
+    def ruta_ida(geo_origen, geo_destino):
+        # route() ya entrega la polyline reducida a POLYLINE_MAX_PUNTOS
+        return route(geo_origen, geo_destino)
+
+    return [
+        Etapa("geo_origen", lambda: _coords(u, "Origen")),
+        Etapa("geo_destino", lambda: _coords(u, "Destino")),
+        Etapa("tramos", tramos, deps=["geo_origen", "geo_destino"]),
+        # Directions solo para la geometría que se dibuja en el mapa
+        # (opcional: sin polyline igual hay precio, solo falta el mapa)
+        Etapa("ruta_ida", ruta_ida, deps=["geo_origen", "geo_destino"], opcional=True),
+        Etapa("precio", precio, deps=["tramos"]),
+    ]
+
+
+def calcular_cotizacion(u: dict, precalculo: dict | None = None, limite: float | None = None) -> dict:
+    """
+    Calcula rutas, mapa y precio del usuario como un grafo de etapas:
+
+        geo_origen ─┬─ ruta_ida ── mapa        (directions: solo la polyline)
+        geo_destino ┴─ tramos ──── precio      (matrix: ida, vuelta y base)
+
+    Las etapas independientes corren en paralelo, así la latencia total queda
+    cerca de la rama más lenta. Si viene un `precalculo` (ver iniciar_precalculo)
+    solo queda generar el mapa. `limite` (time.perf_counter) es el deadline ya
+    en curso si antes se esperó el precálculo; si no, COTIZACION_DEADLINE_S.
+    Escribe los resultados en `u` y retorna los tiempos por etapa (ms). Si
+    falla una etapa obligatoria, relanza el error.
+    """
+    cot_id = u.get("cotizacion_id", "SINID")
+
+    def mapa(geo_origen, geo_destino, ruta_ida):
+        if not ruta_ida:
+            return ""
+        return generar_mapa_static(geo_origen, geo_destino, ruta_ida[2], cot_id)
+
+    if precalculo:
+        base = {
+            "geo_origen": tuple(precalculo["geo_origen"]),
+            "geo_destino": tuple(precalculo["geo_destino"]),
+            "ruta_ida": tuple(precalculo["ruta_ida"]) if precalculo["ruta_ida"] else None,
+            "precio": dict(precalculo["precio"]),
+        }
+        etapas = [Etapa(n, lambda v=v: v) for n, v in base.items()]
+    else:
+        etapas = _etapas_ruta_precio(u)
+
+    etapas.append(Etapa("mapa", mapa, deps=["geo_origen", "geo_destino", "ruta_ida"], opcional=True))
+
+    deadline_s = COTIZACION_DEADLINE_S
+    if limite is not None:
+        deadline_s = max(0.001, limite - time.perf_counter())
+
+    resultados, tiempos = ejecutar_dag(etapas, deadline_s=deadline_s)
+
+    if precalculo:
+        tiempos["precalculo"] = precalculo.get("tiempos", {})
+
+    # ✅ Guardar para PDF
+    u.update(resultados["precio"])
+    u["Polyline Ida"] = resultados["ruta_ida"][2] if resultados["ruta_ida"] else ""
+    u["Mapa Ruta"] = resultados["mapa"] or ""
+    u["Tiempos Etapas"] = tiempos
+
+    if u["Mapa Ruta"]:
+        print("✅ Imagen mapa generada en:", u["Mapa Ruta"])
+    print("⏱️ Tiempos cotización (ms):", tiempos)
+
+    return tiempos
+
+
+# -------- Precálculo especulativo --------
+# Apenas se conocen origen y destino se calcula ruta y precio en background,
+# mientras el usuario escribe horarios y teléfono.
+#
+# El resultado se publica en un almacén compartido (el de sesiones, con clave
+# "<wa_id>:precalculo") desde el mismo hilo del precálculo: el mensaje que lo
+# usa puede caer en otro worker o proceso. Va aparte de la sesión porque
+# escribir la sesión entera desde acá podría pisar cambios de otro proceso.
+
+PRECALCULO_WORKERS = int(os.getenv("PRECALCULO_WORKERS", "4"))
+# Cada cuánto se mira el almacén mientras otro proceso termina el precálculo
+PRECALCULO_SONDEO_S = float(os.getenv("PRECALCULO_SONDEO_S", "0.25"))
+_PRECALCULOS_MAX = 1000
+
+_EJECUTOR_PRECALCULO = ThreadPoolExecutor(max_workers=PRECALCULO_WORKERS, thread_name_prefix="precalculo")
+
+# clave (wa_id) -> (huella, Future). Solo para esperar sin sondear en el proceso
+# que lanzó el cálculo; lo que vale para todos es lo publicado en _almacen.
+_precalculos = {}
+_precalculos_lock = threading.Lock()
+
+# Sin usar_almacen(): dict del proceso (basta con un solo worker)
+_almacen = {}
+
+_CAMPOS_HUELLA = ("Origen", "Destino", "Origen Lat", "Origen Lon", "Destino Lat", "Destino Lon", "Pasajeros")
+
+
+def usar_almacen(almacen):
+    """
+    Dónde se publican los precálculos: un mapping compartido entre workers
+    (ej: las Sesiones de bot.py con backend sqlite o redis).
+    """
+    global _almacen
+    _almacen = almacen
+
+
+def huella_precalculo(u: dict) -> str:
+    """
+    Identifica los datos de entrada del precálculo: si cambia cualquiera,
+    el resultado ya no sirve.
+    """
+    datos = [str(u.get(c, "")) for c in _CAMPOS_HUELLA]
+    return hashlib.sha1("|".join(datos).encode("utf-8")).hexdigest()
+
+
+def _clave_almacen(clave) -> str:
+    return f"{clave}:precalculo"
+
+
+def _leer_publicado(clave) -> dict | None:
+    k = _clave_almacen(clave)
+    if hasattr(_almacen, "refrescar"):
+        _almacen.refrescar(k)  # otro proceso pudo haberlo escrito
+    return _almacen.get(k)
+
+
+def _publicar(clave, huella: str, datos: dict, solo_si_vigente: bool = True):
+    """
+    Publica el estado del precálculo. Un cálculo que terminó tarde no pisa
+    al que lo reemplazó (otra huella) ni revive uno invalidado.
+    """
+    if solo_si_vigente:
+        actual = _leer_publicado(clave)
+        if not actual or actual.get("huella") != huella:
+            return
+    _almacen[_clave_almacen(clave)] = {"huella": huella, **datos}
+
+
+def _precalcular(u: dict) -> dict:
+    resultados, tiempos = ejecutar_dag(_etapas_ruta_precio(u), deadline_s=COTIZACION_DEADLINE_S)
+    return {
+        "huella": huella_precalculo(u),
+        "geo_origen": list(resultados["geo_origen"]),
+        "geo_destino": list(resultados["geo_destino"]),
+        "ruta_ida": list(resultados["ruta_ida"]) if resultados["ruta_ida"] else None,
+        "precio": resultados["precio"],
+        "tiempos": tiempos,
+    }
+
+
+def _precalcular_y_publicar(clave, u: dict) -> dict:
+    huella = huella_precalculo(u)
+    try:
+        pre = _precalcular(u)
+    except Exception:
+        _publicar(clave, huella, {"estado": "fallo"})
+        raise
+    _publicar(clave, huella, {**pre, "estado": "listo"})
+    return pre
+
+
+def _en_curso_vencido(pub: dict) -> bool:
+    # El precálculo tiene su propio deadline: pasado eso, el proceso que lo
+    # lanzó murió o se reinició sin publicar
+    return time.time() - pub.get("inicio", 0) > COTIZACION_DEADLINE_S + 5
+
+
+def iniciar_precalculo(clave, u: dict):
+    """
+    Lanza en background geocoding + rutas + pricing para la sesión `u`.
+    """
+    if not u.get("Origen") or not u.get("Destino") or not u.get("Pasajeros"):
+        return
+
+    snapshot = {c: u[c] for c in _CAMPOS_HUELLA if c in u}
+    huella = huella_precalculo(snapshot)
+
+    with _precalculos_lock:
+        previo = _precalculos.get(clave)
+        if previo and previo[0] == huella:
+            return
+
+    # Ya listo o en curso (quizás en otro proceso) con los mismos datos
+    pub = _leer_publicado(clave)
+    if pub and pub.get("huella") == huella:
+        if pub.get("estado") == "listo" or (pub.get("estado") == "en_curso" and not _en_curso_vencido(pub)):
+            return
+
+    with _precalculos_lock:
+        previo = _precalculos.get(clave)
+        if previo:
+            previo[1].cancel()
+
+        _publicar(clave, huella, {"estado": "en_curso", "inicio": time.time()}, solo_si_vigente=False)
+        _precalculos[clave] = (huella, _EJECUTOR_PRECALCULO.submit(_precalcular_y_publicar, clave, snapshot))
+
+        while len(_precalculos) > _PRECALCULOS_MAX:
+            _precalculos.pop(next(iter(_precalculos)))
+
+    print("🔮 Precálculo iniciado:", clave)
+
+
+def obtener_precalculo(clave, u: dict, limite: float | None = None) -> dict | None:
+    """
+    Retorna el precálculo válido para los datos actuales de `u`, esperando
+    si todavía está en curso (aquí o en otro proceso) hasta `limite`
+    (time.perf_counter; por defecto COTIZACION_DEADLINE_S desde ahora).
+    None si no hay o falló.
+    """
+    huella = huella_precalculo(u)
+    if limite is None:
+        limite = time.perf_counter() + COTIZACION_DEADLINE_S
+
+    with _precalculos_lock:
+        previo = _precalculos.pop(clave, None)
+
+    pre = None
+    if previo and previo[0] == huella:
+        try:
+            pre = previo[1].result(timeout=max(0.0, limite - time.perf_counter()))
+        except Exception as e:
+            print("⚠️ Precálculo no disponible:", repr(e))
+            return None
+    else:
+        while True:
+            pub = _leer_publicado(clave)
+            if not pub or pub.get("huella") != huella or pub.get("estado") == "fallo":
+                return None
+            if pub.get("estado") == "listo":
+                pre = pub
+                break
+            if _en_curso_vencido(pub) or time.perf_counter() + PRECALCULO_SONDEO_S >= limite:
+                print("⚠️ Precálculo no disponible: sigue en curso")
+                return None
+            time.sleep(PRECALCULO_SONDEO_S)
+
+    # Si el precálculo tuvo que estimar (ORS caído), se reintenta la ruta exacta
+    if pre["precio"].get("Cotizacion Estimada"):
+        return None
+    return pre
+
+
+def precalculo_listo(clave, u: dict) -> bool:
+    """
+    True si ya hay un precálculo terminado (sin esperar).
+    """
+    huella = huella_precalculo(u)
+    with _precalculos_lock:
+        previo = _precalculos.get(clave)
+    if previo and previo[0] == huella and previo[1].done():
+        return True
+    pub = _leer_publicado(clave)
+    return bool(pub and pub.get("huella") == huella and pub.get("estado") == "listo")
+
+
+def estimar_cotizacion(u: dict) -> dict | None:
+    """
+    Precio aproximado al instante con el estimador offline, solo si las
+    coordenadas se conocen sin red. Retorna {"Precio", "Precio Min", "Precio Max",
+    "Vehiculo"} o None.
+    """
+    geo_o = _coords_locales(u, "Origen")
+    geo_d = _coords_locales(u, "Destino")
+    if not geo_o or not geo_d or not u.get("Pasajeros"):
+        return None
+
+    ida = estimar_ruta(geo_o, geo_d)
+    vuelta = estimar_ruta(geo_d, geo_o)
+    base = estimar_ruta(SEDE_PENAFLOR, geo_o)
+
+    def precio_para(factor):
+        km_total = (ida["km"] + vuelta["km"]) * factor
+        horas_total = ida["horas"] + vuelta["horas"]
+        km_base = base["km"] * factor if km_total < KM_UMBRAL_CORTO else 0
+        return calcular_precio_usuario(u["Pasajeros"], km_total, horas_total, km_base)
+
+    banda = ida["banda"]
+    central = precio_para(1.0)
+    return {
+        "Precio": central["Precio"],
+        "Precio Min": precio_para(math.exp(-banda))["Precio"],
+        "Precio Max": precio_para(math.exp(banda))["Precio"],
+        "Vehiculo": central["Vehiculo"],
+    }
+
+
+def invalidar_precalculo(clave, u: dict | None = None):
+    with _precalculos_lock:
+        previo = _precalculos.pop(clave, None)
+    if previo:
+        previo[1].cancel()
+    _almacen.pop(_clave_almacen(clave), None)
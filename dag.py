@@ -0,0 +1,137 @@
+# dag.py
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import http_client
+
+
+DAG_MAX_WORKERS = int(os.getenv("DAG_MAX_WORKERS", "8"))
+
+# Pool compartido: las etapas son casi todas I/O (Mapbox, ORS)
+_EJECUTOR = ThreadPoolExecutor(max_workers=DAG_MAX_WORKERS, thread_name_prefix="dag")
+
+
+class DeadlineExcedido(Exception):
+    pass
+
+
+class Etapa:
+    """
+    Nodo del grafo.
+    - fn recibe como kwargs los resultados de sus dependencias.
+    - opcional=True: si falla, su resultado queda en None y el grafo sigue.
+    """
+
+    def __init__(self, nombre: str, fn, deps: list[str] | None = None, opcional: bool = False):
+        self.nombre = nombre
+        self.fn = fn
+        self.deps = list(deps or [])
+        self.opcional = opcional
+
+
+def _validar(etapas: list[Etapa]) -> dict:
+    por_nombre = {}
+    for e in etapas:
+        if e.nombre in por_nombre:
+            raise ValueError(f"Etapa duplicada: {e.nombre}")
+        por_nombre[e.nombre] = e
+
+    for e in etapas:
+        for d in e.deps:
+            if d not in por_nombre:
+                raise ValueError(f"Etapa {e.nombre} depende de {d}, que no existe")
+
+    # Detectar ciclos (Kahn)
+    pendientes = {e.nombre: set(e.deps) for e in etapas}
+    listas = [n for n, d in pendientes.items() if not d]
+    vistos = 0
+    while listas:
+        n = listas.pop()
+        vistos += 1
+        for m, d in pendientes.items():
+            if n in d:
+                d.discard(n)
+                if not d:
+                    listas.append(m)
+    if vistos != len(etapas):
+        raise ValueError("El grafo de etapas tiene un ciclo")
+
+    return por_nombre
+
+
+def _correr(etapa: Etapa, kwargs: dict, limite: float | None):
+    # Las llamadas HTTP de la etapa no pasan del deadline: si se vence, la
+    # etapa falla por timeout y libera su hilo del pool compartido
+    t0 = time.perf_counter()
+    try:
+        with http_client.con_limite(limite):
+            return etapa.fn(**kwargs), None, t0, time.perf_counter()
+    except Exception as e:
+        return None, e, t0, time.perf_counter()
+
+
+def ejecutar_dag(etapas: list[Etapa], deadline_s: float | None = None):
+    """
+    Ejecuta las etapas en paralelo respetando dependencias.
+    Retorna (resultados, tiempos_ms). Si una etapa obligatoria falla se relanza
+    su excepción; si se pasa el deadline se lanza DeadlineExcedido.
+    """
+    por_nombre = _validar(etapas)
+
+    inicio = time.perf_counter()
+    limite = inicio + deadline_s if deadline_s else None
+
+    resultados = {}
+    tiempos = {}
+    en_vuelo = {}
+    lanzadas = set()
+
+    def lanzar_listas():
+        for e in etapas:
+            if e.nombre in lanzadas:
+                continue
+            if all(d in resultados for d in e.deps):
+                kwargs = {d: resultados[d] for d in e.deps}
+                en_vuelo[_EJECUTOR.submit(_correr, e, kwargs, limite)] = e
+                lanzadas.add(e.nombre)
+
+    lanzar_listas()
+
+    while en_vuelo:
+        timeout = None
+        if limite is not None:
+            timeout = limite - time.perf_counter()
+            if timeout <= 0:
+                break
+
+        listos, _ = wait(list(en_vuelo), timeout=timeout, return_when=FIRST_COMPLETED)
+        if not listos:
+            break
+
+        for fut in listos:
+            etapa = en_vuelo.pop(fut)
+            valor, error, t0, t1 = fut.result()
+            tiempos[etapa.nombre] = round((t1 - t0) * 1000, 1)
+
+            if error is not None:
+                if not etapa.opcional:
+                    for f in en_vuelo:
+                        f.cancel()
+                    raise error
+                print(f"⚠️ Etapa opcional {etapa.nombre} falló:", error)
+                valor = None
+
+            resultados[etapa.nombre] = valor
+
+        lanzar_listas()
+
+    if len(resultados) != len(por_nombre):
+        for f in en_vuelo:
+            f.cancel()
+        faltan = [n for n in por_nombre if n not in resultados]
+        raise DeadlineExcedido(f"Deadline de {deadline_s}s excedido, faltan etapas: {faltan}")
+
+    tiempos["total"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultados, tiempos
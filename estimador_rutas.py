@@ -0,0 +1,172 @@
+# estimador_rutas.py
+
+import math
+
+import numpy as np
+
+
+RADIO_TIERRA_KM = 6371.0088
+
+# Valores por defecto si todavía no hay rutas ORS para ajustar
+FACTOR_DESVIO_DEFAULT = 1.35
+VELOCIDAD_DEFAULT_KMH = 45.0
+BANDA_DEFAULT = 0.25
+
+# Mínimo de rutas para confiar en el ajuste de un par de comunas
+MIN_MUESTRAS_PAR = 3
+
+# Más allá de esto el punto no se asigna a ninguna comuna conocida
+RADIO_COMUNA_KM = 25.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia en línea recta (km). Acepta escalares o arrays de numpy.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(a))
+
+
+def _haversine_escalar(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a))
+
+
+class _Modelo:
+    __slots__ = ("factor", "velocidad", "banda", "muestras")
+
+    def __init__(self, factor, velocidad, banda, muestras):
+        self.factor = factor
+        self.velocidad = velocidad
+        self.banda = banda
+        self.muestras = muestras
+
+
+class EstimadorRutas:
+    """
+    Estimador offline de distancia/duración por carretera:
+
+        km    = haversine * factor_desvio(par de comunas)
+        horas = km / velocidad(par de comunas)
+
+    Se ajusta con rutas ORS ya calculadas (vectorizado con numpy). Cada punto se
+    asigna a la comuna con centroide más cercano; los pares con pocas rutas
+    usan el ajuste global. La banda de error sale de la dispersión del factor.
+    """
+
+    def __init__(self, centroides: dict):
+        self.nombres = list(centroides)
+        coords = np.array([centroides[n] for n in self.nombres], dtype=float).reshape(-1, 2)
+        self._c_lat = coords[:, 0]
+        self._c_lon = coords[:, 1]
+        self._centroides = [tuple(c) for c in coords.tolist()]
+
+        self.global_ = _Modelo(FACTOR_DESVIO_DEFAULT, VELOCIDAD_DEFAULT_KMH, BANDA_DEFAULT, 0)
+        self.pares = {}
+
+    def _comunas(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """
+        Índice de la comuna más cercana para cada punto (-1 si ninguna cerca).
+        """
+        if not self.nombres:
+            return np.full(len(lat), -1)
+        d = haversine_km(lat[:, None], lon[:, None], self._c_lat[None, :], self._c_lon[None, :])
+        idx = d.argmin(axis=1)
+        idx[d[np.arange(len(lat)), idx] > RADIO_COMUNA_KM] = -1
+        return idx
+
+    def _comuna(self, lat: float, lon: float) -> int:
+        mejor, mejor_d = -1, RADIO_COMUNA_KM
+        for i, (clat, clon) in enumerate(self._centroides):
+            d = _haversine_escalar(lat, lon, clat, clon)
+            if d <= mejor_d:
+                mejor, mejor_d = i, d
+        return mejor
+
+    def ajustar(self, muestras) -> int:
+        """
+        muestras: iterable de (lat_o, lon_o, lat_d, lon_d, km, horas).
+        Retorna cuántas muestras válidas se usaron.
+        """
+        a = np.array(list(muestras), dtype=float).reshape(-1, 6)
+        if len(a) == 0:
+            return 0
+
+        lat_o, lon_o, lat_d, lon_d, km, horas = a.T
+        recta = haversine_km(lat_o, lon_o, lat_d, lon_d)
+
+        # Tramos muy cortos o datos raros distorsionan el factor
+        ok = (recta > 0.3) & (km > 0) & (horas > 0) & (km >= recta * 0.95)
+        if not ok.any():
+            return 0
+
+        lat_o, lon_o, lat_d, lon_d, km, horas, recta = (x[ok] for x in (lat_o, lon_o, lat_d, lon_d, km, horas, recta))
+        log_f = np.log(km / recta)
+
+        def modelo(mask_log_f, mask_km, mask_horas):
+            n = len(mask_log_f)
+            banda = float(np.std(mask_log_f)) if n > 1 else BANDA_DEFAULT
+            return _Modelo(
+                float(np.exp(mask_log_f.mean())),
+                float(mask_km.sum() / mask_horas.sum()),
+                max(0.05, banda),
+                n,
+            )
+
+        self.global_ = modelo(log_f, km, horas)
+
+        # Por par de comunas: sumas con bincount (sin loops por muestra)
+        n_c = len(self.nombres)
+        co = self._comunas(lat_o, lon_o)
+        cd = self._comunas(lat_d, lon_d)
+        validos = (co >= 0) & (cd >= 0)
+        par = co[validos] * n_c + cd[validos]
+
+        self.pares = {}
+        if len(par):
+            tam = n_c * n_c
+            n = np.bincount(par, minlength=tam)
+            s_log = np.bincount(par, weights=log_f[validos], minlength=tam)
+            s_log2 = np.bincount(par, weights=log_f[validos] ** 2, minlength=tam)
+            s_km = np.bincount(par, weights=km[validos], minlength=tam)
+            s_h = np.bincount(par, weights=horas[validos], minlength=tam)
+
+            for p in np.nonzero(n >= MIN_MUESTRAS_PAR)[0]:
+                media = s_log[p] / n[p]
+                var = max(0.0, s_log2[p] / n[p] - media ** 2)
+                self.pares[(int(p) // n_c, int(p) % n_c)] = _Modelo(
+                    float(math.exp(media)),
+                    float(s_km[p] / s_h[p]),
+                    max(0.05, math.sqrt(var)),
+                    int(n[p]),
+                )
+
+        return int(ok.sum())
+
+    def estimar(self, origen, destino) -> dict:
+        """
+        Retorna km, horas y banda de error (km_min/km_max) para el tramo.
+        """
+        lat_o, lon_o = float(origen[0]), float(origen[1])
+        lat_d, lon_d = float(destino[0]), float(destino[1])
+
+        recta = _haversine_escalar(lat_o, lon_o, lat_d, lon_d)
+
+        m = self.pares.get((self._comuna(lat_o, lon_o), self._comuna(lat_d, lon_d)))
+        fuente = "par_comunas"
+        if m is None:
+            m = self.global_
+            fuente = "global" if m.muestras else "default"
+
+        km = recta * m.factor
+        return {
+            "km": km,
+            "horas": km / m.velocidad,
+            "km_min": km * math.exp(-m.banda),
+            "km_max": km * math.exp(m.banda),
+            "banda": m.banda,
+            "muestras": m.muestras,
+            "fuente": fuente,
+        }
@@ -0,0 +1,229 @@
+# gazetteer.py
+#
+# Gazetteer offline (comunas, calles, POIs) en un archivo binario compacto que
+# se abre con mmap: todos los workers de gunicorn comparten la misma copia vía
+# page cache del sistema operativo en vez de tener cada uno un dict en memoria.
+#
+# Formato (little endian):
+#   magic    8 bytes   b"ECOGAZ1\0"
+#   n        uint32    cantidad de filas (nombre + coordenada)
+#   blob_len uint32    largo del bloque de strings
+#   offsets  uint32[n + 1]   inicio del nombre de cada fila dentro del blob
+#   coords   float32[n * 2]  lat, lon por fila
+#   blob     utf-8           nombres normalizados, ordenados por bytes (con repetidos)
+#
+# Construir:
+#   python gazetteer.py build data/gazetteer.bin dataset.csv [otro.csv ...]
+# Cada CSV con columnas: nombre,lat,lon (ej: export de OSM o INE).
+# Siempre se incluyen lugares_conocidos, comunas_rm y las comunas de maps.py.
+#
+# Un nombre puede repetirse (la misma calle en varias comunas): se guardan
+# todas las filas, salvo las que quedan a menos de MISMO_LUGAR_KM de una ya
+# guardada (tramos de la misma calle). buscar() solo responde nombres únicos.
+
+import csv
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from estimador_rutas import _haversine_escalar
+from indice_lugares import normalizar
+
+
+MAGIC = b"ECOGAZ1\0"
+_HEADER = struct.Struct("<8sII")
+_PAR_U32 = struct.Struct("<II")
+_PAR_F32 = struct.Struct("<ff")
+
+# float32 da ~1 m de precisión; no mostrar decimales que no existen
+DECIMALES = 5
+
+# Filas con el mismo nombre más cerca que esto son el mismo lugar
+MISMO_LUGAR_KM = float(os.getenv("GAZETTEER_MISMO_LUGAR_KM", "1.0"))
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.bin")
+)
+
+
+def _en_chile(lat: float, lon: float) -> bool:
+    return (-56 <= lat <= -17) and (-75 <= lon <= -66)
+
+
+class Gazetteer:
+    """
+    Lector del archivo: búsqueda exacta y por prefijo con bisección sobre
+    los nombres ordenados, sin cargar nada a memoria del proceso.
+    """
+
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n, blob_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Archivo gazetteer inválido: {path}")
+
+        self.n = n
+        self._offsets = _HEADER.size
+        self._coords = self._offsets + 4 * (n + 1)
+        self._blob = self._coords + 8 * n
+
+        if self._blob + blob_len > len(self._mm):
+            raise ValueError(f"Archivo gazetteer truncado: {path}")
+
+    def __len__(self):
+        return self.n
+
+    def _nombre(self, i: int) -> bytes:
+        a, b = _PAR_U32.unpack_from(self._mm, self._offsets + 4 * i)
+        return self._mm[self._blob + a:self._blob + b]
+
+    def _coord(self, i: int):
+        lat, lon = _PAR_F32.unpack_from(self._mm, self._coords + 8 * i)
+        return round(lat, DECIMALES), round(lon, DECIMALES)
+
+    def _cota_inferior(self, clave: bytes) -> int:
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._nombre(mid) < clave:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def todos(self, nombre: str) -> list[tuple]:
+        """
+        Todas las filas con ese nombre exacto (normalizado): [(lat, lon), ...].
+        """
+        clave = normalizar(nombre).encode("utf-8")
+        if not clave:
+            return []
+        out = []
+        i = self._cota_inferior(clave)
+        while i < self.n and self._nombre(i) == clave:
+            out.append(self._coord(i))
+            i += 1
+        return out
+
+    def buscar(self, nombre: str):
+        """
+        Match exacto (normalizado). Retorna (lat, lon), o None si no está o si
+        el nombre es ambiguo (varias filas: ver todos()).
+        """
+        hits = self.todos(nombre)
+        return hits[0] if len(hits) == 1 else None
+
+    def prefijo(self, texto: str, limit: int = 10) -> list[tuple]:
+        """
+        Nombres que empiezan con `texto`: [(nombre, lat, lon), ...] en orden.
+        """
+        clave = normalizar(texto).encode("utf-8")
+        if not clave:
+            return []
+        out = []
+        i = self._cota_inferior(clave)
+        while i < self.n and len(out) < limit:
+            nombre = self._nombre(i)
+            if not nombre.startswith(clave):
+                break
+            out.append((nombre.decode("utf-8"), *self._coord(i)))
+            i += 1
+        return out
+
+    def cerrar(self):
+        self._mm.close()
+        self._f.close()
+
+
+def construir(entradas, path: str) -> int:
+    """
+    entradas: iterable de (nombre, lat, lon). Un nombre repetido se guarda una
+    vez por lugar distinto (a MISMO_LUGAR_KM o más de los anteriores).
+    Retorna cuántas filas quedaron en el archivo.
+    """
+    vistos = {}  # clave -> [(lat, lon), ...] en orden de llegada
+    for nombre, lat, lon in entradas:
+        clave = normalizar(nombre).encode("utf-8")
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            continue
+        if not clave or not _en_chile(lat, lon):
+            continue
+        lugares = vistos.setdefault(clave, [])
+        if any(_haversine_escalar(lat, lon, a, b) < MISMO_LUGAR_KM for a, b in lugares):
+            continue
+        lugares.append((lat, lon))
+
+    filas = [(k, c) for k in sorted(vistos) for c in vistos[k]]
+    n = len(filas)
+
+    offsets = array("I", [0])
+    for k, _ in filas:
+        offsets.append(offsets[-1] + len(k))
+    coords = array("f")
+    for _, c in filas:
+        coords.extend(c)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        coords.byteswap()
+    blob = b"".join(k for k, _ in filas)
+
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, n, len(blob)))
+        f.write(offsets.tobytes())
+        f.write(coords.tobytes())
+        f.write(blob)
+    # Reemplazo atómico: los workers con el archivo viejo abierto siguen bien
+    os.replace(tmp, path)
+
+    return n
+
+
+def _entradas_locales():
+    from lugares_conocidos import LUGARES_CONOCIDOS
+    from comunas_rm import COMUNAS_RM
+    from maps import COMUNAS_RM as COMUNAS_MAPS
+
+    for tabla in (LUGARES_CONOCIDOS, COMUNAS_RM, COMUNAS_MAPS):
+        for nombre, coords in tabla.items():
+            try:
+                lat, lon = coords
+            except (TypeError, ValueError):
+                continue
+            yield nombre, lat, lon
+
+
+def _entradas_csv(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        for fila in csv.DictReader(f):
+            yield fila.get("nombre") or fila.get("name"), fila.get("lat"), fila.get("lon")
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) < 2 or argv[0] != "build":
+        print("Uso: python gazetteer.py build salida.bin [dataset.csv ...]")
+        return 2
+
+    salida, csvs = argv[1], argv[2:]
+
+    def todas():
+        yield from _entradas_locales()
+        for p in csvs:
+            yield from _entradas_csv(p)
+
+    n = construir(todas(), salida)
+    print(f"✅ Gazetteer generado: {salida} ({n} filas, {os.path.getsize(salida)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,89 +1,289 @@
-# geocoding/geocoding_resolver.py
+# geocoding_resolver.py
+#
+# Resolver de direcciones por niveles (tiers). Cada nivel corta apenas tiene
+# un resultado confiable; los de más abajo son más caros:
+#
+#   exacto     -> diccionario de lugares conocidos (match exacto normalizado,
+#                 incluye los aprendidos de confirmaciones: lugares_aprendidos.py)
+#   fuzzy      -> lugares conocidos con match difuso (IndiceLugares, sin los
+#                 aprendidos)
+#   comuna     -> centroide de comuna (nombre exacto)
+#   gazetteer  -> gazetteer offline (mmap)
+#   cache      -> GEOCACHE (resultados de Mapbox anteriores)
+#   remoto     -> Mapbox
+#   comuna_parcial -> solo en candidatos(), si Mapbox falla: comuna mencionada
+#                     dentro del texto (geocode() no la usa, la cotización
+#                     queda PENDIENTE)
+#
+# Cada nivel lleva consultas, hits y un histograma de latencia (ver /metrics).
 
-import re
-import requests
 import os
+import threading
+import time
 
-from .lugares_conocidos import LUGARES_CONOCIDOS
-from .comunas_rm import COMUNAS_RM
+import maps
+from comunas_rm import COMUNAS_RM
+from indice_lugares import normalizar
 
-MAPBOX_TOKEN = os.getenv("MAPBOX_TOKEN")
+
+# Abreviaciones comunes: se expanden por token (no por substring)
+ABREVIACIONES = {
+    "av": "avenida",
+    "avda": "avenida",
+    "stgo": "santiago",
+    "rm": "region metropolitana",
+    "pje": "pasaje",
+    "psje": "pasaje",
+    "pob": "poblacion",
+}
+
+# Score mínimo del match difuso para cortar ahí (0.72 = umbral del índice)
+FUZZY_CONFIANZA = float(os.getenv("RESOLVER_FUZZY_CONFIANZA", "0.72"))
+
+# Límites de los buckets del histograma (ms)
+BUCKETS_MS = (0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
 
 
 def normalizar_texto(texto: str) -> str:
-    texto = texto.lower().strip()
+    """
+    Normaliza (tildes, signos, espacios) y expande abreviaciones por token:
+    "Av. Pajaritos, Stgo" -> "avenida pajaritos santiago".
+    """
+    return " ".join(ABREVIACIONES.get(t, t) for t in normalizar(texto).split())
 
-    reemplazos = {
-        "av ": "avenida ",
-        "av.": "avenida ",
-        "stgo": "santiago",
-        "rm": "region metropolitana",
-        "metro ": "",
-        "mall ": "mall ",
-    }
 
-    for k, v in reemplazos.items():
-        texto = texto.replace(k, v)
+class Tier:
+    """
+    Contadores y histograma de latencia de un nivel del resolver.
+    """
 
-    texto = re.sub(r"\s+", " ", texto)
-    return texto
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.consultas = 0
+        self.hits = 0
+        self.errores = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self._lock = threading.Lock()
 
+    def registrar(self, ms: float, hit: bool, error: bool = False):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        with self._lock:
+            self.consultas += 1
+            self.hits += hit
+            self.errores += error
+            self.total_ms += ms
+            self.buckets[i] += 1
 
-def geocode_mapbox(query: str):
-    url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{query}.json"
+    def stats(self) -> dict:
+        with self._lock:
+            etiquetas = [f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+            return {
+                "consultas": self.consultas,
+                "hits": self.hits,
+                "errores": self.errores,
+                "hit_rate": round(self.hits / self.consultas, 4) if self.consultas else 0.0,
+                "latencia_media_ms": round(self.total_ms / self.consultas, 3) if self.consultas else 0.0,
+                "latencia_ms": dict(zip(etiquetas, self.buckets)),
+            }
 
-    params = {
-        "access_token": MAPBOX_TOKEN,
-        "country": "cl",
-        "limit": 1,
-        "types": "address,poi,place",
-        "bbox": "-70.9,-33.8,-70.3,-33.2"  # Región Metropolitana
-    }
 
-    r = requests.get(url, params=params, timeout=10)
-    r.raise_for_status()
-    data = r.json()
+class Resolver:
+    """
+    Pipeline único para maps.geocode, maps.geocode_local y maps.geocode_candidates.
+    """
 
-    if not data.get("features"):
-        raise ValueError("Mapbox sin resultados")
+    NIVELES = ("exacto", "fuzzy", "comuna", "gazetteer", "cache", "remoto", "comuna_parcial")
 
-    lon, lat = data["features"][0]["center"]
-    return lat, lon
+    def __init__(self):
+        self.tiers = {n: Tier(n) for n in self.NIVELES}
+        self.resoluciones = 0
+        self.sin_resultado = 0
+        self._lock = threading.Lock()
 
+        # maps.COMUNAS_RM primero: son las coordenadas ajustadas a mano
+        self.comunas = {}
+        for tabla in (maps.COMUNAS_RM, COMUNAS_RM):
+            for nombre, coords in tabla.items():
+                self.comunas.setdefault(normalizar(nombre), tuple(coords))
 
-def fallback_comuna(texto: str):
-    for comuna, coords in COMUNAS_RM.items():
-        if comuna in texto:
-            return coords
-    raise ValueError("No se encontró comuna")
+    # --- niveles locales: retornan (lat, lon, nombre, score) o None ---
+    def _exacto(self, texto, norm):
+        variantes = [texto] if norm == normalizar(texto) else [texto, norm]
+        for v in variantes:
+            hit = maps.INDICE_LUGARES.exacto(v) or maps.lugar_aprendido(v)
+            if hit:
+                return hit
+        return None
 
+    def _fuzzy(self, texto, norm):
+        hit = maps.INDICE_LUGARES.buscar(norm)
+        if hit and hit[3] >= FUZZY_CONFIANZA:
+            return hit
+        return None
 
-def resolver_direccion(texto_original: str):
-    if not texto_original or len(texto_original.strip()) < 3:
-        raise ValueError("Dirección inválida")
+    def _comuna(self, texto, norm):
+        coords = self.comunas.get(normalizar(texto)) or self.comunas.get(norm)
+        if coords:
+            return coords[0], coords[1], norm, 1.0
+        return None
 
-    texto = normalizar_texto(texto_original)
+    def _gazetteer(self, texto, norm):
+        coords = maps._buscar_gazetteer(texto)
+        if coords:
+            return coords[0], coords[1], norm, 1.0
+        return None
 
-    # 1️⃣ Diccionario interno
-    if texto in LUGARES_CONOCIDOS:
-        return LUGARES_CONOCIDOS[texto]
+    def _comuna_parcial(self, texto, norm):
+        """
+        Comuna mencionada dentro del texto ("Los Leones 123, Providencia").
+        Gana la de nombre más largo ("san jose de maipo" antes que "maipo").
+        """
+        p = f" {norm} "
+        mejor = None
+        for nombre, coords in self.comunas.items():
+            if f" {nombre} " in p and (mejor is None or len(nombre) > len(mejor[2])):
+                mejor = (coords[0], coords[1], nombre, 0.5)
+        return mejor
 
-    # 2️⃣ Mapbox contextualizado a RM
-    try:
-        query = f"{texto}, region metropolitana, chile"
-        return geocode_mapbox(query)
-    except Exception:
-        pass
+    def _medir(self, nivel: str, fn, *args, contar: bool = True):
+        t0 = time.perf_counter()
+        try:
+            out = fn(*args)
+        except Exception:
+            if contar:
+                self.tiers[nivel].registrar((time.perf_counter() - t0) * 1000, False, error=True)
+            raise
+        if contar:
+            self.tiers[nivel].registrar((time.perf_counter() - t0) * 1000, bool(out))
+        return out
 
-    # 3️⃣ Fallback por comuna
-    try:
-        return fallback_comuna(texto)
-    except Exception:
-        pass
+    def _locales(self, texto, norm, contar: bool):
+        maps.sincronizar_aprendidos()
+        for nivel, fn in (("exacto", self._exacto), ("fuzzy", self._fuzzy),
+                          ("comuna", self._comuna), ("gazetteer", self._gazetteer)):
+            hit = self._medir(nivel, fn, texto, norm, contar=contar)
+            if hit:
+                return nivel, hit
+        return None, None
+
+    def _contar_resolucion(self, ok: bool):
+        with self._lock:
+            self.resoluciones += 1
+            self.sin_resultado += not ok
+
+    # --- API ---
+    def geocode_local(self, texto: str):
+        """
+        Solo niveles sin red (no cuenta en las métricas). (lat, lon) o None.
+        """
+        if not texto:
+            return None
+        norm = normalizar_texto(texto)
+        _, hit = self._locales(texto, norm, contar=False)
+        if hit:
+            return hit[0], hit[1]
+        cached = maps.GEOCACHE.get(maps._clave_cache("geocode", texto), contar=False)
+        if cached:
+            return cached[0], cached[1]
+        return None
+
+    def geocode(self, texto: str):
+        """
+        (lat, lon) por el primer nivel que resuelva. Lanza excepción si ninguno.
+        """
+        if not texto:
+            raise ValueError("Dirección vacía")
+
+        norm = normalizar_texto(texto)
+
+        nivel, hit = self._locales(texto, norm, contar=True)
+        if hit:
+            lat, lon, k_match, score = hit
+            print(f"📍 Geocode ({nivel.upper()}):", texto, "=>", (lat, lon), "| match:", k_match, "| score:", round(score, 3))
+            self._contar_resolucion(True)
+            return lat, lon
+
+        cached = self._medir("cache", maps.GEOCACHE.get, maps._clave_cache("geocode", texto))
+        if cached:
+            print("📍 Geocode (CACHE):", texto, "=>", tuple(cached))
+            self._contar_resolucion(True)
+            return cached[0], cached[1]
+
+        # Sin fallback a comuna_parcial: si Mapbox falla la cotización queda
+        # PENDIENTE en vez de salir con el centro de la comuna
+        try:
+            lat, lon = self._medir("remoto", maps._geocode_mapbox, texto)
+        except Exception:
+            self._contar_resolucion(False)
+            raise
+        self._contar_resolucion(True)
+        return lat, lon
+
+    def candidatos(self, texto: str, limit: int = 3) -> list[dict]:
+        """
+        [{"name", "lat", "lon"}, ...]. Un nivel local confiable da un solo
+        candidato (no hace falta preguntar al usuario).
+        """
+        if not texto:
+            return []
+
+        norm = normalizar_texto(texto)
+
+        _, hit = self._locales(texto, norm, contar=True)
+        if hit:
+            self._contar_resolucion(True)
+            return [{"name": hit[2], "lat": hit[0], "lon": hit[1]}]
+
+        # Sirve si se guardó con un limit >= al pedido (los candidatos se
+        # acumulan en orden, así que el de limit menor es un prefijo)
+        cached = self._medir("cache", maps.GEOCACHE.get, maps._clave_cache("candidatos", texto))
+        if cached and (cached["limit"] >= limit or len(cached["items"]) < cached["limit"]):
+            self._contar_resolucion(True)
+            return [dict(c) for c in cached["items"][:limit]]
+
+        try:
+            out = self._medir("remoto", maps._candidatos_mapbox, texto, limit)
+        except Exception as e:
+            # Solo para mostrar: un candidato no fija coordenadas en el bot
+            hit = self._medir("comuna_parcial", self._comuna_parcial, texto, norm)
+            if not hit:
+                self._contar_resolucion(False)
+                raise
+            print("📍 Candidatos (COMUNA PARCIAL):", texto, "=>", hit[2], "| Mapbox:", e)
+            self._contar_resolucion(True)
+            return [{"name": hit[2], "lat": hit[0], "lon": hit[1]}]
+        self._contar_resolucion(bool(out))
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            resoluciones, sin_resultado = self.resoluciones, self.sin_resultado
+        remoto = self.tiers["remoto"].consultas
+        return {
+            "resoluciones": resoluciones,
+            "sin_resultado": sin_resultado,
+            "fraccion_remoto": round(remoto / resoluciones, 4) if resoluciones else 0.0,
+            "tiers": {n: t.stats() for n, t in self.tiers.items()},
+        }
+
+
+resolver = Resolver()
 
-    # 4️⃣ Error controlado
-    raise ValueError(f"No se pudo geocodificar: {texto_original}")
 
 def resolver_direccion(texto_original: str):
-    print("📍 Geocoding:", repr(texto_original))
+    """
+    (lat, lon) para una dirección. ValueError si no se puede resolver.
+    """
+    if not texto_original or len(texto_original.strip()) < 3:
+        raise ValueError("Dirección inválida")
+    try:
+        return resolver.geocode(texto_original)
+    except Exception as e:
+        raise ValueError(f"No se pudo geocodificar: {texto_original}") from e
+
 
+def stats() -> dict:
+    return resolver.stats()
@@ -0,0 +1,63 @@
+# grilla_lugares.py
+
+import math
+
+from estimador_rutas import _haversine_escalar
+
+
+KM_POR_GRADO_LAT = 111.32
+
+
+class GrillaLugares:
+    """
+    Índice espacial simple: celdas de `celda_km` de lado para encontrar el
+    lugar más cercano a una coordenada sin recorrer toda la lista.
+    """
+
+    def __init__(self, lugares: dict | None = None, celda_km: float = 1.0, lat_ref: float = -33.45):
+        self.celda_km = celda_km
+        self._d_lat = celda_km / KM_POR_GRADO_LAT
+        self._d_lon = celda_km / (KM_POR_GRADO_LAT * math.cos(math.radians(lat_ref)))
+        self._celdas = {}  # (i, j) -> [(nombre, lat, lon), ...]
+        self._n = 0
+
+        for nombre, coords in (lugares or {}).items():
+            self.agregar(nombre, coords)
+
+    def __len__(self):
+        return self._n
+
+    def _celda(self, lat: float, lon: float):
+        return math.floor(lat / self._d_lat), math.floor(lon / self._d_lon)
+
+    def agregar(self, nombre: str, coords) -> bool:
+        try:
+            lat, lon = coords
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return False
+        self._celdas.setdefault(self._celda(lat, lon), []).append((nombre, lat, lon))
+        self._n += 1
+        return True
+
+    def cercano(self, lat: float, lon: float, radio_km: float):
+        """
+        Retorna (nombre, distancia_km) del lugar más cercano dentro del radio, o None.
+        """
+        ci, cj = self._celda(lat, lon)
+        # Lejos de lat_ref las celdas ya no miden celda_km de ancho
+        km_lon = self._d_lon * KM_POR_GRADO_LAT * max(0.01, math.cos(math.radians(lat)))
+        anillos_i = math.ceil(radio_km / self.celda_km)
+        anillos_j = math.ceil(radio_km / km_lon)
+
+        mejor, mejor_d = None, radio_km
+        for i in range(ci - anillos_i, ci + anillos_i + 1):
+            for j in range(cj - anillos_j, cj + anillos_j + 1):
+                for nombre, plat, plon in self._celdas.get((i, j), ()):
+                    d = _haversine_escalar(lat, lon, plat, plon)
+                    if d < mejor_d or (mejor is None and d <= mejor_d):
+                        mejor, mejor_d = nombre, d
+
+        if mejor is None:
+            return None
+        return mejor, mejor_d
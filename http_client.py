@@ -0,0 +1,219 @@
+# http_client.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+HTTP_REINTENTOS = int(os.getenv("HTTP_REINTENTOS", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+
+STATUS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+# Presupuesto de tiempo (lectura, segundos) y si se reintenta POST por host.
+# POST solo se reintenta donde repetirlo no tiene efectos (ORS calcula, no envía nada).
+HOSTS = {
+    "graph.facebook.com": {"timeout": 10, "reintentar_post": False},
+    "api.mapbox.com": {"timeout": 15, "reintentar_post": False},
+    "api.openrouteservice.org": {"timeout": 30, "reintentar_post": True},
+    "api.brevo.com": {"timeout": 12, "reintentar_post": False},
+}
+HOST_DEFAULT = {"timeout": 15, "reintentar_post": False}
+
+
+_sesiones = {}  # (host, con reintentos) -> Session
+_lock = threading.Lock()
+_peticiones = {}
+_errores = {}
+
+# Deadline (time.perf_counter) de las peticiones de cada hilo, ver con_limite
+_local = threading.local()
+
+
+def _config(host: str) -> dict:
+    return HOSTS.get(host, HOST_DEFAULT)
+
+
+def _crear_sesion(host: str, reintentos: bool = True) -> requests.Session:
+    cfg = _config(host)
+
+    metodos = set(Retry.DEFAULT_ALLOWED_METHODS)
+    if cfg["reintentar_post"]:
+        metodos.add("POST")
+
+    retry = Retry(
+        total=HTTP_REINTENTOS if reintentos else 0,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=STATUS_REINTENTABLES,
+        allowed_methods=frozenset(metodos),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # el caller revisa status_code como siempre
+    )
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def _sesion(host: str, reintentos: bool = True) -> requests.Session:
+    clave = (host, reintentos)
+    s = _sesiones.get(clave)
+    if s is not None:
+        return s
+    with _lock:
+        s = _sesiones.get(clave)
+        if s is None:
+            s = _crear_sesion(host, reintentos)
+            _sesiones[clave] = s
+        return s
+
+
+def limite_actual() -> float | None:
+    return getattr(_local, "limite", None)
+
+
+@contextmanager
+def con_limite(limite: float | None):
+    """
+    Dentro del bloque, las peticiones de este hilo terminan antes de `limite`
+    (time.perf_counter): el timeout se recorta a lo que queda y solo se
+    reintenta si el backoff alcanza. Si ya hay un límite, vale el más cercano.
+    """
+    previo = limite_actual()
+    if previo is not None and (limite is None or previo < limite):
+        limite = previo
+    _local.limite = limite
+    try:
+        yield
+    finally:
+        _local.limite = previo
+
+
+def heredar_limite(fn):
+    """
+    `fn` con el límite del hilo que la crea, para pasarla a otro pool.
+    """
+    limite = limite_actual()
+    if limite is None:
+        return fn
+
+    def con_limite_heredado(*args, **kwargs):
+        with con_limite(limite):
+            return fn(*args, **kwargs)
+    return con_limite_heredado
+
+
+def _request_con_limite(method: str, url: str, host: str, limite: float, kwargs: dict) -> requests.Response:
+    """
+    Como la sesión con reintentos, pero cada intento con el timeout recortado
+    a lo que queda hasta `limite` y sin reintentar si el backoff no alcanza
+    (urllib3 reintenta sin mirar el reloj).
+    """
+    cfg = _config(host)
+    timeout = kwargs.pop("timeout")
+    conectar, leer = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    reintentar = method.upper() != "POST" or cfg["reintentar_post"]
+
+    intento = 0
+    while True:
+        queda = limite - time.perf_counter()
+        if queda <= 0:
+            raise requests.Timeout(f"Deadline excedido antes de llamar a {host}")
+
+        r = None
+        try:
+            r = _sesion(host, reintentos=False).request(
+                method, url, timeout=(min(conectar, queda), min(leer, queda)), **kwargs
+            )
+            if not reintentar or r.status_code not in STATUS_REINTENTABLES:
+                return r
+        except requests.ConnectionError:
+            # (un timeout de lectura ya usó lo que quedaba: no se reintenta)
+            if not reintentar or intento >= HTTP_REINTENTOS:
+                raise
+
+        espera = HTTP_BACKOFF * (2 ** intento)
+        if intento >= HTTP_REINTENTOS or time.perf_counter() + espera >= limite:
+            if r is not None:
+                return r
+            raise requests.Timeout(f"Deadline excedido reintentando {host}")
+        time.sleep(espera)
+        intento += 1
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Igual que requests.request, pero con conexión keep-alive por host,
+    reintentos con backoff en 429/5xx y timeout por host si no se pasa uno.
+    Dentro de con_limite, el timeout y los reintentos no pasan del deadline.
+    """
+    host = urlsplit(url).hostname or ""
+
+    if "timeout" not in kwargs:
+        kwargs["timeout"] = (HTTP_CONNECT_TIMEOUT, _config(host)["timeout"])
+
+    with _lock:
+        _peticiones[host] = _peticiones.get(host, 0) + 1
+
+    try:
+        limite = limite_actual()
+        if limite is not None:
+            return _request_con_limite(method, url, host, limite, kwargs)
+        return _sesion(host).request(method, url, **kwargs)
+    except Exception:
+        with _lock:
+            _errores[host] = _errores.get(host, 0) + 1
+        raise
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def stats() -> dict:
+    """
+    Por host: peticiones, conexiones nuevas y cuántas reutilizaron una conexión
+    abierta del pool (incluye reintentos).
+    """
+    out = {}
+    with _lock:
+        sesiones = dict(_sesiones)
+        peticiones = dict(_peticiones)
+        errores = dict(_errores)
+
+    nuevas = {}
+    enviadas = {}
+    for (host, _), s in sesiones.items():
+        adapter = s.get_adapter("https://")
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            nuevas[host] = nuevas.get(host, 0) + pool.num_connections
+            enviadas[host] = enviadas.get(host, 0) + pool.num_requests
+
+    for host in {h for h, _ in sesiones}:
+        nuevas.setdefault(host, 0)
+        out[host] = {
+            "peticiones": peticiones.get(host, 0),
+            "errores": errores.get(host, 0),
+            "conexiones_nuevas": nuevas[host],
+            "conexiones_reutilizadas": max(0, enviadas.get(host, 0) - nuevas[host]),
+        }
+
+    return out
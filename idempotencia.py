@@ -0,0 +1,173 @@
+# idempotencia.py
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from session_store import SESSION_BACKEND, REDIS_URL
+
+
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", SESSION_BACKEND)  # memory | sqlite | redis
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", "/tmp/ecobus_dedup.db")
+DEDUP_TTL_S = int(os.getenv("DEDUP_TTL_S", str(48 * 3600)))
+DEDUP_MAX = int(os.getenv("DEDUP_MAX", "100000"))
+
+
+class _Contadores:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0      # duplicados descartados
+        self.misses = 0    # mensajes nuevos
+
+    def registrar(self, nuevo: bool):
+        with self._lock:
+            if nuevo:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class VistosMemoria:
+    """
+    Set acotado con TTL + LRU, solo para un proceso.
+    """
+
+    def __init__(self, ttl_s: int = DEDUP_TTL_S, max_items: int = DEDUP_MAX):
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.contadores = _Contadores()
+
+    def es_nuevo(self, msg_id: str) -> bool:
+        ahora = time.time()
+        with self._lock:
+            ts = self._data.get(msg_id)
+            nuevo = ts is None or (ahora - ts) > self.ttl_s
+
+            if nuevo:
+                self._data[msg_id] = ahora
+            self._data.move_to_end(msg_id)
+
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+        self.contadores.registrar(nuevo)
+        return nuevo
+
+    def olvidar(self, msg_id: str):
+        """
+        Desmarca el id (falló el proceso): el reintento de Meta vuelve a entrar.
+        """
+        with self._lock:
+            self._data.pop(msg_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._data)
+        return {"backend": "memory", "items": n, **self.contadores.stats()}
+
+
+class VistosSQLite:
+    """
+    Set compartido entre workers vía SQLite (WAL). INSERT OR IGNORE es atómico,
+    así dos workers no pueden aceptar el mismo id.
+    """
+
+    _PURGA_CADA = 500
+
+    def __init__(self, path: str = DEDUP_DB_PATH, ttl_s: int = DEDUP_TTL_S, max_items: int = DEDUP_MAX):
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vistos (msg_id TEXT PRIMARY KEY, ts REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vistos_ts ON vistos (ts)")
+        self.contadores = _Contadores()
+
+    def es_nuevo(self, msg_id: str) -> bool:
+        ahora = time.time()
+        with self._lock:
+            # Un id expirado cuenta como nuevo
+            self._conn.execute("DELETE FROM vistos WHERE msg_id = ? AND ts < ?", (msg_id, ahora - self.ttl_s))
+            cur = self._conn.execute("INSERT OR IGNORE INTO vistos (msg_id, ts) VALUES (?, ?)", (msg_id, ahora))
+            nuevo = cur.rowcount == 1
+
+            if nuevo:
+                self._inserts += 1
+                if self._inserts % self._PURGA_CADA == 0:
+                    self._purgar(ahora)
+
+        self.contadores.registrar(nuevo)
+        return nuevo
+
+    def olvidar(self, msg_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM vistos WHERE msg_id = ?", (msg_id,))
+
+    def _purgar(self, ahora: float):
+        self._conn.execute("DELETE FROM vistos WHERE ts < ?", (ahora - self.ttl_s,))
+        self._conn.execute(
+            "DELETE FROM vistos WHERE msg_id IN ("
+            " SELECT msg_id FROM vistos ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+            (self.max_items,)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM vistos").fetchone()[0]
+        return {"backend": "sqlite", "items": n, **self.contadores.stats()}
+
+
+class VistosRedis:
+    """
+    Set compartido vía Redis: SET NX EX. El TTL lo maneja Redis y el tamaño
+    queda acotado por maxmemory/LRU del servidor.
+    """
+
+    def __init__(self, cliente=None, url: str = REDIS_URL, prefijo: str = "ecobus:msg:",
+                 ttl_s: int = DEDUP_TTL_S):
+        if cliente is None:
+            # ✅ Import “lazy”: redis es opcional
+            import redis
+            cliente = redis.Redis.from_url(url)
+
+        self.cliente = cliente
+        self.prefijo = prefijo
+        self.ttl_s = ttl_s
+        self.contadores = _Contadores()
+
+    def es_nuevo(self, msg_id: str) -> bool:
+        nuevo = bool(self.cliente.set(f"{self.prefijo}{msg_id}", "1", nx=True, ex=self.ttl_s))
+        self.contadores.registrar(nuevo)
+        return nuevo
+
+    def olvidar(self, msg_id: str):
+        self.cliente.delete(f"{self.prefijo}{msg_id}")
+
+    def stats(self) -> dict:
+        return {"backend": "redis", **self.contadores.stats()}
+
+
+def crear_dedup(backend: str = DEDUP_BACKEND):
+    if backend == "sqlite":
+        return VistosSQLite()
+    if backend == "redis":
+        return VistosRedis()
+    if backend == "memory":
+        return VistosMemoria()
+    raise ValueError(f"DEDUP_BACKEND inválido: {backend}")
@@ -0,0 +1,361 @@
+# indice_lugares.py
+
+import difflib
+import math
+import re
+from collections import Counter
+
+
+def _limpiar(s: str) -> str:
+    """
+    Igual que maps._clean_text: puede dejar un espacio en los bordes
+    (ej: "colegio x." -> "colegio x ").
+    """
+    s = (s or "").strip().lower()
+    s = (
+        s.replace("á", "a")
+        .replace("é", "e")
+        .replace("í", "i")
+        .replace("ó", "o")
+        .replace("ú", "u")
+        .replace("ñ", "n")
+    )
+    s = re.sub(r"[^\w\s]", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    return s
+
+
+def normalizar(s: str) -> str:
+    """
+    Misma normalización que maps._clean_text (tildes, ñ, signos, espacios),
+    sin espacios en los bordes.
+    """
+    return _limpiar(s).strip()
+
+
+def _trigramas(s: str) -> set[str]:
+    p = f" {s} "
+    return {p[i:i + 3] for i in range(len(p) - 2)}
+
+
+# Pesos del scoring (iguales al match lineal original)
+PESO_CONTENCION = 0.90
+PESO_JACCARD = 0.80
+PESO_FUZZY = 0.85
+UMBRAL_MINIMO = 0.72
+
+
+class IndiceLugares:
+    """
+    Índice de lugares conocidos para match difuso rápido, con el mismo
+    resultado que el match lineal original (maps._buscar_lugar_conocido):
+    contención (0.90) + Jaccard de tokens (0.80) + difflib (0.85), umbral 0.72,
+    y ante empate gana el primero cargado.
+
+    - Las claves se normalizan una sola vez al cargar.
+    - Las claves contenidas en la consulta (o que la contienen) siempre se
+      evalúan: se buscan por substring exacto, no por n-gramas.
+    - El resto sale de índices invertidos por token y por trigrama. Se cuentan
+      primero los n-gramas más raros, hasta `max_posting` entradas; los muy
+      frecuentes (ej: "colegio") solo se cuentan si hacen falta.
+    - Un candidato se descarta solo si una cota superior de su score (por los
+      tokens y trigramas que puede compartir) no alcanza al mejor hasta ahora.
+      Lo mismo para los que no aparecen en ninguna lista contada.
+    """
+
+    def __init__(self, lugares: dict | None = None, max_posting: int = 3000):
+        self.max_posting = max_posting
+
+        self._exactos = {}   # clave normalizada -> id
+        self._claves = []    # id -> clave normalizada
+        self._coords = []    # id -> (lat, lon)
+        self._tokens = []    # id -> set de tokens
+        self._repetidos = []  # id -> trigramas repetidos (largo - trigramas distintos)
+        self._largos = set()  # largos de clave que existen (para buscar substrings)
+        self._largo_min = 1
+        self._borrados = set()  # ids quitados (siguen en los índices invertidos)
+
+        self._por_token = {}
+        self._por_trigrama = {}
+
+        for nombre, coords in (lugares or {}).items():
+            self.agregar(nombre, coords)
+
+    def __len__(self):
+        return len(self._claves) - len(self._borrados)
+
+    def agregar(self, nombre: str, coords) -> bool:
+        """
+        Agrega (o actualiza) un lugar. Retorna False si las coords no son válidas.
+        """
+        k_norm = normalizar(nombre)
+        if not k_norm:
+            return False
+
+        try:
+            lat, lon = coords
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            print("⚠️ Lugar conocido con coordenadas inválidas, se ignora:", nombre, coords)
+            return False
+
+        if k_norm in self._exactos:
+            self._coords[self._exactos[k_norm]] = (lat, lon)
+            return True
+
+        idx = len(self._claves)
+        toks = set(k_norm.split())
+        tris = _trigramas(k_norm)
+
+        self._exactos[k_norm] = idx
+        self._claves.append(k_norm)
+        self._coords.append((lat, lon))
+        self._tokens.append(toks)
+        self._repetidos.append(len(k_norm) - len(tris))
+        self._largos.add(len(k_norm))
+        self._largo_min = min(self._largos)
+
+        for t in toks:
+            self._por_token.setdefault(t, []).append(idx)
+        for g in tris:
+            self._por_trigrama.setdefault(g, []).append(idx)
+
+        return True
+
+    def quitar(self, nombre: str) -> bool:
+        """
+        Quita un lugar. Queda en los índices invertidos pero ya no es candidato.
+        """
+        idx = self._exactos.pop(normalizar(nombre), None)
+        if idx is None:
+            return False
+        # Copia nueva en vez de .add(): las búsquedas en curso iteran la anterior
+        self._borrados = self._borrados | {idx}
+        return True
+
+    def _contencion(self, d: str, borrados: set) -> set[int]:
+        """
+        Ids de las claves contenidas en `d` o que contienen a `d`. Suman
+        PESO_CONTENCION, así que no se pueden podar por n-gramas compartidos.
+        """
+        ids = set()
+
+        # Contenidas en d: los substrings de d con largo de alguna clave
+        for n in self._largos:
+            for i in range(len(d) - n + 1):
+                idx = self._exactos.get(d[i:i + n])
+                if idx is not None:
+                    ids.add(idx)
+
+        # Las que contienen a d tienen todos sus trigramas (sin relleno)
+        tris = {d[i:i + 3] for i in range(len(d) - 2)}
+        if tris:
+            base = min((self._por_trigrama.get(g, ()) for g in tris), key=len)
+        else:
+            base = range(len(self._claves))  # consulta de 1-2 letras
+        ids.update(idx for idx in base if d in self._claves[idx])
+
+        return ids - borrados
+
+    def _cota(self, idx: int, n_d: int, n_dtoks: int, rep_d: int,
+              tokens: int, trigramas: int, contiene: bool) -> float:
+        """
+        Cota superior del score de `idx` si comparte a lo más `tokens` tokens y
+        `trigramas` trigramas con la consulta (n_d letras, n_dtoks tokens,
+        rep_d trigramas repetidos).
+
+        Para difflib: con una subsecuencia común de largo L, cada letra sin par
+        rompe a lo más 3 trigramas de un lado y cada hueco del otro lado 2, así
+        que trigramas >= 5L - 2(n_d + n_k) - repetidos, y ratio = 2M/(n_d + n_k)
+        con M <= L.
+        """
+        n_k = len(self._claves[idx])
+        total = n_d + n_k
+
+        cota = PESO_CONTENCION if contiene else 0.0
+        cota += min(1.0, tokens / max(n_dtoks, len(self._tokens[idx]), 1)) * PESO_JACCARD
+        ratio = min(
+            2 * min(n_d, n_k) / total,
+            0.8 + 2 * (trigramas + min(rep_d, self._repetidos[idx])) / (5 * total),
+        )
+        # Margen para el redondeo de los floats del score
+        return cota + ratio * PESO_FUZZY + 1e-9
+
+    def _cota_floja(self, n_d: int, n_dtoks: int, rep_d: int, tokens: int, trigramas: int) -> float:
+        """
+        Como _cota sin contención, para cualquier clave (n_k >= la más corta).
+        También sirve para las que no aparecen en ninguna lista contada.
+        """
+        total = n_d + self._largo_min
+        jaccard = min(1.0, tokens / max(n_dtoks, 1))
+        ratio = min(1.0, 0.8 + 2 * (trigramas + rep_d) / (5 * total))
+        return jaccard * PESO_JACCARD + ratio * PESO_FUZZY + 1e-9
+
+    def exacto(self, direccion: str):
+        """
+        Solo match exacto (normalizado). Retorna (lat, lon, key_match, 1.0) o None.
+        """
+        d_norm = normalizar(direccion)
+        idx = self._exactos.get(d_norm)
+        if idx is None:
+            return None
+        lat, lon = self._coords[idx]
+        return lat, lon, d_norm, 1.0
+
+    def buscar(self, direccion: str):
+        """
+        Retorna (lat, lon, key_match, score) o None.
+        """
+        # Como el original: contención sobre el texto limpio tal cual, difflib
+        # sobre el texto sin espacios en los bordes (_sim volvía a limpiar)
+        d_limpio = _limpiar(direccion)
+        if not d_limpio:
+            return None
+
+        # 1) exact match
+        idx = self._exactos.get(d_limpio)
+        if idx is not None:
+            lat, lon = self._coords[idx]
+            return lat, lon, d_limpio, 1.0
+
+        d_norm = d_limpio.strip()
+        dtoks = set(d_norm.split())
+        q_tris = _trigramas(d_norm)
+        rep_d = len(d_norm) - len(q_tris)
+
+        borrados = self._borrados
+        contenidos = self._contencion(d_limpio, borrados)
+
+        postings = []
+        for t in dtoks:
+            p = self._por_token.get(t)
+            if p:
+                postings.append((p, True))
+        for g in q_tris:
+            p = self._por_trigrama.get(g)
+            if p:
+                postings.append((p, False))
+        postings.sort(key=lambda x: len(x[0]))
+
+        conteo_tok = Counter()
+        conteo_tri = Counter()
+        tok_fuera = sum(es_token for _, es_token in postings)
+        tri_fuera = len(postings) - tok_fuera
+
+        estado = {"mejor": None, "evaluados": set()}
+        usados = 0
+
+        # Primero los n-gramas más raros; los comunes solo si la cota de los
+        # que no aparecieron todavía alcanza al mejor
+        for tope in (self.max_posting, None):
+            gastado = 0
+            while usados < len(postings):
+                p, es_token = postings[usados]
+                if tope is not None and gastado + len(p) > tope:
+                    break
+                if es_token:
+                    conteo_tok.update(p)
+                    tok_fuera -= 1
+                else:
+                    conteo_tri.update(p)
+                    tri_fuera -= 1
+                gastado += len(p)
+                usados += 1
+
+            candidatos = (conteo_tok.keys() | conteo_tri.keys() | contenidos) - borrados
+            self._evaluar(candidatos, d_norm, dtoks, rep_d, contenidos,
+                          conteo_tok, conteo_tri, tok_fuera, tri_fuera, estado)
+
+            # Los que no aparecieron comparten a lo más lo que falta contar
+            ausentes = self._cota_floja(len(d_norm), len(dtoks), rep_d, tok_fuera, tri_fuera)
+            if ausentes < self._piso(estado):
+                return estado["mejor"]
+
+        # Consulta con muchos trigramas repetidos: la cota no descarta al resto
+        candidatos = set(range(len(self._claves))) - borrados
+        self._evaluar(candidatos, d_norm, dtoks, rep_d, contenidos,
+                      conteo_tok, conteo_tri, 0, 0, estado)
+        return estado["mejor"]
+
+    @staticmethod
+    def _piso(estado: dict) -> float:
+        mejor = estado["mejor"]
+        return UMBRAL_MINIMO if mejor is None else mejor[3]
+
+    def _evaluar(self, candidatos, d_norm: str, dtoks: set[str], rep_d: int,
+                 contenidos: set[int], conteo_tok: Counter, conteo_tri: Counter,
+                 tok_fuera: int, tri_fuera: int, estado: dict):
+        """
+        Scoring completo de los candidatos nuevos cuya cota alcanza al mejor.
+        Actualiza estado["mejor"].
+        """
+        evaluados = estado["evaluados"]
+        nuevos = candidatos - evaluados
+        evaluados |= nuevos
+
+        n_d = len(d_norm)
+        n_dtoks = len(dtoks)
+
+        # Los con contención primero (suman 0.90 y suelen ganar, así el piso
+        # sube antes); el resto en grupos por (tokens, trigramas) compartidos,
+        # de mayor a menor cota floja: los muchos que comparten poco se
+        # descartan en bloque
+        grupos = {}
+        for idx in nuevos:
+            if idx not in contenidos:
+                grupos.setdefault((conteo_tok[idx] + tok_fuera, conteo_tri[idx] + tri_fuera), []).append(idx)
+        lotes = sorted(
+            ((self._cota_floja(n_d, n_dtoks, rep_d, tokens, trigramas), ids)
+             for (tokens, trigramas), ids in grupos.items()),
+            key=lambda x: -x[0]
+        )
+        lotes.insert(0, (math.inf, nuevos & contenidos))
+
+        mejor = estado["mejor"]
+        mejor_score = self._piso(estado)
+
+        for floja, ids in lotes:
+            if floja < mejor_score:
+                break
+
+            cotas = sorted(
+                (-self._cota(idx, n_d, n_dtoks, rep_d, conteo_tok[idx] + tok_fuera,
+                             conteo_tri[idx] + tri_fuera, idx in contenidos), idx)
+                for idx in ids
+            )
+            for cota, idx in cotas:
+                if -cota < mejor_score:
+                    break
+
+                k_norm = self._claves[idx]
+                ktoks = self._tokens[idx]
+
+                score = 0.0
+
+                # 2) contención directa (aguanta "metro baquedano" vs "baquedano")
+                if idx in contenidos:
+                    score += PESO_CONTENCION
+
+                # 3) tokens overlap
+                if dtoks and ktoks:
+                    union = len(dtoks | ktoks)
+                    score += (len(dtoks & ktoks) / union if union else 0.0) * PESO_JACCARD
+
+                # 4) fuzzy: primero cotas superiores baratas, difflib solo si puede ganar
+                sm = difflib.SequenceMatcher(None, d_norm, k_norm)
+                if score + sm.real_quick_ratio() * PESO_FUZZY < mejor_score:
+                    continue
+                if score + sm.quick_ratio() * PESO_FUZZY < mejor_score:
+                    continue
+                score += sm.ratio() * PESO_FUZZY
+
+                if score < UMBRAL_MINIMO:
+                    continue
+
+                # Ante empate gana el primero cargado (igual que el recorrido lineal)
+                if mejor is None or score > mejor[3] or (score == mejor[3] and idx < estado["idx"]):
+                    lat, lon = self._coords[idx]
+                    mejor = (lat, lon, k_norm, score)
+                    mejor_score = score
+                    estado["mejor"] = mejor
+                    estado["idx"] = idx
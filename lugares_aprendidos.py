@@ -0,0 +1,244 @@
+# lugares_aprendidos.py
+#
+# Lugares que el bot aprende de las confirmaciones con botones
+# (origen_opt_N / destino_opt_N). Cada vez que alguien elige una opción se
+# anota quién confirmó (texto escrito -> coordenada elegida); cuando
+# APRENDIDOS_UMBRAL usuarios distintos eligieron lo mismo esa opción se
+# promueve y el resolver la usa como match exacto: sin Mapbox y sin preguntar
+# de nuevo (no entra al match difuso, así no captura textos parecidos).
+#
+# Administración:
+#   python lugares_aprendidos.py listar [--todos]
+#   python lugares_aprendidos.py promover <id>
+#   python lugares_aprendidos.py borrar <id>
+#   python lugares_aprendidos.py bloquear <id>
+#   python lugares_aprendidos.py podar <dias> [min_confirmaciones]
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from indice_lugares import normalizar
+
+
+APRENDIDOS_DB_PATH = os.getenv("APRENDIDOS_DB_PATH", "/tmp/ecobus_aprendidos.db")
+APRENDIDOS_UMBRAL = int(os.getenv("APRENDIDOS_UMBRAL", "3"))
+
+# Textos más cortos que esto no se aprenden ("a", "ok", ...)
+MIN_LARGO_TEXTO = 4
+
+
+class LugaresAprendidos:
+    """
+    Tabla SQLite (WAL) compartida entre workers:
+    (texto normalizado, lat, lon) -> confirmaciones, promovido, bloqueado.
+    confirmaciones = usuarios distintos que la eligieron (tabla confirmantes,
+    con el wa_id hasheado). Para un mismo texto solo se promueve la coordenada
+    con más confirmaciones.
+    """
+
+    def __init__(self, path: str = APRENDIDOS_DB_PATH, umbral: int = APRENDIDOS_UMBRAL):
+        self.path = path
+        self.umbral = umbral
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS aprendidos ("
+            " id INTEGER PRIMARY KEY,"
+            " texto TEXT NOT NULL,"
+            " nombre TEXT NOT NULL,"
+            " lat REAL NOT NULL,"
+            " lon REAL NOT NULL,"
+            " confirmaciones INTEGER NOT NULL DEFAULT 1,"
+            " promovido INTEGER NOT NULL DEFAULT 0,"
+            " bloqueado INTEGER NOT NULL DEFAULT 0,"
+            " primera REAL NOT NULL,"
+            " ultima REAL NOT NULL,"
+            " UNIQUE (texto, lat, lon))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS confirmantes ("
+            " aprendido_id INTEGER NOT NULL REFERENCES aprendidos (id) ON DELETE CASCADE,"
+            " quien TEXT NOT NULL,"
+            " PRIMARY KEY (aprendido_id, quien))"
+        )
+
+    def registrar(self, texto: str, nombre: str, lat: float, lon: float, quien: str) -> bool:
+        """
+        Anota la confirmación de `quien` (wa_id): repetir la misma elección no
+        suma. Retorna True si la opción quedó promovida.
+        """
+        texto = normalizar(texto)
+        if len(texto) < MIN_LARGO_TEXTO or not quien:
+            return False
+
+        lat, lon = round(float(lat), 6), round(float(lon), 6)
+        ahora = time.time()
+        quien = hashlib.sha256(str(quien).encode("utf-8")).hexdigest()[:16]
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO aprendidos (texto, nombre, lat, lon, primera, ultima)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (texto, lat, lon) DO UPDATE SET"
+                    " nombre = excluded.nombre, ultima = excluded.ultima",
+                    (texto, nombre or texto, lat, lon, ahora, ahora)
+                )
+                id_ = self._conn.execute(
+                    "SELECT id FROM aprendidos WHERE texto = ? AND lat = ? AND lon = ?", (texto, lat, lon)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO confirmantes (aprendido_id, quien) VALUES (?, ?)", (id_, quien)
+                )
+                self._conn.execute(
+                    "UPDATE aprendidos SET confirmaciones ="
+                    " (SELECT COUNT(*) FROM confirmantes WHERE aprendido_id = ?) WHERE id = ?",
+                    (id_, id_)
+                )
+                promovido = self._revisar_promocion(texto)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return promovido == (lat, lon)
+
+    def _revisar_promocion(self, texto: str):
+        """
+        Deja promovida solo la opción líder del texto si pasa el umbral.
+        Retorna (lat, lon) promovido o None.
+        """
+        filas = self._conn.execute(
+            "SELECT id, lat, lon, confirmaciones, promovido FROM aprendidos"
+            " WHERE texto = ? AND bloqueado = 0 ORDER BY confirmaciones DESC, ultima DESC",
+            (texto,)
+        ).fetchall()
+        if not filas:
+            return None
+
+        lider = filas[0]
+        # Un empate no alcanza para desplazar a la que ya estaba promovida
+        actual = next((f for f in filas if f[4]), None)
+        if actual and actual[3] >= lider[3]:
+            lider = actual
+
+        if lider[3] < self.umbral:
+            return (actual[1], actual[2]) if actual else None
+
+        self._conn.execute("UPDATE aprendidos SET promovido = (id = ?) WHERE texto = ?", (lider[0], texto))
+        return lider[1], lider[2]
+
+    def promovidos(self) -> dict:
+        """
+        {texto: (lat, lon)} de todo lo promovido y no bloqueado.
+        """
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT texto, lat, lon FROM aprendidos WHERE promovido = 1 AND bloqueado = 0"
+            ).fetchall()
+        return {t: (lat, lon) for t, lat, lon in filas}
+
+    def listar(self, solo_promovidos: bool = False) -> list[dict]:
+        sql = "SELECT id, texto, nombre, lat, lon, confirmaciones, promovido, bloqueado, ultima FROM aprendidos"
+        if solo_promovidos:
+            sql += " WHERE promovido = 1"
+        sql += " ORDER BY texto, confirmaciones DESC"
+        with self._lock:
+            filas = self._conn.execute(sql).fetchall()
+        campos = ("id", "texto", "nombre", "lat", "lon", "confirmaciones", "promovido", "bloqueado", "ultima")
+        return [dict(zip(campos, f)) for f in filas]
+
+    def promover(self, id_: int) -> bool:
+        """
+        Promoción manual (sin esperar el umbral).
+        """
+        with self._lock:
+            fila = self._conn.execute("SELECT texto FROM aprendidos WHERE id = ?", (id_,)).fetchone()
+            if not fila:
+                return False
+            self._conn.execute(
+                "UPDATE aprendidos SET promovido = (id = ?), bloqueado = CASE WHEN id = ? THEN 0 ELSE bloqueado END"
+                " WHERE texto = ?",
+                (id_, id_, fila[0])
+            )
+            return True
+
+    def borrar(self, id_: int) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM aprendidos WHERE id = ?", (id_,)).rowcount > 0
+
+    def bloquear(self, id_: int) -> bool:
+        """
+        La opción queda registrada pero nunca se vuelve a promover.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE aprendidos SET bloqueado = 1, promovido = 0 WHERE id = ?", (id_,)
+            ).rowcount > 0
+
+    def podar(self, dias: float, min_confirmaciones: int = 2) -> int:
+        """
+        Borra lo no promovido sin uso hace `dias` y con pocas confirmaciones.
+        """
+        limite = time.time() - dias * 86400
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM aprendidos WHERE promovido = 0 AND bloqueado = 0"
+                " AND ultima < ? AND confirmaciones < ?",
+                (limite, min_confirmaciones)
+            ).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            total, promovidos, bloqueados = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(promovido), 0), COALESCE(SUM(bloqueado), 0) FROM aprendidos"
+            ).fetchone()
+        return {"registrados": total, "promovidos": promovidos, "bloqueados": bloqueados, "umbral": self.umbral}
+
+
+def main(argv: list[str]) -> int:
+    uso = (
+        "Uso: python lugares_aprendidos.py listar [--todos]\n"
+        "     python lugares_aprendidos.py promover|borrar|bloquear <id>\n"
+        "     python lugares_aprendidos.py podar <dias> [min_confirmaciones]"
+    )
+    if not argv:
+        print(uso)
+        return 2
+
+    store = LugaresAprendidos()
+    cmd, args = argv[0], argv[1:]
+
+    if cmd == "listar":
+        filas = store.listar(solo_promovidos="--todos" not in args)
+        for f in filas:
+            marca = "⛔" if f["bloqueado"] else ("✅" if f["promovido"] else "  ")
+            print(f"{marca} {f['id']:>5} {f['confirmaciones']:>4}x  {f['texto']!r} -> {f['nombre']} ({f['lat']}, {f['lon']})")
+        print(f"{len(filas)} filas | {store.stats()}")
+        return 0
+
+    if cmd in ("promover", "borrar", "bloquear") and len(args) == 1:
+        ok = getattr(store, cmd)(int(args[0]))
+        print("✅ Listo" if ok else "⚠️ No existe ese id")
+        return 0 if ok else 1
+
+    if cmd == "podar" and args:
+        n = store.podar(float(args[0]), int(args[1]) if len(args) > 1 else 2)
+        print(f"✅ {n} filas borradas")
+        return 0
+
+    print(uso)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,21 +1,177 @@
+import io
+import math
 import os
-import requests
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
+from PIL import Image, ImageDraw, ImageFont
+
+import http_client
+from artefactos import ARTEFACTOS, clave_contenido
+from polyline import decode, reducir
+from tiles import CacheTiles, lonlat_a_pixel, TILE_PX, MAPA_TILE_URL, MAPA_TILE_ATRIBUCION
+
 MAPBOX_TOKEN = os.getenv("MAPBOX_TOKEN")
 
+# remoto: Static Images API (una llamada por mapa)
+# local: se dibuja con Pillow sobre tiles en cache. Opcional: necesita
+# MAPA_TILE_URL (o tiles sembrados) de una fuente que permita guardarlos
+MAPA_MODO = os.getenv("MAPA_MODO", "remoto")
 
-def generar_mapa_static(origen, destino, polyline: str, cot_id: str = "SINID") -> str:
+# Mapbox Static Images acepta URLs de hasta 8192 bytes: la ruta se simplifica
+# hasta que entre en este presupuesto (el resto de la URL es corto)
+MAPA_POLYLINE_MAX_BYTES = int(os.getenv("MAPA_POLYLINE_MAX_BYTES", "7000"))
+
+MAPA_ANCHO = 900
+MAPA_ALTO = 500
+MAPA_PADDING_PX = 40
+MAPA_ZOOM_MAX = int(os.getenv("MAPA_ZOOM_MAX", "16"))
+
+# Mismo estilo que el overlay remoto: path-5+00aa88-0.7 y pines negros
+COLOR_RUTA = (0x00, 0xAA, 0x88, int(0.7 * 255))
+ANCHO_RUTA = 5
+COLOR_PIN = (0, 0, 0)
+COLOR_FONDO = (242, 239, 233)
+ESTILO = "mapbox/streets-v12"
+ATRIBUCION = MAPA_TILE_ATRIBUCION
+
+# Últimos mapas en memoria (path -> PNG): el PDF y el correo los usan sin releer disco
+MAPA_MEMORIA_MAX = int(os.getenv("MAPA_MEMORIA_MAX", "32"))
+_recientes = OrderedDict()
+_recientes_lock = threading.Lock()
+
+_POOL_TILES = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tiles")
+_tiles = None
+_tiles_lock = threading.Lock()
+
+
+def _cache_tiles() -> CacheTiles:
+    global _tiles
+    if _tiles is None:
+        with _tiles_lock:
+            if _tiles is None:
+                _tiles = CacheTiles()
+    return _tiles
+
+
+def tiles_stats() -> dict | None:
+    if MAPA_MODO != "local" and _tiles is None:
+        return None
+    return _cache_tiles().stats()
+
+
+def _recordar(path: str, png: bytes):
+    with _recientes_lock:
+        _recientes[path] = png
+        _recientes.move_to_end(path)
+        while len(_recientes) > MAPA_MEMORIA_MAX:
+            _recientes.popitem(last=False)
+
+
+def leer_mapa(path: str) -> bytes | None:
     """
-    Genera imagen PNG con ruta y marcadores A/B.
-    Guarda en /tmp y retorna el path.
+    PNG del mapa generado por generar_mapa_static (de memoria si está, si no de disco).
     """
+    if not path:
+        return None
+    with _recientes_lock:
+        png = _recientes.get(path)
+    if png is not None:
+        return png
+    try:
+        with open(path, "rb") as f:
+            png = f.read()
+    except FileNotFoundError:
+        return None
+    _recordar(path, png)
+    return png
+
+
+def _zoom_para(puntos: list) -> int:
+    """
+    Mayor zoom en que todos los puntos entran en el mapa con padding.
+    """
+    ancho = MAPA_ANCHO - 2 * MAPA_PADDING_PX
+    alto = MAPA_ALTO - 2 * MAPA_PADDING_PX
+    for z in range(MAPA_ZOOM_MAX, -1, -1):
+        px = [lonlat_a_pixel(lat, lon, z) for lat, lon in puntos]
+        xs = [p[0] for p in px]
+        ys = [p[1] for p in px]
+        if max(xs) - min(xs) <= ancho and max(ys) - min(ys) <= alto:
+            return z
+    return 0
+
+
+def _pin(draw: ImageDraw.ImageDraw, x: float, y: float, letra: str, font):
+    r = 10
+    draw.ellipse((x - r, y - r, x + r, y + r), fill=COLOR_PIN, outline=(255, 255, 255), width=2)
+    x0, y0, x1, y1 = draw.textbbox((0, 0), letra, font=font)
+    draw.text((x - (x1 - x0) / 2 - x0, y - (y1 - y0) / 2 - y0), letra, fill=(255, 255, 255), font=font)
+
 
+def _render_local(origen, destino, polyline: str) -> bytes:
+    """
+    Dibuja la ruta y los pines A/B sobre tiles de la cache (Web Mercator).
+    Retorna el PNG en bytes.
+    """
+    ruta = decode(polyline) if polyline else []
+    puntos = ruta + [tuple(origen), tuple(destino)]
+
+    z = _zoom_para(puntos)
+    px = [lonlat_a_pixel(lat, lon, z) for lat, lon in puntos]
+    cx = (min(p[0] for p in px) + max(p[0] for p in px)) / 2
+    cy = (min(p[1] for p in px) + max(p[1] for p in px)) / 2
+    izq = round(cx - MAPA_ANCHO / 2)
+    arriba = round(cy - MAPA_ALTO / 2)
+
+    n = 2 ** z
+    tiles = [
+        (tx, ty)
+        for tx in range(math.floor(izq / TILE_PX), math.floor((izq + MAPA_ANCHO - 1) / TILE_PX) + 1)
+        for ty in range(math.floor(arriba / TILE_PX), math.floor((arriba + MAPA_ALTO - 1) / TILE_PX) + 1)
+        if 0 <= ty < n
+    ]
+
+    cache = _cache_tiles()
+    datos = list(_POOL_TILES.map(http_client.heredar_limite(lambda t: cache.get(z, t[0], t[1])), tiles))
+
+    img = Image.new("RGB", (MAPA_ANCHO, MAPA_ALTO), COLOR_FONDO)
+    for (tx, ty), data in zip(tiles, datos):
+        with Image.open(io.BytesIO(data)) as tile:
+            img.paste(tile.convert("RGB"), (tx * TILE_PX - izq, ty * TILE_PX - arriba))
+
+    capa = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(capa)
+
+    if len(ruta) >= 2:
+        linea = [(x - izq, y - arriba) for x, y in px[:len(ruta)]]
+        draw.line(linea, fill=COLOR_RUTA, width=ANCHO_RUTA, joint="curve")
+
+    font = ImageFont.load_default()
+    (ax, ay), (bx, by) = px[-2], px[-1]
+    _pin(draw, ax - izq, ay - arriba, "A", font)
+    _pin(draw, bx - izq, by - arriba, "B", font)
+
+    x0, y0, x1, y1 = draw.textbbox((0, 0), ATRIBUCION, font=font)
+    w, h = x1 - x0 + 8, y1 - y0 + 6
+    draw.rectangle((MAPA_ANCHO - w, MAPA_ALTO - h, MAPA_ANCHO, MAPA_ALTO), fill=(255, 255, 255, 180))
+    draw.text((MAPA_ANCHO - w + 4 - x0, MAPA_ALTO - h + 3 - y0), ATRIBUCION, fill=(60, 60, 60, 255), font=font)
+
+    img = Image.alpha_composite(img.convert("RGBA"), capa).convert("RGB")
+
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _render_remoto(origen, destino, polyline: str) -> bytes:
     if not MAPBOX_TOKEN:
         raise Exception("MAPBOX_TOKEN no está configurado")
 
-    style = "mapbox/streets-v12"
-    encoded_polyline = quote(polyline)
+    style = ESTILO
+    encoded_polyline = quote(reducir(polyline, max_bytes=MAPA_POLYLINE_MAX_BYTES))
 
     lon_o, lat_o = origen[1], origen[0]
     lon_d, lat_d = destino[1], destino[0]
@@ -26,17 +182,47 @@ def generar_mapa_static(origen, destino, polyline: str, cot_id: str = "SINID") -
         f"pin-s-b+000000({lon_d},{lat_d})"
     )
 
-    url = f"https://api.mapbox.com/styles/v1/{style}/static/{overlays}/auto/900x500"
+    url = f"https://api.mapbox.com/styles/v1/{style}/static/{overlays}/auto/{MAPA_ANCHO}x{MAPA_ALTO}"
     params = {"access_token": MAPBOX_TOKEN}
 
-    r = requests.get(url, params=params, timeout=20)
+    r = http_client.get(url, params=params, timeout=20)
 
     if r.status_code != 200:
         raise Exception(f"Mapbox Static Image error {r.status_code}: {r.text}")
 
-    output_path = f"/tmp/mapa_ruta_{cot_id}.png"
+    return r.content
+
+
+def generar_mapa_static(origen, destino, polyline: str, cot_id: str = "SINID") -> str:
+    """
+    Genera imagen PNG con ruta y marcadores A/B y retorna el path.
+    Se guarda por hash del contenido en ARTEFACTOS: si el mismo corredor ya se
+    dibujó, se reutiliza el archivo (cot_id queda solo para el log).
+    """
+    clave = clave_contenido(
+        [round(float(c), 6) for c in origen],
+        [round(float(c), 6) for c in destino],
+        polyline or "",
+        MAPA_MODO,
+        MAPA_TILE_URL if MAPA_MODO == "local" else ESTILO,
+        [MAPA_ANCHO, MAPA_ALTO],
+    )
+    nombre = f"mapa_{clave}.png"
+
+    existente = ARTEFACTOS.buscar(nombre, tipo="mapa")
+    if existente:
+        print(f"♻️ Mapa reutilizado ({cot_id}):", existente)
+        return existente
 
-    with open(output_path, "wb") as f:
-        f.write(r.content)
+    if MAPA_MODO == "local":
+        try:
+            png = _render_local(origen, destino, polyline)
+        except Exception as e:
+            print("⚠️ Mapa local falló, se usa Mapbox Static Images:", e)
+            png = _render_remoto(origen, destino, polyline)
+    else:
+        png = _render_remoto(origen, destino, polyline)
 
-    return output_path
+    path = ARTEFACTOS.guardar(nombre, png, tipo="mapa")
+    _recordar(path, png)
+    return path
@@ -1,15 +1,88 @@
 import os
-import requests
+import math
+import threading
+import time
 from urllib.parse import quote
 import re
-import difflib
-
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import http_client
+from cache_local import CacheDosNiveles
+from indice_lugares import IndiceLugares, normalizar
+from estimador_rutas import EstimadorRutas
+from gazetteer import Gazetteer, GAZETTEER_PATH
+from grilla_lugares import GrillaLugares
+from lugares_aprendidos import LugaresAprendidos
 from lugares_conocidos import LUGARES_CONOCIDOS
-# from comunas_rm import COMUNAS_RM  # ⚠️ no se usa porque aquí se redefine
+from polyline import reducir
+from comunas_rm import COMUNAS_RM as COMUNAS_RM_CENTROIDES  # ⚠️ aquí abajo se redefine COMUNAS_RM
 
 MAPBOX_TOKEN = os.getenv("MAPBOX_TOKEN")
 ORS_API_KEY = os.getenv("ORS_API_KEY")
 
+# ✅ Cache de geocoding (memoria + disco) delante de Mapbox
+GEOCACHE_TTL_S = int(os.getenv("GEOCACHE_TTL_S", str(30 * 24 * 3600)))
+GEOCACHE_MAX_MEMORIA = int(os.getenv("GEOCACHE_MAX_MEMORIA", "5000"))
+
+GEOCACHE = CacheDosNiveles("geocode", ttl_s=GEOCACHE_TTL_S, max_memoria=GEOCACHE_MAX_MEMORIA)
+
+# ✅ Cache de rutas ORS, con coordenadas ajustadas a una grilla
+SEDE_PENAFLOR = (-33.60627, -70.87649)
+
+RUTA_GRILLA_M = float(os.getenv("RUTA_GRILLA_M", "50"))
+RUTA_CACHE_TTL_S = int(os.getenv("RUTA_CACHE_TTL_S", str(30 * 24 * 3600)))
+# Tramo base Peñaflor -> origen: se repite muchísimo y casi no cambia
+RUTA_BASE_GRILLA_M = float(os.getenv("RUTA_BASE_GRILLA_M", "150"))
+RUTA_BASE_TTL_S = int(os.getenv("RUTA_BASE_TTL_S", str(180 * 24 * 3600)))
+
+# Puntos de la ruta que se guardan (cache, cotización y precálculo).
+# Para un mapa de 900x500 más puntos no se notan.
+POLYLINE_MAX_PUNTOS = int(os.getenv("POLYLINE_MAX_PUNTOS", "400"))
+RUTA_POLYLINE_MAX_MEMORIA = int(os.getenv("RUTA_POLYLINE_MAX_MEMORIA", "500"))
+
+# km/horas de cada tramo (chico, muchos en memoria) y la geometría aparte:
+# la polyline solo hace falta para el mapa y pesa cientos de veces más
+RUTACACHE = CacheDosNiveles("ruta", ttl_s=RUTA_CACHE_TTL_S, max_memoria=20000)
+POLYCACHE = CacheDosNiveles("ruta_polyline", ttl_s=RUTA_CACHE_TTL_S, max_memoria=RUTA_POLYLINE_MAX_MEMORIA)
+
+_rutas_lock = threading.Lock()
+_rutas_contadores = {"ors_llamadas": 0, "ors_ahorradas": 0, "tramos_cacheados": 0}
+
+# ✅ Variantes de búsqueda a Mapbox en paralelo
+MAPBOX_CONCURRENCIA = int(os.getenv("MAPBOX_CONCURRENCIA", "8"))
+_POOL_MAPBOX = ThreadPoolExecutor(max_workers=MAPBOX_CONCURRENCIA, thread_name_prefix="mapbox")
+
+# La primera variante sale sola; el resto se lanza solo si no alcanzó o si no
+# respondió en este tiempo (así un acierto a la primera cuesta una sola llamada)
+MAPBOX_ESCALONADO_MS = float(os.getenv("MAPBOX_ESCALONADO_MS", "250"))
+
+# ✅ Índice de lugares conocidos (claves normalizadas una vez al importar)
+INDICE_LUGARES = IndiceLugares(LUGARES_CONOCIDOS)
+_claves_fijas = {normalizar(k) for k in LUGARES_CONOCIDOS}
+
+# ✅ Lugares aprendidos de confirmaciones con botones (ver lugares_aprendidos.py)
+APRENDIDOS_REFRESCO_S = float(os.getenv("APRENDIDOS_REFRESCO_S", "60"))
+try:
+    APRENDIDOS = LugaresAprendidos()
+except Exception as e:
+    print("⚠️ Lugares aprendidos desactivados:", e)
+    APRENDIDOS = None
+_aprendidos_aplicados = {}  # texto normalizado -> coords promovidas (solo match exacto)
+_aprendidos_sync = 0.0
+_aprendidos_lock = threading.Lock()
+
+# ✅ Gazetteer offline (mmap, compartido entre workers). Sin archivo: se salta
+_gazetteer = None
+_gazetteer_cargado = False
+_gazetteer_lock = threading.Lock()
+# Hasta qué distancia del centro de una comuna se le asigna un hit del gazetteer
+GAZETTEER_RADIO_COMUNA_KM = float(os.getenv("GAZETTEER_RADIO_COMUNA_KM", "15"))
+
+
+# ✅ Ubicaciones compartidas por WhatsApp: nombre sin red si hay algo cerca
+UBICACION_RADIO_LUGAR_KM = float(os.getenv("UBICACION_RADIO_LUGAR_KM", "0.5"))
+UBICACION_RADIO_COMUNA_KM = float(os.getenv("UBICACION_RADIO_COMUNA_KM", "3.0"))
+
 
 # ✅ Centros aproximados de comunas (RM)
 # Esto evita errores tipo "Pasaje Peñaflor en Estación Central"
@@ -26,6 +99,15 @@ COMUNAS_RM = {
 }
 
 
+# ✅ Índices espaciales para nombrar ubicaciones (lugar conocido o comuna)
+GRILLA_LUGARES = GrillaLugares(LUGARES_CONOCIDOS)
+GRILLA_COMUNAS = GrillaLugares()
+for _tabla in (COMUNAS_RM_CENTROIDES, COMUNAS_RM):
+    for _nombre, _coords in _tabla.items():
+        GRILLA_COMUNAS.agregar(_nombre, _coords)
+_COMUNAS_NORM = {normalizar(c) for c in (*COMUNAS_RM_CENTROIDES, *COMUNAS_RM)}
+
+
 # ✅ Lugares típicos V Región (solo ayuda en scoring)
 V_HINTS = [
     "viña", "vina", "viña del mar", "vina del mar",
@@ -62,67 +144,138 @@ def _contains_any(text: str, words: list[str]) -> bool:
     return any(w in t for w in words)
 
 
-def _tokens(txt: str) -> list[str]:
-    return [t for t in _clean_text(txt).split() if t]
-
-
-def _sim(a: str, b: str) -> float:
-    return difflib.SequenceMatcher(None, _clean_text(a), _clean_text(b)).ratio()
-
-
 def _buscar_lugar_conocido(direccion: str):
     """
-    Match robusto contra LUGARES_CONOCIDOS:
+    Match robusto contra LUGARES_CONOCIDOS (ver indice_lugares.py):
     - exact (normalizado)
     - contains (parcial)
     - fuzzy (errores ortográficos)
     Retorna (lat, lon, key_match, score) o None
     """
-    d_norm = _clean_text(direccion)
-    if not d_norm:
+    return INDICE_LUGARES.buscar(direccion)
+
+
+def sincronizar_aprendidos(forzar: bool = False):
+    """
+    Trae lo promovido en la tabla de aprendidos (y suelta lo que un admin
+    borró o bloqueó). Cada worker lo revisa cada APRENDIDOS_REFRESCO_S.
+    Los LUGARES_CONOCIDOS fijos siempre ganan.
+    """
+    global _aprendidos_sync
+
+    if APRENDIDOS is None:
+        return
+    if not forzar and time.time() - _aprendidos_sync < APRENDIDOS_REFRESCO_S:
+        return
+
+    with _aprendidos_lock:
+        if not forzar and time.time() - _aprendidos_sync < APRENDIDOS_REFRESCO_S:
+            return
+        _aprendidos_sync = time.time()
+
+        try:
+            promovidos = APRENDIDOS.promovidos()
+        except Exception as e:
+            print("⚠️ Error leyendo lugares aprendidos:", e)
+            return
+
+        nuevos = {t: tuple(c) for t, c in promovidos.items() if t not in _claves_fijas}
+        _aprendidos_aplicados.clear()
+        _aprendidos_aplicados.update(nuevos)
+
+
+def lugar_aprendido(direccion: str):
+    """
+    Match exacto (normalizado) contra lo aprendido. Retorna
+    (lat, lon, texto, 1.0) o None. No pasa por INDICE_LUGARES: un texto
+    aprendido no debe capturar consultas parecidas en el match difuso.
+    """
+    sincronizar_aprendidos()
+    texto = normalizar(direccion)
+    coords = _aprendidos_aplicados.get(texto)
+    if coords is None:
         return None
+    return coords[0], coords[1], texto, 1.0
 
-    # 1) exact match
-    if d_norm in LUGARES_CONOCIDOS:
-        lat, lon = LUGARES_CONOCIDOS[d_norm]
-        return float(lat), float(lon), d_norm, 1.0
 
-    dtoks = set(_tokens(d_norm))
-    mejor = None  # (lat, lon, k_norm, score)
+def aprender_lugar(texto: str, elegido: dict, quien: str):
+    """
+    El usuario `quien` (wa_id) confirmó `elegido` (candidato de
+    geocode_candidates) para `texto`.
+    """
+    if APRENDIDOS is None or not texto:
+        return
+    try:
+        if APRENDIDOS.registrar(texto, elegido.get("name"), elegido["lat"], elegido["lon"], quien):
+            print("🧠 Lugar aprendido:", texto, "=>", elegido.get("name"))
+            sincronizar_aprendidos(forzar=True)
+    except Exception as e:
+        print("⚠️ Error registrando lugar aprendido:", e)
 
-    for k, coords in LUGARES_CONOCIDOS.items():
-        k_norm = _clean_text(k)
-        if not k_norm:
-            continue
 
-        ktoks = set(_tokens(k_norm))
-        score = 0.0
+def _buscar_gazetteer(direccion: str):
+    """
+    Match exacto en el gazetteer: primero el texto completo y luego solo lo
+    anterior a la primera coma ("Providencia, Santiago" -> "providencia").
+    Eso último solo si lo anterior es una comuna o un lugar conocido, o si el
+    hit cae en la comuna nombrada después de la coma.
+    Un nombre con varias filas (la misma calle en varias comunas) cuenta como
+    miss, salvo que la comuna después de la coma deje una sola: así sigue a
+    Mapbox y a los candidatos que el usuario confirma.
+    Retorna (lat, lon) o None.
+    """
+    global _gazetteer, _gazetteer_cargado
+
+    if not _gazetteer_cargado:
+        with _gazetteer_lock:
+            if not _gazetteer_cargado:
+                if os.path.exists(GAZETTEER_PATH):
+                    try:
+                        _gazetteer = Gazetteer(GAZETTEER_PATH)
+                        print(f"✅ Gazetteer cargado: {GAZETTEER_PATH} ({len(_gazetteer)} filas)")
+                    except Exception as e:
+                        print("⚠️ No se pudo abrir el gazetteer:", e)
+                _gazetteer_cargado = True
+
+    if _gazetteer is None:
+        return None
 
-        # 2) contención directa (aguanta "metro baquedano" vs "baquedano")
-        if k_norm in d_norm or d_norm in k_norm:
-            score += 0.90
+    hits = _gazetteer.todos(direccion)
+    if len(hits) == 1:
+        return hits[0]
+    if hits or "," not in direccion:
+        if hits:
+            print("⚠️ Gazetteer: nombre ambiguo", direccion.strip(), "=>", len(hits), "lugares")
+        return None
 
-        # 3) tokens overlap
-        if dtoks and ktoks:
-            inter = len(dtoks.intersection(ktoks))
-            union = len(dtoks.union(ktoks))
-            jaccard = inter / union if union else 0.0
-            score += jaccard * 0.80
+    prefijo, resto = direccion.split(",", 1)
+    hits = _gazetteer.todos(prefijo)
+    if not hits:
+        return None
 
-        # 4) fuzzy por faltas de ortografía
-        score += _sim(d_norm, k_norm) * 0.85
+    # Una comuna o un lugar conocido no depende de lo que venga después
+    p_norm = normalizar(prefijo)
+    if len(hits) == 1 and (p_norm in _COMUNAS_NORM or INDICE_LUGARES.exacto(p_norm) or lugar_aprendido(p_norm)):
+        return hits[0]
 
-        # umbral mínimo para evitar falsos positivos
-        if score < 0.72:
-            continue
+    # Una calle ("Los Aromos, Maipú") se repite en varias comunas: el hit
+    # tiene que caer en la comuna que viene después de la coma
+    mencionadas = _comunas_mencionadas(resto)
+    calzan = []
+    for hit in hits:
+        cerca = GRILLA_COMUNAS.cercano(hit[0], hit[1], GAZETTEER_RADIO_COMUNA_KM)
+        if cerca and normalizar(cerca[0]) in mencionadas:
+            calzan.append(hit)
+    if len(calzan) == 1:
+        return calzan[0]
 
-        lat, lon = coords
-        candidato = (float(lat), float(lon), k_norm, score)
+    print("⚠️ Gazetteer: se descarta", prefijo.strip(), "=>", hits, "| no calza con:", resto.strip())
+    return None
 
-        if (mejor is None) or (candidato[3] > mejor[3]):
-            mejor = candidato
 
-    return mejor
+def _comunas_mencionadas(texto: str) -> set[str]:
+    p = f" {normalizar(texto)} "
+    return {c for c in _COMUNAS_NORM if f" {c} " in p}
 
 
 def _bbox_chile(lat: float, lon: float) -> bool:
@@ -163,101 +316,155 @@ def _expandir_consulta_chile(direccion: str) -> list[str]:
     return out
 
 
+def _mapbox_features(direccion_expandida: str, limit: int) -> list[dict]:
+    direccion_q = quote(direccion_expandida)
+
+    url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{direccion_q}.json"
+    params = {
+        "access_token": MAPBOX_TOKEN,
+        "country": "CL",
+        "limit": limit,
+        "language": "es",
+        "autocomplete": "true",
+        "proximity": "-70.6693,-33.4489",
+        "bbox": "-75,-56,-66,-17",
+        "types": "place,locality,neighborhood,address,poi"
+    }
+
+    r = http_client.get(url, params=params)
+    data = r.json()
+
+    return data.get("features", [])
+
+
+def _consultar_variantes(variantes: list[str], limit: int, procesar) -> None:
+    """
+    Consulta la primera variante a Mapbox; las demás se lanzan en paralelo
+    solo si la primera no bastó (`procesar` no retornó True) o si tardó más
+    de MAPBOX_ESCALONADO_MS. Las respuestas se entregan a `procesar(features)`
+    en el orden original (igual que el loop secuencial).
+
+    Cuando `procesar` retorna True, las variantes que aún no partieron ya no
+    se envían; las que están en vuelo terminan y se ignoran.
+    """
+    if not variantes:
+        return
+
+    terminado = threading.Event()
+
+    @http_client.heredar_limite
+    def consultar(variante):
+        if terminado.is_set():
+            return []
+        return _mapbox_features(variante, limit)
+
+    futuros = [_POOL_MAPBOX.submit(consultar, variantes[0])]
+    try:
+        wait(futuros, timeout=MAPBOX_ESCALONADO_MS / 1000)
+        siguiente = 0
+        if futuros[0].done():
+            siguiente = 1
+            if procesar(futuros[0].result()):
+                return
+
+        futuros += [_POOL_MAPBOX.submit(consultar, v) for v in variantes[1:]]
+        for fut in futuros[siguiente:]:
+            if procesar(fut.result()):
+                return
+    finally:
+        terminado.set()
+        for fut in futuros:
+            fut.cancel()
+
+
+def geocode_local(direccion: str):
+    """
+    Coordenadas sin llamar a la red (lugar conocido, comuna RM, gazetteer o cache).
+    Retorna (lat, lon) o None.
+    """
+    from geocoding_resolver import resolver
+    return resolver.geocode_local(direccion)
+
+
 def geocode(direccion: str):
     """
-    Geocoding robusto Chile:
-    1) Si es lugar conocido -> retorna coords fijas
-    2) Si es comuna RM -> coords fijas
-    3) Si no -> fallback Mapbox con filtros/scoring + reintentos
+    Geocoding robusto Chile (ver geocoding_resolver.py):
+    lugar conocido -> comuna RM -> gazetteer -> cache -> Mapbox
     """
-    if not direccion:
-        raise Exception("Dirección vacía")
+    from geocoding_resolver import resolver
+    return resolver.geocode(direccion)
 
-    direccion_original = direccion
-    d = _clean_text(direccion)
 
-    # ✅ 0) PRIORIDAD: lugares_conocidos.py (siempre primero)
-    hit = _buscar_lugar_conocido(direccion_original)
-    if hit:
-        lat, lon, k_match, score = hit
-        print("📍 Geocode FORZADO (LUGAR CONOCIDO):", direccion_original, "=>", (lat, lon), "| match:", k_match, "| score:", round(score, 3))
-        return lat, lon
+def geocode_candidates(direccion: str, limit: int = 3) -> list[dict]:
+    """
+    Devuelve candidatos para que el bot pueda pedir confirmación al usuario.
+    Retorna lista de dicts: [{"name":..., "lat":..., "lon":...}, ...]
+    """
+    from geocoding_resolver import resolver
+    return resolver.candidatos(direccion, limit)
 
-    # ✅ 1) FORZAR comunas RM conocidas
-    if d in COMUNAS_RM:
-        lat, lon = COMUNAS_RM[d]
-        print("📍 Geocode FORZADO (RM):", direccion_original, "=>", (lat, lon))
-        return lat, lon
 
-    # ✅ 2) Fallback Mapbox
+def _geocode_mapbox(direccion: str):
+    """
+    Tier remoto de geocode: Mapbox con filtros/scoring + variantes en paralelo.
+    Guarda el resultado en GEOCACHE.
+    """
+    direccion_original = direccion
+    d = _clean_text(direccion)
+    cache_key = _clave_cache("geocode", direccion_original)
+
     if not MAPBOX_TOKEN:
         raise Exception("MAPBOX_TOKEN no está definido en variables de entorno")
 
     variantes_busqueda = _expandir_consulta_chile(direccion_original)
 
-    best = None
-    best_score = -999
+    tipos_permitidos = {"place", "locality", "address", "poi", "neighborhood"}
+    texto_lower = d
+    es_quinta = _contains_any(texto_lower, V_HINTS)
 
-    for direccion_expandida in variantes_busqueda:
-        direccion_q = quote(direccion_expandida)
-
-        url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{direccion_q}.json"
-        params = {
-            "access_token": MAPBOX_TOKEN,
-            "country": "CL",
-            "limit": 8,
-            "language": "es",
-            "autocomplete": "true",
-            "proximity": "-70.6693,-33.4489",
-            "bbox": "-75,-56,-66,-17",
-            "types": "place,locality,neighborhood,address,poi"
-        }
-
-        r = requests.get(url, params=params, timeout=15)
-        data = r.json()
-
-        features = data.get("features", [])
-        if not features:
-            continue
+    def score_feature(f):
+        relevance = float(f.get("relevance", 0))
+        place_name = (f.get("place_name") or "").lower()
+        place_type = f.get("place_type", [])
 
-        tipos_permitidos = {"place", "locality", "address", "poi", "neighborhood"}
-        candidatos = [f for f in features if any(t in tipos_permitidos for t in f.get("place_type", []))]
-        if not candidatos:
-            candidatos = features
+        bonus = 0.0
+
+        if es_quinta:
+            if _contains_any(place_name, V_HINTS):
+                bonus += 1.0
+            if "santiago" in place_name or "region metropolitana" in place_name or "región metropolitana" in place_name:
+                bonus -= 0.8
 
-        texto_lower = d
-        es_quinta = _contains_any(texto_lower, V_HINTS)
+        if "place" in place_type:
+            bonus += 0.45
+        if "locality" in place_type:
+            bonus += 0.35
+        if "address" in place_type:
+            bonus += 0.15
+        if "poi" in place_type:
+            bonus += 0.10
 
-        def score_feature(f):
-            relevance = float(f.get("relevance", 0))
-            place_name = (f.get("place_name") or "").lower()
-            place_type = f.get("place_type", [])
+        if len(direccion_original.strip().split()) <= 2:
+            if "pasaje" in place_name or "calle" in place_name or "avenida" in place_name:
+                bonus -= 0.7
 
-            bonus = 0.0
+        if d in place_name:
+            bonus += 0.6
 
-            if es_quinta:
-                if _contains_any(place_name, V_HINTS):
-                    bonus += 1.0
-                if "santiago" in place_name or "region metropolitana" in place_name or "región metropolitana" in place_name:
-                    bonus -= 0.8
+        return relevance + bonus
 
-            if "place" in place_type:
-                bonus += 0.45
-            if "locality" in place_type:
-                bonus += 0.35
-            if "address" in place_type:
-                bonus += 0.15
-            if "poi" in place_type:
-                bonus += 0.10
+    best = None
+    best_score = -999
 
-            if len(direccion_original.strip().split()) <= 2:
-                if "pasaje" in place_name or "calle" in place_name or "avenida" in place_name:
-                    bonus -= 0.7
+    def procesar(features):
+        nonlocal best, best_score
 
-            if d in place_name:
-                bonus += 0.6
+        if not features:
+            return False
 
-            return relevance + bonus
+        candidatos = [f for f in features if any(t in tipos_permitidos for t in f.get("place_type", []))]
+        if not candidatos:
+            candidatos = features
 
         candidatos.sort(key=score_feature, reverse=True)
         candidato_best = candidatos[0]
@@ -268,7 +475,11 @@ def geocode(direccion: str):
             best = candidato_best
 
             if best_score >= 1.40:
-                break
+                return True
+
+        return False
+
+    _consultar_variantes(variantes_busqueda, 8, procesar)
 
     if not best:
         raise Exception(f"No se pudo geocodificar: {direccion_original}")
@@ -282,55 +493,26 @@ def geocode(direccion: str):
     if not _bbox_chile(lat, lon):
         raise Exception(f"Geocoding fuera de Chile para '{direccion_original}': elegido={best.get('place_name')} lat={lat}, lon={lon}")
 
+    GEOCACHE.set(cache_key, [lat, lon])
     return lat, lon
 
 
-def geocode_candidates(direccion: str, limit: int = 3) -> list[dict]:
+def _candidatos_mapbox(direccion: str, limit: int) -> list[dict]:
     """
-    Devuelve candidatos de Mapbox para que el bot pueda pedir confirmación al usuario.
-    Retorna lista de dicts: [{"name":..., "lat":..., "lon":...}, ...]
+    Tier remoto de geocode_candidates. Guarda los candidatos en GEOCACHE.
     """
-    if not direccion:
-        return []
+    direccion_original = direccion
+    cache_key = _clave_cache("candidatos", direccion_original)
 
     if not MAPBOX_TOKEN:
         raise Exception("MAPBOX_TOKEN no está definido en variables de entorno")
 
-    direccion_original = direccion
-
-    # 0) Si matchea lugar conocido, devolver uno fijo
-    hit = _buscar_lugar_conocido(direccion_original)
-    if hit:
-        lat, lon, k_match, score = hit
-        return [{"name": k_match, "lat": lat, "lon": lon}]
-
     variantes_busqueda = _expandir_consulta_chile(direccion_original)
 
     candidatos_finales = []
     vistos = set()
 
-    for direccion_expandida in variantes_busqueda:
-        direccion_q = quote(direccion_expandida)
-
-        url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{direccion_q}.json"
-        params = {
-            "access_token": MAPBOX_TOKEN,
-            "country": "CL",
-            "limit": 6,
-            "language": "es",
-            "autocomplete": "true",
-            "proximity": "-70.6693,-33.4489",
-            "bbox": "-75,-56,-66,-17",
-            "types": "place,locality,neighborhood,address,poi"
-        }
-
-        r = requests.get(url, params=params, timeout=15)
-        data = r.json()
-
-        features = data.get("features", [])
-        if not features:
-            continue
-
+    def procesar(features):
         for f in features:
             try:
                 lon, lat = f["center"]
@@ -351,18 +533,166 @@ def geocode_candidates(direccion: str, limit: int = 3) -> list[dict]:
                 })
 
                 if len(candidatos_finales) >= limit:
-                    return candidatos_finales
+                    return True
 
             except:
                 continue
 
-    return candidatos_finales
+        return False
+
+    _consultar_variantes(variantes_busqueda, 6, procesar)
+
+    if candidatos_finales:
+        GEOCACHE.set(cache_key, {"limit": limit, "items": candidatos_finales})
+
+    return [dict(c) for c in candidatos_finales]
+
+
+def _mapbox_reverse(lat: float, lon: float) -> str | None:
+    url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{lon},{lat}.json"
+    params = {
+        "access_token": MAPBOX_TOKEN,
+        "limit": 1,
+        "language": "es",
+        "types": "address,poi,neighborhood,locality,place",
+    }
+
+    r = http_client.get(url, params=params)
+    features = r.json().get("features", [])
+    if not features:
+        return None
+    return features[0].get("place_name")
+
+
+def nombre_ubicacion(lat: float, lon: float) -> str:
+    """
+    Nombre legible para una ubicación compartida:
+    1) lugar conocido a menos de UBICACION_RADIO_LUGAR_KM
+    2) comuna a menos de UBICACION_RADIO_COMUNA_KM
+    3) Mapbox reverse geocoding (con cache)
+    4) las coordenadas tal cual
+    """
+    hit = GRILLA_LUGARES.cercano(lat, lon, UBICACION_RADIO_LUGAR_KM)
+    if hit:
+        return f"Cerca de {hit[0].title()}"
+
+    hit = GRILLA_COMUNAS.cercano(lat, lon, UBICACION_RADIO_COMUNA_KM)
+    if hit:
+        return hit[0].title()
+
+    coords = f"{lat:.5f}, {lon:.5f}"
+
+    cache_key = f"reverse|{_celda(lat, lon, RUTA_GRILLA_M)}"
+    cached = GEOCACHE.get(cache_key)
+    if cached:
+        return cached
+
+    if not MAPBOX_TOKEN:
+        return coords
+
+    try:
+        nombre = _mapbox_reverse(lat, lon)
+    except Exception as e:
+        print("⚠️ Error reverse geocoding:", e)
+        return coords
+
+    if not nombre:
+        return coords
+
+    GEOCACHE.set(cache_key, nombre)
+    return nombre
+
+
+def _clave_cache(tipo: str, direccion: str) -> str:
+    return f"{tipo}|{_clean_text(direccion)}"
+
+
+def invalidar_geocode(direccion: str) -> bool:
+    """
+    Borra de la cache el resultado de geocode y de geocode_candidates
+    para esta dirección (ej: si Mapbox devolvió algo malo).
+    """
+    a = GEOCACHE.invalidar(_clave_cache("geocode", direccion))
+    b = GEOCACHE.invalidar(_clave_cache("candidatos", direccion))
+    return a or b
+
+
+def _celda(lat: float, lon: float, grilla_m: float) -> str:
+    """
+    Ajusta la coordenada a una grilla de ~grilla_m metros.
+    """
+    dlat = grilla_m / 111320
+    i_lat = round(lat / dlat)
+    dlon = grilla_m / (111320 * max(0.01, math.cos(math.radians(i_lat * dlat))))
+    return f"{i_lat}:{round(lon / dlon)}"
+
+
+def _es_base(origen) -> bool:
+    return (round(float(origen[0]), 5), round(float(origen[1]), 5)) == SEDE_PENAFLOR
+
+
+def _clave_ruta(origen, destino) -> str:
+    # El tramo base siempre sale del mismo punto: grilla más gruesa en el destino
+    grilla = RUTA_BASE_GRILLA_M if _es_base(origen) else RUTA_GRILLA_M
+    return (
+        f"{grilla:g}|{_celda(float(origen[0]), float(origen[1]), grilla)}"
+        f">{_celda(float(destino[0]), float(destino[1]), grilla)}"
+    )
+
+
+def _guardar_ruta(origen, destino, km: float, horas: float, polyline: str | None):
+    clave = _clave_ruta(origen, destino)
+    ttl = RUTA_BASE_TTL_S if _es_base(origen) else None
+
+    RUTACACHE.set(clave, {
+        "km": km,
+        "horas": horas,
+        # coords reales (no la celda) para ajustar el estimador offline
+        "o": [float(origen[0]), float(origen[1])],
+        "d": [float(destino[0]), float(destino[1])],
+    }, ttl_s=ttl)
+
+    # Un resultado de matrix no trae polyline: la que haya queda como está
+    if polyline:
+        POLYCACHE.set(clave, reducir(polyline, max_puntos=POLYLINE_MAX_PUNTOS), ttl_s=ttl)
+
+
+def _tramo_cacheado(clave: str):
+    """
+    RUTACACHE.get; las filas de antes traían la polyline completa adentro:
+    se pasa (reducida) a POLYCACHE y el tramo se vuelve a guardar sin ella.
+    """
+    cached = RUTACACHE.get(clave)
+    if cached and "polyline" in cached:
+        polyline = cached.pop("polyline")
+        RUTACACHE.set(clave, cached)
+        if polyline:
+            POLYCACHE.set(clave, reducir(polyline, max_puntos=POLYLINE_MAX_PUNTOS))
+    return cached
+
+
+def rutas_stats() -> dict:
+    with _rutas_lock:
+        contadores = dict(_rutas_contadores)
+    return {**contadores, "cache": RUTACACHE.stats(), "cache_polyline": POLYCACHE.stats()}
+
+
+def _contar(campo: str, n: int = 1):
+    with _rutas_lock:
+        _rutas_contadores[campo] += n
 
 
 def route(origen, destino):
     """
-    Retorna: (km, horas, polyline)
+    Retorna: (km, horas, polyline) con la polyline ya reducida a POLYLINE_MAX_PUNTOS
     """
+    clave = _clave_ruta(origen, destino)
+    cached = _tramo_cacheado(clave)
+    polyline = POLYCACHE.get(clave) if cached else None
+    if polyline:
+        _contar("ors_ahorradas")
+        return cached["km"], cached["horas"], polyline
+
     if not ORS_API_KEY:
         raise Exception("ORS_API_KEY no está definido en variables de entorno")
 
@@ -379,7 +709,7 @@ def route(origen, destino):
         ]
     }
 
-    r = requests.post(url, json=body, headers=headers, timeout=30)
+    r = http_client.post(url, json=body, headers=headers)
     data = r.json()
 
     if r.status_code >= 300:
@@ -393,4 +723,189 @@ def route(origen, destino):
     horas = summary["duration"] / 3600
     polyline = data["routes"][0].get("geometry", "")
 
-    return km, horas, polyline
+    _contar("ors_llamadas")
+    _guardar_ruta(origen, destino, km, horas, polyline)
+
+    return km, horas, reducir(polyline, max_puntos=POLYLINE_MAX_PUNTOS)
+
+
+def matriz(tramos: list) -> list:
+    """
+    Distancia y duración de varios tramos en UNA llamada al endpoint matrix de ORS.
+    tramos: [(origen, destino), ...] con origen/destino = (lat, lon)
+    Retorna: [(km, horas) o None si ORS no encontró ruta, ...] en el mismo orden.
+    """
+    if not tramos:
+        return []
+
+    # Primero la cache; solo se piden a ORS los tramos que faltan
+    out = [None] * len(tramos)
+    faltan = []
+    for i, (o, d) in enumerate(tramos):
+        cached = _tramo_cacheado(_clave_ruta(o, d))
+        if cached:
+            out[i] = (cached["km"], cached["horas"])
+        else:
+            faltan.append(i)
+
+    _contar("tramos_cacheados", len(tramos) - len(faltan))
+    if not faltan:
+        _contar("ors_ahorradas")
+        return out
+
+    for i, res in zip(faltan, _matriz_ors([tramos[i] for i in faltan])):
+        out[i] = res
+        if res is not None:
+            _guardar_ruta(tramos[i][0], tramos[i][1], res[0], res[1], None)
+
+    return out
+
+
+def _matriz_ors(tramos: list) -> list:
+    if not ORS_API_KEY:
+        raise Exception("ORS_API_KEY no está definido en variables de entorno")
+
+    # Ubicaciones únicas: ORS calcula la matriz sources x destinations
+    locations = []
+    indice = {}
+
+    def idx(p):
+        k = (float(p[0]), float(p[1]))
+        if k not in indice:
+            indice[k] = len(locations)
+            locations.append([k[1], k[0]])
+        return indice[k]
+
+    pares = [(idx(o), idx(d)) for o, d in tramos]
+    sources = sorted({o for o, _ in pares})
+    destinations = sorted({d for _, d in pares})
+
+    url = "https://api.openrouteservice.org/v2/matrix/driving-car"
+    headers = {
+        "Authorization": ORS_API_KEY,
+        "Content-Type": "application/json"
+    }
+
+    body = {
+        "locations": locations,
+        "sources": sources,
+        "destinations": destinations,
+        "metrics": ["distance", "duration"],
+    }
+
+    r = http_client.post(url, json=body, headers=headers)
+    data = r.json()
+
+    if r.status_code >= 300:
+        raise Exception(f"ORS matrix error HTTP {r.status_code}: {data}")
+
+    if "distances" not in data or "durations" not in data:
+        raise Exception(f"No se pudo calcular la matriz (ORS): {data}")
+
+    fila = {s: i for i, s in enumerate(sources)}
+    col = {d: j for j, d in enumerate(destinations)}
+
+    out = []
+    for o, d in pares:
+        dist = data["distances"][fila[o]][col[d]]
+        dur = data["durations"][fila[o]][col[d]]
+        if dist is None or dur is None:
+            out.append(None)
+        else:
+            out.append((dist / 1000, dur / 3600))
+
+    _contar("ors_llamadas")
+    return out
+
+
+# -------- Estimador offline (sin ORS) --------
+ESTIMADOR_REAJUSTE_S = int(os.getenv("ESTIMADOR_REAJUSTE_S", "3600"))
+
+_estimador = None
+_estimador_ts = 0.0
+_estimador_lock = threading.Lock()
+_estimador_reajustando = False
+# Solo el primer ajuste bloquea (no hay estimador que servir mientras tanto)
+_estimador_primer_lock = threading.Lock()
+
+
+def _centroides_comunas() -> dict:
+    centroides = {}
+    for tabla in (COMUNAS_RM_CENTROIDES, COMUNAS_RM):
+        for nombre, coords in tabla.items():
+            centroides.setdefault(_clean_text(nombre).strip(), coords)
+    return centroides
+
+
+def ajustar_estimador() -> EstimadorRutas:
+    """
+    Re-ajusta el estimador con las rutas ORS guardadas en la cache.
+    Solo se leen o/d/km/horas (filas antiguas pueden traer la polyline entera).
+    """
+    global _estimador, _estimador_ts
+
+    est = EstimadorRutas(_centroides_comunas())
+    muestras = (
+        (*v["o"], *v["d"], v["km"], v["horas"])
+        for _, v in RUTACACHE.items(campos=("o", "d", "km", "horas"))
+        if v.get("o") and v.get("d")
+    )
+    n = est.ajustar(muestras)
+    print(f"📐 Estimador de rutas ajustado con {n} rutas ORS")
+
+    with _estimador_lock:
+        _estimador = est
+        _estimador_ts = time.time()
+    return est
+
+
+def _ajustar_o_mantener() -> EstimadorRutas:
+    """
+    ajustar_estimador(); si falla se deja el estimador actual (o uno vacío)
+    y se vuelve a intentar en ESTIMADOR_REAJUSTE_S.
+    """
+    global _estimador, _estimador_ts
+    try:
+        return ajustar_estimador()
+    except Exception as e:
+        print("⚠️ No se pudo ajustar el estimador:", e)
+        with _estimador_lock:
+            if _estimador is None:
+                _estimador = EstimadorRutas(_centroides_comunas())
+            _estimador_ts = time.time()
+            return _estimador
+
+
+def _reajustar_en_fondo():
+    global _estimador_reajustando
+    try:
+        _ajustar_o_mantener()
+    finally:
+        with _estimador_lock:
+            _estimador_reajustando = False
+
+
+def estimar_ruta(origen, destino) -> dict:
+    """
+    Estimación offline de un tramo (microsegundos, sin red):
+    {"km", "horas", "km_min", "km_max", "banda", "muestras", "fuente"}
+
+    Cuando el ajuste vence se sigue usando el estimador actual y se re-ajusta
+    en un solo hilo de fondo (leer RUTACACHE entera no va en el request).
+    """
+    global _estimador_reajustando
+
+    est = _estimador
+    if est is None:
+        with _estimador_primer_lock:
+            est = _estimador or _ajustar_o_mantener()
+
+    elif time.time() - _estimador_ts > ESTIMADOR_REAJUSTE_S:
+        with _estimador_lock:
+            lanzar = not _estimador_reajustando and time.time() - _estimador_ts > ESTIMADOR_REAJUSTE_S
+            if lanzar:
+                _estimador_reajustando = True
+        if lanzar:
+            threading.Thread(target=_reajustar_en_fondo, name="estimador-reajuste", daemon=True).start()
+
+    return est.estimar(origen, destino)
@@ -1,43 +1,309 @@
+import copy
+import hashlib
+import io
 import os
+import threading
+from PIL import Image
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase import pdfdoc
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
 from datetime import datetime
 from reportlab.lib.utils import ImageReader
 
+from artefactos import ARTEFACTOS
 
-def generar_pdf_cotizacion(usuario: dict) -> str:
-    cot_id = usuario.get("cotizacion_id", "SINID")
 
-    filename = f"cotizacion_{cot_id}.pdf"
-    output_path = os.path.join("/tmp", filename)
+LOGO_PATH = "logo_ecobus.png"  # 👈 pon aquí tu logo PNG
+
+# 1: logo, título y pie se arman una vez por proceso (form XObject) | 0: se
+# dibujan en cada cotización como antes
+PDF_PLANTILLA = os.getenv("PDF_PLANTILLA", "1") == "1"
+
+FORM_PLANTILLA = "PlantillaEcobus"
+
+# -------- Tamaño del PDF --------
+# Logo y mapa se reducen a la resolución con que se imprimen y se cuantizan
+# a una paleta (menos colores = el deflate del PDF comprime mejor)
+PDF_OPTIMIZAR_IMAGENES = os.getenv("PDF_OPTIMIZAR_IMAGENES", "1") == "1"
+PDF_DPI = float(os.getenv("PDF_DPI", "150"))
+PDF_COLORES = int(os.getenv("PDF_COLORES", "128"))  # 0: sin cuantizar
+
+# Solo se reduce si la imagen es al menos esto más grande que lo impreso: una
+# reducción chica suaviza los bordes y comprime peor de lo que ahorra en píxeles
+PDF_REDUCIR_DESDE = 1.25
+
+PDF_COMPRESION = os.getenv("PDF_COMPRESION", "1") == "1"
+
+# ASCII85 infla ~25% cada stream y es Python puro; el PDF viaja en binario
+# (o en el base64 del correo), así que no hace falta
+PDF_ASCII85 = os.getenv("PDF_ASCII85", "0") == "1"
+
+PIE_LINEAS = (
+    (2.2 * cm, "Cotización referencial. Puede variar por desvíos, esperas o condiciones operacionales."),
+    (1.7 * cm, "Para confirmar disponibilidad y reserva, contactar con al menos 3 días hábiles de anticipación al número +569 97799101."),
+)
+
+
+def optimizar_imagen(img: Image.Image, ancho_pt: float, alto_pt: float) -> Image.Image:
+    """
+    Reduce `img` a lo que se imprime en una caja de ancho_pt x alto_pt (a
+    PDF_DPI, manteniendo proporción) y la cuantiza a PDF_COLORES sin dithering
+    (el ruido del dithering comprime mal). Conserva el canal alfa.
+    """
+    alfa = img.getchannel("A") if img.mode in ("RGBA", "LA") else None
+    rgb = img.convert("RGB")
+
+    escala = min(ancho_pt / 72 * PDF_DPI / img.width, alto_pt / 72 * PDF_DPI / img.height)
+    if escala * PDF_REDUCIR_DESDE <= 1:
+        tam = (max(1, round(img.width * escala)), max(1, round(img.height * escala)))
+        rgb = rgb.resize(tam, Image.Resampling.LANCZOS)
+        if alfa is not None:
+            alfa = alfa.resize(tam, Image.Resampling.LANCZOS)
+
+    # getcolors es barato y evita cuantizar lo que ya tiene pocos colores
+    if PDF_COLORES and rgb.getcolors(PDF_COLORES) is None:
+        rgb = rgb.quantize(PDF_COLORES, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE).convert("RGB")
+
+    if alfa is not None:
+        rgb.putalpha(alfa)
+    return rgb
+
+
+class _ConfigPorDocumento:
+    """
+    rl_config tal como lo ve pdfdoc. reportlab lee useA85 de su config global
+    (al cargar imágenes y al escribir los streams) y Canvas no lo recibe como
+    opción; con esta vista cada PDF de este módulo fija el suyo en el hilo que
+    lo arma y el resto (otros hilos, otros usos de reportlab) sigue leyendo la
+    config global, que no se toca.
+    """
+
+    def __init__(self, base):
+        self._base = base
+        self._local = threading.local()
+
+    def __getattr__(self, nombre):
+        if nombre == "useA85":
+            valor = getattr(self._local, "useA85", None)
+            if valor is not None:
+                return valor
+        return getattr(self._base, nombre)
+
+
+if not isinstance(pdfdoc.rl_config, _ConfigPorDocumento):
+    pdfdoc.rl_config = _ConfigPorDocumento(rl_config)
+_rl_documento = pdfdoc.rl_config._local
+
+
+_logo = None
+_logo_cargado = False
+_logo_lock = threading.Lock()
+
+
+def _obtener_logo():
+    """
+    (nombre, ImageReader) del logo ya decodificado y optimizado, una vez por
+    proceso, para la plantilla y para el dibujo directo. None si no hay logo.
+    """
+    global _logo, _logo_cargado
+    if _logo_cargado:
+        return _logo
+    with _logo_lock:
+        if _logo_cargado:
+            return _logo
+        if os.path.exists(LOGO_PATH):
+            try:
+                with open(LOGO_PATH, "rb") as f:
+                    data = f.read()
+                imagen = Image.open(io.BytesIO(data))
+                if PDF_OPTIMIZAR_IMAGENES:
+                    imagen = optimizar_imagen(imagen, 16 * cm, 16 * cm)
+                _logo = ("logo_" + hashlib.sha1(data).hexdigest()[:16], ImageReader(imagen))
+            except Exception as e:
+                print("⚠️ No se pudo cargar el logo del PDF:", e)
+                _logo = None
+        _logo_cargado = True
+    return _logo
+
+
+class _Plantilla:
+    """
+    Parte fija del PDF, armada una vez por proceso:
+    - logo ya decodificado y comprimido (molde de PDFImageXObject + su SMask)
+    - operadores de dibujo del logo, título y pie
+
+    reportlab no deja registrar el mismo objeto en dos documentos, así que
+    cada PDF registra una copia liviana del molde (comparten streamContent).
+    Usa internos de reportlab (_code, _smask, Reference): la versión está
+    fijada en requirements.txt y benchmarks/bench_pdf_plantilla.py verifica
+    que la página salga igual que dibujada directo. Si una versión nueva los
+    cambia, _generar_pdf avisa y vuelve al dibujo directo.
+    """
+
+    def __init__(self):
+        self.logo = None
+        self.logo_nombre = None
+        logo = _obtener_logo()
+        if logo is not None:
+            try:
+                self.logo_nombre, reader = logo
+                self.logo = pdfdoc.PDFImageXObject(self.logo_nombre, reader, mask="auto")
+            except Exception as e:
+                print("⚠️ No se pudo cargar el logo del PDF:", e)
+                self.logo = None
+
+        # Operadores capturados en un canvas de prueba; los nombres internos de
+        # fuentes (/F1, /F2) se validan al aplicar en cada documento
+        borrador = canvas.Canvas(io.BytesIO(), pagesize=letter, pageCompression=PDF_COMPRESION)
+        borrador._code = []
+        if self.logo is not None:
+            borrador._code.append(self._operador_logo(borrador._doc.getXObjectName(self.logo_nombre)))
+        _dibujar_textos_fijos(borrador)
+        self.operadores = list(borrador._code)
+        self.fuentes = {f: borrador._doc.getInternalFontName(f) for f in ("Helvetica", "Helvetica-Bold")}
+
+    @staticmethod
+    def _operador_logo(reg_name: str) -> str:
+        width, height = letter
+        # Igual que drawImage: translate + scale + Do
+        return "q 1 0 0 1 %s %s cm %s 0 0 %s 0 0 cm /%s Do Q" % (
+            fp_str(width / 2 - 8 * cm), fp_str(height / 2 - 8 * cm),
+            fp_str(16 * cm), fp_str(16 * cm), reg_name,
+        )
+
+    def _registrar_logo(self, c: canvas.Canvas):
+        """
+        Registra una copia del molde en el documento (como lo haría drawImage).
+        """
+        doc = c._doc
+        obj = copy.copy(self.logo)
+        doc.Reference(obj, doc.getXObjectName(self.logo_nombre))
+        doc.addForm(self.logo_nombre, obj)
+        smask = getattr(self.logo, "_smask", None)
+        if smask is not None:
+            del obj._smask
+            obj.smask = doc.Reference(copy.copy(smask), doc.getXObjectName(smask.name))
+
+    def aplicar(self, c: canvas.Canvas):
+        """
+        Define el form con la parte fija en este documento y lo dibuja.
+        """
+        if any(c._doc.getInternalFontName(f) != n for f, n in self.fuentes.items()):
+            # Orden de fuentes distinto al del borrador: se dibuja directo
+            _dibujar_estatico(c)
+            return
+
+        c.beginForm(FORM_PLANTILLA)
+        if self.logo is not None:
+            self._registrar_logo(c)
+            c._formsinuse.append(self.logo_nombre)
+        c._code.extend(self.operadores)
+        c.endForm(hasImages=self.logo is not None)
+
+        c._currentPageHasImages = 1
+        c.doForm(FORM_PLANTILLA)
+
+
+_plantillas = {}  # ascii85 -> _Plantilla (el logo queda codificado al armarla)
+_plantilla_lock = threading.Lock()
+
+# Lo que lanza un interno de reportlab que cambió de nombre o de forma
+_ERRORES_PLANTILLA = (AttributeError, TypeError, KeyError, IndexError)
+_plantilla_rota = False
 
-    c = canvas.Canvas(output_path, pagesize=letter)
+
+def _obtener_plantilla(ascii85: bool) -> _Plantilla:
+    plantilla = _plantillas.get(ascii85)
+    if plantilla is None:
+        with _plantilla_lock:
+            plantilla = _plantillas.get(ascii85)
+            if plantilla is None:
+                plantilla = _plantillas[ascii85] = _Plantilla()
+    return plantilla
+
+
+def _dibujar_textos_fijos(c: canvas.Canvas):
+    height = letter[1]
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(2 * cm, height - 2.2 * cm, "COTIZACIÓN DE TRANSPORTE - ECOBUS")
+
+    c.setFont("Helvetica", 9)
+    for y, linea in PIE_LINEAS:
+        c.drawString(2 * cm, y, linea)
+
+
+def _dibujar_estatico(c: canvas.Canvas):
+    """
+    Parte fija dibujada directo en la página (sin plantilla).
+    """
     width, height = letter
 
-    # -------------------------
-    # LOGO DE FONDO (OPCIONAL)
-    # -------------------------
-    logo_path = "logo_ecobus.png"  # 👈 pon aquí tu logo PNG
-    if os.path.exists(logo_path):
+    logo = _obtener_logo()
+    if logo is not None:
         try:
             c.drawImage(
-                ImageReader(logo_path),
+                logo[1],
                 width / 2 - 8 * cm,
                 height / 2 - 8 * cm,
                 width=16 * cm,
                 height=16 * cm,
                 mask='auto'
             )
-        except:
-            pass
+        except Exception as e:
+            print("⚠️ No se pudo dibujar el logo del PDF:", e)
+
+    _dibujar_textos_fijos(c)
+
+
+def generar_pdf_bytes(usuario: dict, mapa_png: bytes | None = None, ascii85: bool | None = None) -> bytes:
+    """
+    Renderiza el PDF en memoria. `mapa_png`: imagen del mapa ya en memoria;
+    si no viene se usa el archivo de usuario["Mapa Ruta"]. `ascii85`: codificar
+    los streams de este PDF en ASCII85 (por defecto PDF_ASCII85).
+    """
+    ascii85 = PDF_ASCII85 if ascii85 is None else ascii85
+    previo = getattr(_rl_documento, "useA85", None)
+    _rl_documento.useA85 = 1 if ascii85 else 0
+    try:
+        return _generar_pdf(usuario, mapa_png, ascii85)
+    finally:
+        _rl_documento.useA85 = previo
+
+
+def _nuevo_canvas() -> tuple:
+    buffer = io.BytesIO()
+    return buffer, canvas.Canvas(buffer, pagesize=letter, pageCompression=PDF_COMPRESION)
+
+
+def _generar_pdf(usuario: dict, mapa_png: bytes | None, ascii85: bool) -> bytes:
+    global _plantilla_rota
+    cot_id = usuario.get("cotizacion_id", "SINID")
+
+    buffer, c = _nuevo_canvas()
+    width, height = letter
 
     # -------------------------
-    # HEADER
+    # LOGO DE FONDO + HEADER + FOOTER (parte fija)
     # -------------------------
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(2 * cm, height - 2.2 * cm, "COTIZACIÓN DE TRANSPORTE - ECOBUS")
+    if PDF_PLANTILLA and not _plantilla_rota:
+        try:
+            _obtener_plantilla(ascii85).aplicar(c)
+        except _ERRORES_PLANTILLA as e:
+            _plantilla_rota = True
+            print("⚠️ Plantilla PDF no disponible (¿cambió reportlab?), se dibuja directo:", repr(e))
+            # El canvas pudo quedar a medio form: se parte de uno nuevo
+            buffer, c = _nuevo_canvas()
+            _dibujar_estatico(c)
+    else:
+        _dibujar_estatico(c)
 
+    # -------------------------
+    # HEADER (datos de esta cotización)
+    # -------------------------
     c.setFont("Helvetica", 10)
     c.drawString(2 * cm, height - 2.9 * cm, f"Fecha emisión: {datetime.now().strftime('%d-%m-%Y %H:%M')}")
     c.drawString(2 * cm, height - 3.4 * cm, f"ID Cotización: {cot_id}")
@@ -116,8 +382,11 @@ def generar_pdf_cotizacion(usuario: dict) -> str:
     # -------------------------
     y -= 1.2 * cm
     ruta_img = usuario.get("Mapa Ruta", "")
+    if mapa_png is None and ruta_img and os.path.exists(ruta_img):
+        with open(ruta_img, "rb") as f:
+            mapa_png = f.read()
 
-    if ruta_img and os.path.exists(ruta_img):
+    if mapa_png:
         try:
             c.setFont("Helvetica-Bold", 11)
             c.drawString(2 * cm, y, "Mapa referencial del recorrido")
@@ -126,8 +395,12 @@ def generar_pdf_cotizacion(usuario: dict) -> str:
             img_width = 17 * cm
             img_height = 7.5 * cm
 
+            imagen = Image.open(io.BytesIO(mapa_png))
+            if PDF_OPTIMIZAR_IMAGENES:
+                imagen = optimizar_imagen(imagen, img_width, img_height)
+
             c.drawImage(
-                ImageReader(ruta_img),
+                ImageReader(imagen),
                 2 * cm,
                 y - img_height,
                 width=img_width,
@@ -143,24 +416,16 @@ def generar_pdf_cotizacion(usuario: dict) -> str:
             c.drawString(2 * cm, y, f"(Error mapa: {str(e)})")
             y -= 0.6 * cm
 
-    # -------------------------
-    # FOOTER NUEVO
-    # -------------------------
-    c.setFont("Helvetica", 9)
-    c.drawString(
-        2 * cm,
-        2.2 * cm,
-        "Cotización referencial. Puede variar por desvíos, esperas o condiciones operacionales."
-    )
-    c.drawString(
-        2 * cm,
-        1.7 * cm,
-        "Para confirmar disponibilidad y reserva, contactar con al menos 3 días hábiles de anticipación al número +569 97799101."
-    )
-
     c.save()
 
-    if not os.path.exists(output_path):
-        raise Exception("No se creó el PDF en disco")
+    return buffer.getvalue()
 
-    return output_path
+
+def generar_pdf_cotizacion(usuario: dict, artefactos=None) -> str:
+    """
+    Igual que generar_pdf_bytes, pero deja el PDF en ARTEFACTOS (u otro
+    DirectorioArtefactos, ej: la salida de reemitir.py) y retorna el path.
+    """
+    cot_id = usuario.get("cotizacion_id", "SINID")
+    destino = artefactos or ARTEFACTOS
+    return destino.guardar(f"cotizacion_{cot_id}.pdf", generar_pdf_bytes(usuario), tipo="pdf")
@@ -0,0 +1,160 @@
+# polyline.py
+#
+# Encoded polyline (formato de Google, el que devuelve ORS y acepta Mapbox
+# Static Images) + simplificación Douglas–Peucker para que la ruta quepa en
+# la URL del mapa y se guarde compacta en la cotización.
+
+import heapq
+import math
+from urllib.parse import quote
+
+
+PRECISION = 5
+M_POR_GRADO = 111320.0
+
+
+def decode(polyline: str, precision: int = PRECISION) -> list[tuple]:
+    """
+    "_p~iF~ps|U_ulLnnqC" -> [(lat, lon), ...]
+    """
+    factor = 10 ** precision
+    puntos = []
+    i = lat = lon = 0
+    n = len(polyline or "")
+
+    while i < n:
+        valores = []
+        for _ in range(2):
+            resultado = shift = 0
+            while True:
+                b = ord(polyline[i]) - 63
+                i += 1
+                resultado |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            valores.append(~(resultado >> 1) if resultado & 1 else resultado >> 1)
+        lat += valores[0]
+        lon += valores[1]
+        puntos.append((lat / factor, lon / factor))
+
+    return puntos
+
+
+def _encode_valor(v: int, out: list):
+    v = ~(v << 1) if v < 0 else v << 1
+    while v >= 0x20:
+        out.append(chr((0x20 | (v & 0x1F)) + 63))
+        v >>= 5
+    out.append(chr(v + 63))
+
+
+def encode(puntos, precision: int = PRECISION) -> str:
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in puntos:
+        ilat, ilon = round(lat * factor), round(lon * factor)
+        _encode_valor(ilat - prev_lat, out)
+        _encode_valor(ilon - prev_lon, out)
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+
+def _distancia_segmento_m(p, a, b, kx: float) -> float:
+    """
+    Distancia (m) de p al segmento a-b, en proyección equirectangular local.
+    """
+    px, py = p[1] * kx, p[0] * M_POR_GRADO
+    ax, ay = a[1] * kx, a[0] * M_POR_GRADO
+    bx, by = b[1] * kx, b[0] * M_POR_GRADO
+    dx, dy = bx - ax, by - ay
+    largo2 = dx * dx + dy * dy
+    if largo2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / largo2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _orden_importancia(puntos: list) -> list[tuple]:
+    """
+    Douglas–Peucker "por prioridad": retorna [(indice, distancia_m), ...] en el
+    orden en que DP agregaría cada punto (los extremos primero, con distancia inf).
+    Cortar esa lista en k da la simplificación DP de k puntos.
+    """
+    n = len(puntos)
+    if n <= 2:
+        return [(i, math.inf) for i in range(n)]
+
+    lat_media = sum(p[0] for p in puntos) / n
+    kx = M_POR_GRADO * math.cos(math.radians(lat_media))
+
+    def mas_lejano(a, b):
+        mejor, mejor_d = -1, -1.0
+        for i in range(a + 1, b):
+            d = _distancia_segmento_m(puntos[i], puntos[a], puntos[b], kx)
+            if d > mejor_d:
+                mejor, mejor_d = i, d
+        return mejor, mejor_d
+
+    orden = [(0, math.inf), (n - 1, math.inf)]
+    heap = []
+
+    def empujar(a, b):
+        if b - a > 1:
+            i, d = mas_lejano(a, b)
+            heapq.heappush(heap, (-d, i, a, b))
+
+    empujar(0, n - 1)
+    while heap:
+        d, i, a, b = heapq.heappop(heap)
+        orden.append((i, -d))
+        empujar(a, i)
+        empujar(i, b)
+
+    return orden
+
+
+def simplificar(puntos: list, max_puntos: int | None = None, tolerancia_m: float | None = None) -> list:
+    """
+    Douglas–Peucker: deja a lo más `max_puntos` y/o descarta los que se desvían
+    menos de `tolerancia_m` metros. Siempre conserva los extremos.
+    """
+    orden = _orden_importancia(puntos)
+    if tolerancia_m is not None:
+        orden = [(i, d) for i, d in orden if d > tolerancia_m]
+    if max_puntos is not None:
+        orden = orden[:max(2, max_puntos)]
+    return [puntos[i] for i in sorted(i for i, _ in orden)]
+
+
+def reducir(polyline: str, max_puntos: int | None = None, max_bytes: int | None = None) -> str:
+    """
+    Decodifica, simplifica y re-codifica. Con `max_bytes` busca la mayor
+    cantidad de puntos cuyo encoding, ya escapado para URL, entra en el límite.
+    """
+    if not polyline:
+        return polyline or ""
+
+    puntos = decode(polyline)
+    orden = _orden_importancia(puntos)
+    if max_puntos is not None:
+        orden = orden[:max(2, max_puntos)]
+
+    def con(k):
+        return encode(puntos[i] for i in sorted(i for i, _ in orden[:k]))
+
+    if max_bytes is None:
+        return con(len(orden))
+
+    # El largo crece con k: búsqueda binaria sobre k
+    lo, hi = 2, len(orden)
+    if len(quote(con(hi))) <= max_bytes:
+        return con(hi)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if len(quote(con(mid))) <= max_bytes:
+            lo = mid
+        else:
+            hi = mid - 1
+    return con(lo)
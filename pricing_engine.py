@@ -1,5 +1,7 @@
 # pricing_engine.py
 
+import math
+
 # Capacidades referenciales
 CAPACIDADES = {
     "van": 15,
@@ -20,6 +22,14 @@ RENDIMIENTO_KM_LITRO = {
 # Castigo interno para viajes cortos
 KM_UMBRAL_CORTO = 100
 
+# Flota de costo mínimo precalculada hasta esta cantidad de pasajeros; más
+# allá se agregan buses (ver _flota_optima)
+FLOTA_TABLA_MAX = 2100
+
+# Km con que se comparan los costos por vehículo (el precio es lineal en km,
+# así que la mezcla óptima no depende de los km del viaje)
+_KM_REFERENCIA = 1000
+
 
 def vehiculo_por_pasajeros(pasajeros: int) -> str:
     if pasajeros <= 15:
@@ -131,14 +141,154 @@ def _calcular_precio_por_vehiculo(
     }
 
 
+def tarifa_actual() -> dict:
+    """
+    Parámetros de pricing vigentes (para simular otra tarifa se parte de aquí).
+    """
+    return {
+        "PRECIO_DIESEL": PRECIO_DIESEL,
+        "FACTOR_COMERCIAL": FACTOR_COMERCIAL,
+        "RENDIMIENTO_KM_LITRO": dict(RENDIMIENTO_KM_LITRO),
+        "KM_UMBRAL_CORTO": KM_UMBRAL_CORTO,
+    }
+
+
+def _costos_vehiculo(tarifa: dict | None = None) -> dict:
+    """
+    Costo entero (pesos) de cada tipo de vehículo a _KM_REFERENCIA km: los
+    enteros hacen exactos los empates (bus y taxibus cuestan lo mismo).
+    Con `tarifa` se usa la misma fórmula de _calcular_precio_base_km con esos
+    parámetros.
+    """
+    if tarifa is None:
+        return {v: round(_calcular_precio_base_km(_KM_REFERENCIA, v)) for v in CAPACIDADES}
+    return {
+        v: round((_KM_REFERENCIA / tarifa["RENDIMIENTO_KM_LITRO"][v]) * tarifa["PRECIO_DIESEL"] * tarifa["FACTOR_COMERCIAL"])
+        for v in CAPACIDADES
+    }
+
+
+def _orden_tipos() -> list:
+    # De mayor a menor capacidad (orden de los items y de los conteos)
+    return sorted(CAPACIDADES, key=lambda v: -CAPACIDADES[v])
+
+
+def _dp_flota(pasajeros: int, unidades: list, costos: dict | None = None) -> list:
+    """
+    DP sobre cantidad de pasajeros: mejor[p] = flota de menor clave que lleva
+    al menos p pasajeros. Clave: (costo, n° vehículos, asientos), así a igual
+    costo gana la flota con menos vehículos y luego con menos asientos vacíos.
+
+    `unidades`: [(tipo, cantidad, ilimitado)]. Las ilimitadas se recorren en
+    orden creciente de p (se pueden repetir); las acotadas como 0/1 en orden
+    decreciente (cada paquete se usa una vez).
+    """
+    costos = costos or _costos_vehiculo()
+    tipos = _orden_tipos()
+    idx = {v: i for i, v in enumerate(tipos)}
+
+    mejor = [None] * (pasajeros + 1)
+    mejor[0] = ((0, 0, 0), (0,) * len(tipos))
+
+    for tipo, cantidad, ilimitado in unidades:
+        cap = CAPACIDADES[tipo] * cantidad
+        delta = (costos[tipo] * cantidad, cantidad, cap)
+        rango = range(1, pasajeros + 1) if ilimitado else range(pasajeros, 0, -1)
+        for p in rango:
+            previo = mejor[max(0, p - cap)]
+            if previo is None:
+                continue
+            clave = tuple(a + b for a, b in zip(previo[0], delta))
+            if mejor[p] is None or clave < mejor[p][0]:
+                conteo = list(previo[1])
+                conteo[idx[tipo]] += cantidad
+                mejor[p] = (clave, tuple(conteo))
+    return mejor
+
+
+def construir_tabla_flota(max_pasajeros: int = FLOTA_TABLA_MAX, tarifa: dict | None = None) -> list:
+    """
+    Tabla pasajeros -> conteo de vehículos (en orden _orden_tipos) de costo
+    mínimo, sin límites de disponibilidad. Hay que reconstruirla si cambian
+    CAPACIDADES o RENDIMIENTO_KM_LITRO (PRECIO_DIESEL y FACTOR_COMERCIAL
+    escalan todo por igual y no cambian la mezcla).
+    """
+    mejor = _dp_flota(max_pasajeros, [(v, 1, True) for v in _orden_tipos()], _costos_vehiculo(tarifa))
+    return [m[1] for m in mejor]
+
+
+_TABLA_FLOTA = construir_tabla_flota()
+
+
+def _flota_optima(pasajeros: int) -> dict:
+    """
+    Flota de costo mínimo sin límites, O(1) por tabla. Vale para cualquier
+    cantidad de pasajeros (también las que caben en un vehículo: de 16 a 30
+    salen 2 vans, más baratas que un taxibus).
+
+    Sobre FLOTA_TABLA_MAX se agregan buses y el resto sale de la tabla: en una
+    flota óptima nunca hay 3 vans (1 bus lleva lo mismo y cuesta menos) ni 3
+    vehículos de 30 (2 buses), así que todo lo que pasa de unos 120 pasajeros
+    va en buses (el vehículo de menor costo por asiento).
+    """
+    tipos = _orden_tipos()
+    extra = 0
+    if pasajeros > FLOTA_TABLA_MAX:
+        mayor = tipos[0]
+        extra = math.ceil((pasajeros - FLOTA_TABLA_MAX) / CAPACIDADES[mayor])
+        pasajeros -= extra * CAPACIDADES[mayor]
+    conteo = dict(zip(tipos, _TABLA_FLOTA[pasajeros]))
+    conteo[tipos[0]] += extra
+    return conteo
+
+
+def resolver_flota(pasajeros: int, disponibles: dict | None = None) -> dict:
+    """
+    Cantidad de cada tipo de vehículo ({"bus": 2, "van": 1, ...}) que lleva a
+    todos los pasajeros al menor costo.
+
+    disponibles: límite opcional por tipo (ej: {"bus": 3, "taxibus": 0}); los
+    tipos que no aparecen no tienen límite.
+    """
+    if pasajeros <= 0:
+        raise Exception("Pasajeros inválidos")
+
+    conteo = _flota_optima(pasajeros)
+    if not disponibles or all(conteo[v] <= disponibles.get(v, conteo[v]) for v in conteo):
+        return {v: n for v, n in conteo.items() if n}
+
+    # Con límites: los acotados se parten en paquetes 1, 2, 4, ... (cualquier
+    # cantidad hasta el límite sale de sumar paquetes) y se resuelve la DP
+    unidades = []
+    for v in _orden_tipos():
+        limite = disponibles.get(v)
+        if limite is None:
+            unidades.append((v, 1, True))
+            continue
+        limite = min(int(limite), math.ceil(pasajeros / CAPACIDADES[v]))
+        k = 1
+        while limite > 0:
+            unidades.append((v, min(k, limite), False))
+            limite -= k
+            k *= 2
+
+    mejor = _dp_flota(pasajeros, unidades)[pasajeros]
+    if mejor is None:
+        raise Exception(f"No hay vehículos disponibles para {pasajeros} pasajeros")
+    return {v: n for v, n in zip(_orden_tipos(), mejor[1]) if n}
+
+
 def calcular_cotizacion_flotilla(
     km_total: float,
     horas_total: float,
     pasajeros: int,
-    km_base_origen: float = 0
+    km_base_origen: float = 0,
+    disponibles: dict | None = None
 ) -> dict:
     """
-    Calcula cotización con 1 o más vehículos según cantidad de pasajeros.
+    Calcula cotización con 1 o más vehículos según cantidad de pasajeros,
+    con la flota de menor costo (resolver_flota). `disponibles`: límite
+    opcional de vehículos por tipo.
     """
 
     if pasajeros <= 0:
@@ -146,65 +296,22 @@ def calcular_cotizacion_flotilla(
 
     items = []
 
-    vehiculo_simple = vehiculo_por_pasajeros(pasajeros)
-
-    if pasajeros <= CAPACIDADES[vehiculo_simple]:
-        detalle = _calcular_precio_por_vehiculo(
-            km_total=km_total,
-            horas_total=horas_total,
-            vehiculo=vehiculo_simple,
-            pasajeros_asignados=pasajeros,
-            km_base_origen=km_base_origen
-        )
-        items.append(detalle)
-
-    else:
-        restantes = pasajeros
-
-        while restantes > CAPACIDADES["bus"]:
-            detalle = _calcular_precio_por_vehiculo(
-                km_total=km_total,
-                horas_total=horas_total,
-                vehiculo="bus",
-                pasajeros_asignados=CAPACIDADES["bus"],
-                km_base_origen=km_base_origen
-            )
-            items.append(detalle)
-            restantes -= CAPACIDADES["bus"]
-
-        if restantes > 0:
-            if restantes <= CAPACIDADES["van"]:
-                items.append(
-                    _calcular_precio_por_vehiculo(
-                        km_total=km_total,
-                        horas_total=horas_total,
-                        vehiculo="van",
-                        pasajeros_asignados=restantes,
-                        km_base_origen=km_base_origen
-                    )
-                )
-
-            elif restantes <= CAPACIDADES["taxibus"]:
-                items.append(
-                    _calcular_precio_por_vehiculo(
-                        km_total=km_total,
-                        horas_total=horas_total,
-                        vehiculo="taxibus",
-                        pasajeros_asignados=restantes,
-                        km_base_origen=km_base_origen
-                    )
-                )
-
-            else:
-                items.append(
-                    _calcular_precio_por_vehiculo(
-                        km_total=km_total,
-                        horas_total=horas_total,
-                        vehiculo="bus",
-                        pasajeros_asignados=restantes,
-                        km_base_origen=km_base_origen
-                    )
+    # Se llenan primero los vehículos grandes; el último lleva el resto
+    restantes = pasajeros
+    flota = resolver_flota(pasajeros, disponibles)
+    for vehiculo in _orden_tipos():
+        for _ in range(flota.get(vehiculo, 0)):
+            asignados = min(CAPACIDADES[vehiculo], restantes)
+            items.append(
+                _calcular_precio_por_vehiculo(
+                    km_total=km_total,
+                    horas_total=horas_total,
+                    vehiculo=vehiculo,
+                    pasajeros_asignados=asignados,
+                    km_base_origen=km_base_origen
                 )
+            )
+            restantes -= asignados
 
     total_costo_base = sum(x["costo_base"] for x in items)
     total_utilidad = sum(x["utilidad"] for x in items)
@@ -253,3 +360,60 @@ def resumen_flotilla(items: list[dict]) -> str:
             partes.append(f"{n} {nombre_vehiculo(v, n)} ({cap} pax c/u)")
 
     return " + ".join(partes)
+
+
+def _nombre_vehiculo(veh: str) -> str:
+    if veh == "bus":
+        return "Bus"
+    if veh == "van":
+        return "Van"
+    if veh == "taxibus":
+        return "Taxibus"
+    return str(veh).capitalize()
+
+
+def _detalle_vehiculos(items: list[dict]) -> str:
+    """
+    Texto “humano” del detalle (uno por línea), para el PDF.
+    """
+    detalle_txt = []
+    for item in items:
+        nombre = _nombre_vehiculo(item.get("vehiculo", ""))
+        pax = item.get("pasajeros_asignados", 0)
+        precio_item = item.get("precio_final", 0)
+        detalle_txt.append(f"- {nombre} de {pax} pasajeros: ${precio_item}")
+    return "\n".join(detalle_txt)
+
+
+def calcular_precio_usuario(pasajeros: int, km_total: float, horas_total: float, km_base_origen: float) -> dict:
+    """
+    Retorna los campos de precio a guardar en el usuario:
+    Vehiculo, Precio y Detalle Vehiculos.
+
+    Toda cantidad de pasajeros pasa por la flota de costo mínimo
+    (resolver_flota), así 30 y 46 pasajeros se cotizan con la misma regla.
+    """
+    resultado = calcular_cotizacion_flotilla(
+        km_total=km_total,
+        horas_total=horas_total,
+        pasajeros=pasajeros,
+        km_base_origen=km_base_origen
+    )
+    items = resultado["items"]
+
+    if len(items) == 1:
+        # Un solo vehículo: sin detalle, como calcular_precio
+        return {
+            "Vehiculo": items[0].get("vehiculo", ""),
+            "Precio": resultado["precio_final_total"],
+            "Detalle Vehiculos": "",
+        }
+
+    # Vehiculo: resumen tipo "2 buses (45 pax c/u) + 1 van (15 pax c/u)" (NO "MULTI")
+    vehiculo = resumen_flotilla(items)
+
+    return {
+        "Vehiculo": vehiculo,
+        "Precio": round(resultado["precio_final_total"], 0),
+        "Detalle Vehiculos": _detalle_vehiculos(items),
+    }
@@ -0,0 +1,208 @@
+# pricing_lote.py
+#
+# Pricing vectorizado (numpy) para muchos viajes a la vez, con los mismos
+# resultados que el camino escalar del bot (pricing_engine.calcular_precio_usuario):
+# mismo orden de operaciones en float64 y redondeo al par
+# por vehículo, como round().
+#
+# Sirve para ver el efecto de un cambio de tarifa sobre todo el historial:
+#
+#   python pricing_lote.py simular <export.csv> [--diesel P] [--factor F] [--umbral K] [--rendimiento tipo=R ...]
+#   python pricing_lote.py simular --sinteticos 1000000 [...]
+
+import sys
+import time
+
+import numpy as np
+
+import pricing_engine
+from pricing_engine import CAPACIDADES, FLOTA_TABLA_MAX
+
+# Columnas de los conteos de vehículos (de mayor a menor capacidad)
+TIPOS = pricing_engine._orden_tipos()
+
+_tablas = {}
+
+
+def _tabla_conteos(tarifa: dict | None) -> np.ndarray:
+    """
+    pasajeros -> conteo por tipo de la flota de costo mínimo, igual que
+    calcular_precio_usuario. Sin `tarifa` se usa la tabla vigente de
+    pricing_engine; con otra tarifa se arma (y se guarda) la suya.
+    """
+    if tarifa is None:
+        flota = pricing_engine._TABLA_FLOTA
+        clave = ("vigente", id(flota))
+    else:
+        clave = tuple(sorted(pricing_engine._costos_vehiculo(tarifa).items()))
+        flota = None
+
+    tabla = _tablas.get(clave)
+    if tabla is None:
+        if flota is None:
+            flota = pricing_engine.construir_tabla_flota(tarifa=tarifa)
+        tabla = np.array(flota, dtype=np.int64)
+        _tablas[clave] = tabla
+    return tabla
+
+
+def calcular_precios_lote(km_total, pasajeros, km_base_origen=None, tarifa: dict | None = None) -> dict:
+    """
+    km_total, pasajeros, km_base_origen: arrays (o listas) del mismo largo.
+    tarifa: como pricing_engine.tarifa_actual(); None = parámetros vigentes.
+
+    Retorna:
+    - "conteos": (n, len(TIPOS)) vehículos de cada tipo por viaje
+    - "precio_vehiculo": (n, len(TIPOS)) precio redondeado de un vehículo de cada tipo
+    - "precio": (n,) precio total (el "Precio" de calcular_precio_usuario)
+    """
+    t = tarifa or pricing_engine.tarifa_actual()
+
+    km = np.asarray(km_total, dtype=np.float64)
+    pax = np.asarray(pasajeros, dtype=np.int64)
+    base = np.zeros_like(km) if km_base_origen is None else np.asarray(km_base_origen, dtype=np.float64)
+
+    if (pax <= 0).any():
+        raise Exception("Pasajeros inválidos")
+    if (km <= 0).any():
+        raise Exception("Kilómetros inválidos")
+
+    # Castigo de viaje corto: misma condición que _calcular_precio_base_km
+    km_tarifarios = np.where((km < t["KM_UMBRAL_CORTO"]) & (base > 0), km + base, km)
+
+    # Sobre la tabla se agregan buses (igual que pricing_engine._flota_optima)
+    mayor = CAPACIDADES[TIPOS[0]]
+    extra = np.maximum(0, -(-(pax - FLOTA_TABLA_MAX) // mayor))
+    conteos = _tabla_conteos(tarifa)[pax - extra * mayor]
+    conteos[:, 0] += extra
+
+    precio_vehiculo = np.empty((len(km), len(TIPOS)), dtype=np.int64)
+    for j, v in enumerate(TIPOS):
+        # (km / rendimiento) * diesel * factor, en ese orden; rint redondea al par
+        precio_vehiculo[:, j] = np.rint(
+            (km_tarifarios / t["RENDIMIENTO_KM_LITRO"][v]) * t["PRECIO_DIESEL"] * t["FACTOR_COMERCIAL"]
+        )
+
+    return {
+        "conteos": conteos,
+        "precio_vehiculo": precio_vehiculo,
+        "precio": (conteos * precio_vehiculo).sum(axis=1),
+    }
+
+
+def simular(km_total, pasajeros, km_base_origen, tarifa_a: dict, tarifa_b: dict) -> dict:
+    """
+    Compara dos tarifas sobre los mismos viajes.
+    """
+    t0 = time.perf_counter()
+    a = calcular_precios_lote(km_total, pasajeros, km_base_origen, tarifa_a)
+    b = calcular_precios_lote(km_total, pasajeros, km_base_origen, tarifa_b)
+
+    total_a = int(a["precio"].sum())
+    total_b = int(b["precio"].sum())
+    variacion = (b["precio"] - a["precio"]) / a["precio"]
+    cambio_flota = (a["conteos"] != b["conteos"]).any(axis=1)
+
+    return {
+        "viajes": len(a["precio"]),
+        "total_a": total_a,
+        "total_b": total_b,
+        "variacion_total": round((total_b - total_a) / total_a, 6) if total_a else 0.0,
+        "delta_promedio": round(float((b["precio"] - a["precio"]).mean()), 1),
+        "variacion_p50": round(float(np.percentile(variacion, 50)), 6),
+        "variacion_p95": round(float(np.percentile(variacion, 95)), 6),
+        "viajes_con_otra_flota": int(cambio_flota.sum()),
+        "vehiculos_a": {v: int(n) for v, n in zip(TIPOS, a["conteos"].sum(axis=0))},
+        "vehiculos_b": {v: int(n) for v, n in zip(TIPOS, b["conteos"].sum(axis=0))},
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+def viajes_sinteticos(n: int, seed: int = 1) -> tuple:
+    """
+    Viajes con forma parecida al historial: la mayoría cortos y de pocos
+    pasajeros, con cola de viajes largos y grupos grandes.
+    """
+    rnd = np.random.default_rng(seed)
+    km = np.round(rnd.lognormal(np.log(80), 0.8, n), 2) + 1
+    pax = np.where(rnd.random(n) < 0.7, rnd.integers(1, 46, n), rnd.integers(46, 400, n))
+    base = np.where(km < 100, np.round(rnd.uniform(0, 60, n), 2), 0.0)
+    return km, pax, base
+
+
+def viajes_csv(path: str) -> tuple:
+    """
+    KM Total, Pasajeros y KM Base del export de la hoja (las filas PENDIENTE se saltan).
+    """
+    from reemitir import _numero, filas_csv
+
+    km, pax, base = [], [], []
+    for u in filas_csv(path):
+        k, p = _numero(u.get("KM Total")), _numero(u.get("Pasajeros"))
+        if k and p and k > 0 and p > 0:
+            km.append(k)
+            pax.append(int(p))
+            base.append(_numero(u.get("KM Base")) or 0.0)
+    return np.array(km), np.array(pax, dtype=np.int64), np.array(base)
+
+
+def main(argv: list[str]) -> int:
+    uso = (
+        "Uso: python pricing_lote.py simular <export.csv> [--diesel P] [--factor F] [--umbral K] [--rendimiento tipo=R ...]\n"
+        "     python pricing_lote.py simular --sinteticos N [...]"
+    )
+    if len(argv) < 2 or argv[0] != "simular":
+        print(uso)
+        return 2
+
+    tarifa_a = pricing_engine.tarifa_actual()
+    tarifa_b = pricing_engine.tarifa_actual()
+    fuente = None
+    args = iter(argv[1:])
+    try:
+        for a in args:
+            if a == "--sinteticos":
+                fuente = int(next(args))
+            elif a == "--diesel":
+                tarifa_b["PRECIO_DIESEL"] = float(next(args))
+            elif a == "--factor":
+                tarifa_b["FACTOR_COMERCIAL"] = float(next(args))
+            elif a == "--umbral":
+                tarifa_b["KM_UMBRAL_CORTO"] = float(next(args))
+            elif a == "--rendimiento":
+                tipo, valor = next(args).split("=")
+                if tipo not in tarifa_b["RENDIMIENTO_KM_LITRO"]:
+                    raise ValueError(tipo)
+                tarifa_b["RENDIMIENTO_KM_LITRO"][tipo] = float(valor)
+            else:
+                fuente = a
+    except (StopIteration, ValueError):
+        print(uso)
+        return 2
+
+    t0 = time.perf_counter()
+    if isinstance(fuente, int):
+        km, pax, base = viajes_sinteticos(fuente)
+    elif fuente:
+        km, pax, base = viajes_csv(fuente)
+    else:
+        print(uso)
+        return 2
+    print(f"{len(km)} viajes cargados en {time.perf_counter() - t0:.1f} s")
+
+    print("Tarifa A:", tarifa_a)
+    print("Tarifa B:", tarifa_b)
+    res = simular(km, pax, base, tarifa_a, tarifa_b)
+    print(
+        f"Ingreso total: ${res['total_a']:,} -> ${res['total_b']:,} ({res['variacion_total']:+.2%})\n"
+        f"Por viaje: delta promedio ${res['delta_promedio']:,} | p50 {res['variacion_p50']:+.2%} | p95 {res['variacion_p95']:+.2%}\n"
+        f"Viajes con otra flota: {res['viajes_con_otra_flota']}\n"
+        f"Vehículos A: {res['vehiculos_a']}\n"
+        f"Vehículos B: {res['vehiculos_b']}\n"
+        f"✅ {res['viajes']} viajes comparados en {res['ms']} ms"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
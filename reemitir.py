@@ -0,0 +1,276 @@
+# reemitir.py
+#
+# Recotiza y reemite cotizaciones antiguas en lote (ej: después de un cambio
+# de PRECIO_DIESEL), sin reproducir conversaciones a mano.
+#
+# Lee las filas de la hoja (o de un CSV exportado de ella), vuelve a calcular
+# el precio con pricing_engine usando los KM guardados y genera el PDF con
+# pdf_generator, repartido en un pool de procesos. Las filas se leen y se
+# escriben en streaming: la memoria no crece con la cantidad de cotizaciones.
+#
+#   python reemitir.py csv <export.csv> <salida_dir> [--workers N] [--diesel P] [--factor F]
+#   python reemitir.py sheets <salida_dir> [--workers N] [--diesel P] [--factor F]
+#
+# En <salida_dir> quedan los PDFs y resumen.csv (precio anterior vs nuevo).
+
+import csv
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+REEMITIR_WORKERS = int(os.getenv("REEMITIR_WORKERS", str(os.cpu_count() or 2)))
+
+# Filas por lectura a Google Sheets
+REEMITIR_BLOQUE_SHEETS = int(os.getenv("REEMITIR_BLOQUE_SHEETS", "500"))
+
+# Mismo orden que bot.guardar_en_sheet
+COLUMNAS = (
+    "Timestamp", "cotizacion_id", "Nombre", "Correo", "Fecha Viaje", "Pasajeros",
+    "Origen", "Destino", "Hora Ida", "Hora Regreso", "Telefono", "Estado", "Fecha Respuesta",
+    "KM Total", "KM Base", "Horas Total", "Vehiculo", "Precio",
+)
+
+COLUMNAS_RESUMEN = (
+    "cotizacion_id", "estado", "pasajeros", "km_total", "vehiculo",
+    "precio_anterior", "precio_nuevo", "diferencia", "pdf", "error",
+)
+
+
+def _numero(valor) -> float | None:
+    """
+    "123,45" / "123.45" / "1.234.567" / 123 -> float. None si no es número.
+    """
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    txt = str(valor or "").strip().replace("$", "").replace(" ", "")
+    if not txt:
+        return None
+    if "," in txt:
+        txt = txt.replace(".", "").replace(",", ".")
+    elif txt.count(".") > 1:
+        txt = txt.replace(".", "")
+    try:
+        return float(txt)
+    except ValueError:
+        return None
+
+
+def _monto(valor) -> int | None:
+    """
+    Precio en pesos: el punto es separador de miles ("$123.456" -> 123456,
+    "$1.234.567,5" -> 1234568). None si no es número.
+    """
+    if isinstance(valor, (int, float)):
+        return round(valor)
+    txt = str(valor or "").strip().replace("$", "").replace(" ", "")
+    if re.fullmatch(r"\d{1,3}(\.\d{3})+(,\d*)?", txt):
+        txt = txt.replace(".", "")
+    n = _numero(txt)
+    return None if n is None else round(n)
+
+
+def _a_usuario(fila: list) -> dict:
+    fila = list(fila) + [""] * (len(COLUMNAS) - len(fila))
+    return dict(zip(COLUMNAS, fila))
+
+
+def _es_encabezado(fila: list) -> bool:
+    return len(fila) > 1 and str(fila[1]).strip().lower().startswith("id")
+
+
+def filas_csv(path: str):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for i, fila in enumerate(csv.reader(f)):
+            if i == 0 and _es_encabezado(fila):
+                continue
+            if any(c.strip() for c in fila):
+                yield _a_usuario(fila)
+
+
+def filas_sheets(bloque: int = REEMITIR_BLOQUE_SHEETS):
+    """
+    Lee la hoja por rangos de `bloque` filas (misma hoja y credenciales que bot.py).
+    """
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    scope = ["https://spreadsheets.google.com/feeds",
+             "https://www.googleapis.com/auth/drive"]
+    credentials = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
+    sheet = gspread.authorize(credentials).open_by_key(os.getenv("GOOGLE_SHEETS_ID")).sheet1
+
+    ultima_col = chr(ord("A") + len(COLUMNAS) - 1)
+    inicio = 1
+    while True:
+        # Números sin formato ("$123.456" se leería como 123.456); fechas y
+        # horas como texto, igual que se ven en la hoja
+        filas = sheet.get(
+            f"A{inicio}:{ultima_col}{inicio + bloque - 1}",
+            value_render_option="UNFORMATTED_VALUE",
+            date_time_render_option="FORMATTED_STRING",
+        )
+        if not filas:
+            return
+        for i, fila in enumerate(filas):
+            if inicio == 1 and i == 0 and _es_encabezado(fila):
+                continue
+            if any(str(c).strip() for c in fila):
+                yield _a_usuario(fila)
+        if len(filas) < bloque:
+            return
+        inicio += bloque
+
+
+# -------- Worker (proceso hijo) --------
+_salida = None
+
+
+def _iniciar_worker(salida_dir: str, diesel: float | None, factor: float | None):
+    global _salida
+    import pricing_engine
+    from artefactos import DirectorioArtefactos
+
+    if diesel is not None:
+        pricing_engine.PRECIO_DIESEL = diesel
+    if factor is not None:
+        pricing_engine.FACTOR_COMERCIAL = factor
+
+    # Sin tope: la salida de un lote no se poda
+    _salida = DirectorioArtefactos(salida_dir, max_bytes=1 << 62)
+
+
+def reemitir_fila(u: dict) -> dict:
+    """
+    Recotiza una fila con los KM guardados y genera su PDF (sin mapa: el
+    PNG original ya no está). Retorna la fila del resumen.
+    """
+    # pricing_engine y no cotizacion: este no abre caches, pools ni índices de maps
+    from pricing_engine import calcular_precio_usuario
+    from pdf_generator import generar_pdf_cotizacion
+
+    resumen = {
+        "cotizacion_id": u.get("cotizacion_id", ""),
+        "pasajeros": u.get("Pasajeros", ""),
+        "km_total": u.get("KM Total", ""),
+        "precio_anterior": u.get("Precio", ""),
+    }
+
+    pasajeros = _numero(u.get("Pasajeros"))
+    km_total = _numero(u.get("KM Total"))
+    if not pasajeros or not km_total:
+        return dict(resumen, estado="omitida", error="sin pasajeros o KM (cotización PENDIENTE)")
+
+    try:
+        campos = calcular_precio_usuario(
+            int(pasajeros), km_total, _numero(u.get("Horas Total")) or 0, _numero(u.get("KM Base")) or 0
+        )
+        u = {**u, **campos, "Pasajeros": int(pasajeros), "Mapa Ruta": ""}
+        pdf = generar_pdf_cotizacion(u, artefactos=_salida)
+    except Exception as e:
+        return dict(resumen, estado="error", error=str(e))
+
+    anterior = _monto(resumen["precio_anterior"])
+    return dict(
+        resumen,
+        estado="ok",
+        km_total=round(km_total, 2),
+        vehiculo=campos["Vehiculo"],
+        precio_nuevo=campos["Precio"],
+        diferencia=round(campos["Precio"] - anterior) if anterior is not None else "",
+        pdf=os.path.basename(pdf),
+    )
+
+
+# -------- Lote --------
+def reemitir(filas, salida_dir: str, workers: int = REEMITIR_WORKERS,
+             diesel: float | None = None, factor: float | None = None,
+             progreso=None, progreso_cada: int = 1000) -> dict:
+    """
+    Reparte las filas en el pool con una ventana acotada de trabajos en vuelo
+    (executor.map encolaría todo el iterable de una vez) y escribe el resumen
+    en el mismo orden de entrada. `progreso(n, por_segundo)` se llama cada
+    `progreso_cada` filas (None: sin avisos).
+    """
+    os.makedirs(salida_dir, exist_ok=True)
+    ventana = max(1, workers) * 4
+    conteo = {"ok": 0, "omitida": 0, "error": 0}
+
+    t0 = time.perf_counter()
+    resumen_path = os.path.join(salida_dir, "resumen.csv")
+    with open(resumen_path, "w", newline="", encoding="utf-8") as f, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker,
+                                initargs=(salida_dir, diesel, factor)) as pool:
+        w = csv.DictWriter(f, fieldnames=COLUMNAS_RESUMEN, restval="")
+        w.writeheader()
+
+        pendientes = deque()
+
+        def escribir(fut):
+            fila = fut.result()
+            conteo[fila["estado"]] += 1
+            w.writerow(fila)
+            n = sum(conteo.values())
+            if progreso is not None and n % progreso_cada == 0:
+                progreso(n, n / (time.perf_counter() - t0))
+
+        for u in filas:
+            pendientes.append(pool.submit(reemitir_fila, u))
+            if len(pendientes) >= ventana:
+                escribir(pendientes.popleft())
+        while pendientes:
+            escribir(pendientes.popleft())
+
+    segundos = time.perf_counter() - t0
+    total = sum(conteo.values())
+    return dict(
+        conteo,
+        total=total,
+        segundos=round(segundos, 2),
+        por_segundo=round(total / segundos, 1) if segundos else 0.0,
+        resumen=resumen_path,
+    )
+
+
+def main(argv: list[str]) -> int:
+    uso = (
+        "Uso: python reemitir.py csv <export.csv> <salida_dir> [--workers N] [--diesel P] [--factor F]\n"
+        "     python reemitir.py sheets <salida_dir> [--workers N] [--diesel P] [--factor F]"
+    )
+    opciones = {"--workers": None, "--diesel": None, "--factor": None}
+    posicionales = []
+    args = iter(argv)
+    for a in args:
+        if a in opciones:
+            opciones[a] = next(args, None)
+        else:
+            posicionales.append(a)
+
+    if posicionales[:1] == ["csv"] and len(posicionales) == 3:
+        filas, salida = filas_csv(posicionales[1]), posicionales[2]
+    elif posicionales[:1] == ["sheets"] and len(posicionales) == 2:
+        filas, salida = filas_sheets(), posicionales[1]
+    else:
+        print(uso)
+        return 2
+
+    res = reemitir(
+        filas,
+        salida,
+        workers=int(opciones["--workers"] or REEMITIR_WORKERS),
+        diesel=float(opciones["--diesel"]) if opciones["--diesel"] else None,
+        factor=float(opciones["--factor"]) if opciones["--factor"] else None,
+        progreso=lambda n, por_s: print(f"… {n} cotizaciones ({por_s:.1f}/s)"),
+    )
+    print(
+        f"✅ {res['total']} cotizaciones en {res['segundos']} s ({res['por_segundo']}/s) | "
+        f"ok {res['ok']} | omitidas {res['omitida']} | errores {res['error']}\n"
+        f"Resumen: {res['resumen']}"
+    )
+    return 0 if res["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
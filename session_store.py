@@ -0,0 +1,323 @@
+# session_store.py
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite | redis
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "/tmp/ecobus_sesiones.db")
+SESSION_FLUSH_MS = int(os.getenv("SESSION_FLUSH_MS", "200"))
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", str(3 * 24 * 3600)))
+# Cada cuánto el hilo de flush borra del backend las sesiones vencidas
+SESSION_PURGA_S = float(os.getenv("SESSION_PURGA_S", "3600"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+# -------- Backends --------
+class MemoryBackend:
+    """
+    Backend en proceso. No comparte estado entre workers de gunicorn.
+    """
+    compartido = False
+
+    def __init__(self):
+        self._data = {}
+
+    def cargar(self, clave):
+        return self._data.get(clave)
+
+    def guardar_lote(self, items: dict):
+        self._data.update(items)
+
+    def borrar(self, clave):
+        self._data.pop(clave, None)
+
+
+class SQLiteBackend:
+    """
+    Backend SQLite en modo WAL: varios procesos pueden leer mientras uno escribe.
+    Los datos se guardan como JSON serializado.
+    """
+    compartido = True
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl_s: int = SESSION_TTL_S):
+        self.path = path
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sesiones ("
+            " clave TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " actualizado REAL NOT NULL)"
+        )
+        self.purgar()
+
+    def cargar(self, clave):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sesiones WHERE clave = ?", (clave,)).fetchone()
+        return row[0] if row else None
+
+    def guardar_lote(self, items: dict):
+        ahora = time.time()
+        filas = [(k, v, ahora) for k, v in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sesiones (clave, data, actualizado) VALUES (?, ?, ?)",
+                    filas
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def borrar(self, clave):
+        with self._lock:
+            self._conn.execute("DELETE FROM sesiones WHERE clave = ?", (clave,))
+
+    def purgar(self):
+        limite = time.time() - self.ttl_s
+        with self._lock:
+            self._conn.execute("DELETE FROM sesiones WHERE actualizado < ?", (limite,))
+
+
+class RedisBackend:
+    """
+    Backend compatible con Redis. Acepta cualquier cliente con get/set/delete
+    (y opcionalmente pipeline), así se puede reemplazar por un stand-in local.
+    """
+    compartido = True
+
+    def __init__(self, cliente=None, url: str = REDIS_URL, prefijo: str = "ecobus:sesion:",
+                 ttl_s: int = SESSION_TTL_S):
+        if cliente is None:
+            # ✅ Import “lazy”: redis es opcional
+            import redis
+            cliente = redis.Redis.from_url(url)
+
+        self.cliente = cliente
+        self.prefijo = prefijo
+        self.ttl_s = ttl_s
+
+    def _k(self, clave) -> str:
+        return f"{self.prefijo}{clave}"
+
+    def cargar(self, clave):
+        v = self.cliente.get(self._k(clave))
+        if isinstance(v, bytes):
+            v = v.decode("utf-8")
+        return v
+
+    def guardar_lote(self, items: dict):
+        if hasattr(self.cliente, "pipeline"):
+            pipe = self.cliente.pipeline()
+            for k, v in items.items():
+                pipe.set(self._k(k), v, ex=self.ttl_s)
+            pipe.execute()
+            return
+
+        for k, v in items.items():
+            self.cliente.set(self._k(k), v, ex=self.ttl_s)
+
+    def borrar(self, clave):
+        self.cliente.delete(self._k(clave))
+
+
+# -------- Sesiones --------
+class Sesiones(MutableMapping):
+    """
+    Reemplazo de `usuarios = {}` respaldado por un backend.
+
+    - Lecturas: O(1) desde la cache local; si no está, una lectura por clave al backend.
+    - Escrituras: `marcar(clave)` serializa la sesión y la deja pendiente; un hilo
+      escribe todas las pendientes en un solo lote cada SESSION_FLUSH_MS.
+    - `refrescar(clave)` descarta la copia local para leer la versión compartida
+      (otro worker pudo haber procesado el mensaje anterior).
+    - El mismo hilo llama a `backend.purgar()` (si existe) cada `purga_s`.
+    """
+
+    def __init__(self, backend=None, flush_ms: int = SESSION_FLUSH_MS, purga_s: float = SESSION_PURGA_S):
+        self.backend = backend or MemoryBackend()
+        self.flush_s = max(0.0, flush_ms / 1000)
+        self.purga_s = purga_s
+        self._ultima_purga = time.time()
+
+        self._cache = {}
+        self._pendientes = {}
+        self._lock = threading.RLock()
+        # Serializa escrituras y borrados en el backend: un borrado no puede
+        # caer entre que flush() toma el lote y lo escribe (resucitaría la sesión)
+        self._lock_backend = threading.Lock()
+        self._evento = threading.Event()
+        self._hilo = None
+        self._pid = None
+
+        self._lecturas = 0
+        self._escrituras = 0
+        self._lotes = 0
+
+        atexit.register(self.flush)
+
+    # --- MutableMapping ---
+    def __getitem__(self, clave):
+        with self._lock:
+            if clave in self._cache:
+                return self._cache[clave]
+
+            raw = self._pendientes.get(clave)
+
+        if raw is None and self.backend.compartido:
+            with self._lock:
+                self._lecturas += 1
+            raw = self.backend.cargar(clave)
+
+        if raw is None:
+            raise KeyError(clave)
+
+        sesion = json.loads(raw) if isinstance(raw, str) else raw
+        with self._lock:
+            self._cache[clave] = sesion
+        return sesion
+
+    def __setitem__(self, clave, sesion):
+        with self._lock:
+            self._cache[clave] = sesion
+        self.marcar(clave)
+
+    def __delitem__(self, clave):
+        with self._lock_backend:
+            with self._lock:
+                existia = self._cache.pop(clave, None) is not None
+                existia = self._pendientes.pop(clave, None) is not None or existia
+            self.backend.borrar(clave)
+        if not existia and not self.backend.compartido:
+            raise KeyError(clave)
+
+    def __contains__(self, clave):
+        try:
+            self[clave]
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._cache))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+    # --- persistencia ---
+    def refrescar(self, clave):
+        if not self.backend.compartido:
+            return
+        with self._lock:
+            self._cache.pop(clave, None)
+
+    def marcar(self, clave):
+        """
+        Deja la sesión pendiente de escritura (se escribe en el próximo lote).
+        """
+        with self._lock:
+            sesion = self._cache.get(clave)
+            if sesion is None:
+                return
+
+            if not self.backend.compartido:
+                self.backend.guardar_lote({clave: sesion})
+                return
+
+            self._pendientes[clave] = json.dumps(sesion, ensure_ascii=False, default=str)
+
+        self._asegurar_hilo()
+        self._evento.set()
+
+    def flush(self):
+        # Con _lock_backend tomado ningún borrado corre entre tomar el lote,
+        # escribirlo y (si falla) re-encolarlo
+        with self._lock_backend:
+            with self._lock:
+                lote = self._pendientes
+                self._pendientes = {}
+
+            if not lote:
+                return
+
+            try:
+                self.backend.guardar_lote(lote)
+                self._escrituras += len(lote)
+                self._lotes += 1
+            except Exception as e:
+                print("❌ Error guardando sesiones:", repr(e))
+                # Re-encolar sin pisar versiones más nuevas
+                with self._lock:
+                    for k, v in lote.items():
+                        self._pendientes.setdefault(k, v)
+
+    def _asegurar_hilo(self):
+        # Tras un fork el hilo del padre no existe en el hijo
+        if self._hilo is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._hilo is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._loop, name="sesiones-flush", daemon=True)
+            self._hilo.start()
+
+    def _loop(self):
+        while True:
+            if self._evento.wait(timeout=self.purga_s):
+                time.sleep(self.flush_s)  # junta cambios en un solo lote
+                self._evento.clear()
+                self.flush()
+
+            if time.time() - self._ultima_purga >= self.purga_s:
+                self._ultima_purga = time.time()
+                self.purgar()
+
+    def purgar(self):
+        """
+        Borra del backend las sesiones vencidas (SESSION_TTL_S). Redis las
+        vence solo; SQLite necesita que alguien las borre.
+        """
+        purgar = getattr(self.backend, "purgar", None)
+        if purgar is None:
+            return
+        try:
+            purgar()
+        except Exception as e:
+            print("⚠️ Error purgando sesiones:", repr(e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            pendientes = len(self._pendientes)
+            en_cache = len(self._cache)
+        return {
+            "backend": type(self.backend).__name__,
+            "en_cache": en_cache,
+            "pendientes": pendientes,
+            "lecturas_backend": self._lecturas,
+            "escrituras": self._escrituras,
+            "lotes": self._lotes,
+        }
+
+
+def crear_sesiones(backend: str = SESSION_BACKEND) -> Sesiones:
+    if backend == "sqlite":
+        return Sesiones(SQLiteBackend())
+    if backend == "redis":
+        return Sesiones(RedisBackend())
+    if backend == "memory":
+        return Sesiones(MemoryBackend())
+    raise ValueError(f"SESSION_BACKEND inválido: {backend}")
@@ -0,0 +1,201 @@
+# tiles.py
+#
+# Cache en disco de tiles raster (XYZ, Web Mercator) para dibujar mapas sin
+# llamar a la Static Images API (MAPA_MODO=local, opcional). Orden de búsqueda:
+#   1) MAPA_TILES_SEED_DIR: tiles pre-sembrados (solo lectura, sirve offline)
+#   2) MAPA_TILES_DIR: cache LRU acotada por MAPA_TILES_MAX_MB
+#   3) descarga (MAPA_TILE_URL) y se guarda en la cache
+#
+# ⚠️ MAPA_TILE_URL no trae valor por defecto: guardar tiles en disco solo vale
+# con una fuente cuya licencia lo permita (ej: un servidor de tiles propio con
+# datos de OpenStreetMap). Los tiles de Mapbox y los de tile.openstreetmap.org
+# no se pueden descargar en masa ni guardar para uso offline.
+#
+# Sembrar una zona desde esa fuente (ej: RM + Valparaíso, zoom 8 a 13):
+#   MAPA_TILE_URL="https://tiles.ejemplo.cl/{z}/{x}/{y}.png" \
+#   python tiles.py sembrar data/tiles -34.2 -71.8 -32.9 -70.3 8 13
+
+import math
+import os
+import sys
+import threading
+
+import http_client
+
+
+# Plantilla con {z}/{x}/{y}; si la fuente pide una llave, va dentro de la URL
+MAPA_TILE_URL = os.getenv("MAPA_TILE_URL", "")
+MAPA_TILE_ATRIBUCION = os.getenv("MAPA_TILE_ATRIBUCION", "© OpenStreetMap")
+MAPA_TILES_DIR = os.getenv("MAPA_TILES_DIR", "/tmp/ecobus_tiles")
+MAPA_TILES_SEED_DIR = os.getenv(
+    "MAPA_TILES_SEED_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tiles")
+)
+MAPA_TILES_MAX_MB = float(os.getenv("MAPA_TILES_MAX_MB", "200"))
+
+TILE_PX = 256
+
+
+def lonlat_a_pixel(lat: float, lon: float, z: int) -> tuple:
+    """
+    Coordenada -> pixel global (Web Mercator) en el zoom z.
+    """
+    lat = max(-85.0511, min(85.0511, lat))
+    n = TILE_PX * (2 ** z)
+    x = (lon + 180.0) / 360.0 * n
+    s = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * n
+    return x, y
+
+
+class CacheTiles:
+    """
+    Tiles en disco como {dir}/{z}/{x}/{y}.png. La antigüedad para el LRU es
+    el mtime (se actualiza en cada lectura). El tamaño total se lleva en
+    memoria y se recalcula escaneando el directorio al podar.
+    """
+
+    def __init__(self, directorio: str = MAPA_TILES_DIR, seed_dir: str | None = MAPA_TILES_SEED_DIR,
+                 max_bytes: int = int(MAPA_TILES_MAX_MB * 1024 * 1024), url: str = MAPA_TILE_URL):
+        self.directorio = directorio
+        self.seed_dir = seed_dir if seed_dir and os.path.isdir(seed_dir) else None
+        self.max_bytes = max_bytes
+        self.url = url
+        self._lock = threading.Lock()
+
+        self.hits_seed = 0
+        self.hits_cache = 0
+        self.descargas = 0
+        self.evictions = 0
+
+        os.makedirs(directorio, exist_ok=True)
+        self._bytes = self._escanear()[1]
+
+    def _ruta(self, base: str, z: int, x: int, y: int) -> str:
+        return os.path.join(base, str(z), str(x), f"{y}.png")
+
+    def _escanear(self):
+        archivos, total = [], 0
+        for raiz, _, nombres in os.walk(self.directorio):
+            for n in nombres:
+                if not n.endswith(".png"):
+                    continue
+                p = os.path.join(raiz, n)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                archivos.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        return archivos, total
+
+    def _podar(self):
+        archivos, total = self._escanear()
+        objetivo = self.max_bytes * 0.9  # margen para no podar en cada escritura
+        archivos.sort()
+        for _, tam, p in archivos:
+            if total <= objetivo:
+                break
+            try:
+                os.remove(p)
+                total -= tam
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+        self._bytes = total
+
+    def get(self, z: int, x: int, y: int) -> bytes:
+        n = 2 ** z
+        x %= n
+        if not 0 <= y < n:
+            raise ValueError(f"Tile fuera de rango: {z}/{x}/{y}")
+
+        if self.seed_dir:
+            p = self._ruta(self.seed_dir, z, x, y)
+            if os.path.exists(p):
+                with open(p, "rb") as f:
+                    self.hits_seed += 1
+                    return f.read()
+
+        p = self._ruta(self.directorio, z, x, y)
+        try:
+            with open(p, "rb") as f:
+                data = f.read()
+            os.utime(p)
+            self.hits_cache += 1
+            return data
+        except FileNotFoundError:
+            pass
+
+        data = self._descargar(z, x, y)
+
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, p)
+
+        with self._lock:
+            self.descargas += 1
+            self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._podar()
+
+        return data
+
+    def _descargar(self, z: int, x: int, y: int) -> bytes:
+        if not self.url:
+            raise Exception("MAPA_TILE_URL no está configurado (tile no está en cache)")
+        url = self.url.format(z=z, x=x, y=y)
+        r = http_client.get(url, timeout=10)
+        if r.status_code != 200:
+            raise Exception(f"Tile {z}/{x}/{y} error {r.status_code}")
+        return r.content
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits_seed + self.hits_cache + self.descargas
+            return {
+                "bytes": self._bytes,
+                "hits_seed": self.hits_seed,
+                "hits_cache": self.hits_cache,
+                "descargas": self.descargas,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits_seed + self.hits_cache) / total, 4) if total else 0.0,
+            }
+
+
+def sembrar(directorio: str, lat_min: float, lon_min: float, lat_max: float, lon_max: float,
+            z_min: int, z_max: int) -> int:
+    """
+    Descarga todos los tiles de la caja en los zoom pedidos a `directorio`,
+    desde MAPA_TILE_URL (ver la advertencia de licencia arriba).
+    """
+    if not MAPA_TILE_URL:
+        raise Exception("MAPA_TILE_URL no está configurado: no hay de dónde sembrar")
+    cache = CacheTiles(directorio, seed_dir=None, max_bytes=1 << 62)
+    n = 0
+    for z in range(z_min, z_max + 1):
+        x0, y0 = (int(v // TILE_PX) for v in lonlat_a_pixel(lat_max, lon_min, z))
+        x1, y1 = (int(v // TILE_PX) for v in lonlat_a_pixel(lat_min, lon_max, z))
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cache.get(z, x, y)
+                n += 1
+        print(f"✅ zoom {z}: {n} tiles")
+    return n
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) != 8 or argv[0] != "sembrar":
+        print("Uso: python tiles.py sembrar <dir> <lat_min> <lon_min> <lat_max> <lon_max> <z_min> <z_max>")
+        return 2
+    d = argv[1]
+    lat_min, lon_min, lat_max, lon_max = (float(v) for v in argv[2:6])
+    n = sembrar(d, lat_min, lon_min, lat_max, lon_max, int(argv[6]), int(argv[7]))
+    print(f"✅ {n} tiles en {d}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,174 @@
+# worker_pool.py
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+
+WORKER_POOL_MODE = os.getenv("WORKER_POOL_MODE", "thread")  # thread | process
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "4"))
+WORKER_QUEUE_MAX = int(os.getenv("WORKER_QUEUE_MAX", "500"))
+
+# Cuántas latencias recientes se guardan para calcular percentiles
+_LATENCIAS_MAX = 1000
+
+
+class PoolLleno(Exception):
+    pass
+
+
+class WorkerPool:
+    """
+    Pool acotado de workers para procesar mensajes fuera del request HTTP.
+
+    - Cada trabajo tiene una "clave" (ej: wa_id). Todos los trabajos de una
+      misma clave caen en el mismo shard, así los mensajes de un usuario se
+      procesan en orden y nunca en paralelo entre sí.
+    - mode="thread": el shard ejecuta el trabajo en su propio hilo.
+    - mode="process": el shard delega el trabajo a un ProcessPoolExecutor y
+      espera el resultado (la función y sus args deben ser picklables). Los
+      hijos se crean con "spawn", no fork: importan todo de nuevo y abren sus
+      propias conexiones (SQLite, hilos de los pools, locks) en vez de heredar
+      copias a medio usar del padre. El estado que el trabajo modifique tiene
+      que vivir fuera del proceso (ej: sesiones en SQLite/Redis).
+    """
+
+    def __init__(self, size: int = WORKER_POOL_SIZE, mode: str = WORKER_POOL_MODE,
+                 queue_max: int = WORKER_QUEUE_MAX, initializer=None, initargs: tuple = ()):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"WORKER_POOL_MODE inválido: {mode}")
+
+        self.size = max(1, int(size))
+        self.mode = mode
+        self.queue_max = max(1, int(queue_max))
+
+        # La capacidad total se reparte entre shards
+        por_shard = max(1, self.queue_max // self.size)
+        self._colas = [queue.Queue(maxsize=por_shard) for _ in range(self.size)]
+
+        self._procesos = None
+        if mode == "process":
+            self._procesos = ProcessPoolExecutor(
+                max_workers=self.size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+                initargs=initargs,
+            )
+
+        self._lock = threading.Lock()
+        self._latencias = []
+        self._esperas = []
+        self._ok = 0
+        self._errores = 0
+        self._rechazados = 0
+        self._en_curso = 0
+
+        self._hilos = []
+        for i, cola in enumerate(self._colas):
+            t = threading.Thread(target=self._loop, args=(cola,), name=f"worker-{i}", daemon=True)
+            t.start()
+            self._hilos.append(t)
+
+    def _shard(self, clave) -> queue.Queue:
+        idx = zlib.crc32(str(clave).encode("utf-8")) % self.size
+        return self._colas[idx]
+
+    def enviar(self, clave, fn, *args, **kwargs):
+        """
+        Encola fn(*args, **kwargs). Lanza PoolLleno si el shard está saturado.
+        """
+        trabajo = (time.perf_counter(), fn, args, kwargs)
+        try:
+            self._shard(clave).put_nowait(trabajo)
+        except queue.Full:
+            with self._lock:
+                self._rechazados += 1
+            raise PoolLleno(f"Cola llena para clave {clave}")
+
+    def _loop(self, cola: queue.Queue):
+        while True:
+            trabajo = cola.get()
+            if trabajo is None:
+                cola.task_done()
+                return
+
+            t_encolado, fn, args, kwargs = trabajo
+            t0 = time.perf_counter()
+
+            with self._lock:
+                self._en_curso += 1
+
+            ok = True
+            try:
+                if self._procesos is not None:
+                    self._procesos.submit(fn, *args, **kwargs).result()
+                else:
+                    fn(*args, **kwargs)
+            except Exception as e:
+                ok = False
+                print("❌ Error en worker:", getattr(fn, "__name__", fn), repr(e))
+
+            t1 = time.perf_counter()
+
+            with self._lock:
+                self._en_curso -= 1
+                if ok:
+                    self._ok += 1
+                else:
+                    self._errores += 1
+                self._esperas.append(t0 - t_encolado)
+                self._latencias.append(t1 - t0)
+                if len(self._latencias) > _LATENCIAS_MAX:
+                    del self._latencias[:-_LATENCIAS_MAX]
+                    del self._esperas[:-_LATENCIAS_MAX]
+
+            cola.task_done()
+
+    def profundidad(self) -> int:
+        return sum(c.qsize() for c in self._colas)
+
+    def esperar(self):
+        """
+        Bloquea hasta que todas las colas estén vacías (útil en scripts/pruebas).
+        """
+        for c in self._colas:
+            c.join()
+
+    def cerrar(self):
+        for c in self._colas:
+            c.put(None)
+        for t in self._hilos:
+            t.join()
+        if self._procesos is not None:
+            self._procesos.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            esperas = sorted(self._esperas)
+            return {
+                "modo": self.mode,
+                "workers": self.size,
+                "cola_profundidad": self.profundidad(),
+                "cola_max": self.queue_max,
+                "en_curso": self._en_curso,
+                "ok": self._ok,
+                "errores": self._errores,
+                "rechazados": self._rechazados,
+                "latencia_ms": _percentiles(latencias),
+                "espera_cola_ms": _percentiles(esperas),
+            }
+
+
+def _percentiles(valores: list[float]) -> dict:
+    if not valores:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+
+    def p(q):
+        return round(valores[min(len(valores) - 1, int(q * len(valores)))] * 1000, 2)
+
+    return {"p50": p(0.50), "p95": p(0.95), "max": round(valores[-1] * 1000, 2)}